@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Compare specmcp_json backends on real or synthetic specs
+
+Usage:
+    python bench_json.py specs/*.json
+    python bench_json.py --paths 20000      # synthetic spec with 20k paths
+"""
+
+import argparse
+import importlib.util
+import os
+import statistics
+import time
+from pathlib import Path
+
+from bench_specmcp import synthetic_spec
+
+BACKENDS = ("stdlib", "orjson")
+
+def load_backend(backend: str):
+    """A fresh copy of specmcp_json loaded with SPECMCP_JSON_BACKEND=backend"""
+    previous = os.environ.get("SPECMCP_JSON_BACKEND")
+    os.environ["SPECMCP_JSON_BACKEND"] = backend
+    try:
+        spec = importlib.util.find_spec("specmcp_json")
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    finally:
+        if previous is None:
+            del os.environ["SPECMCP_JSON_BACKEND"]
+        else:
+            os.environ["SPECMCP_JSON_BACKEND"] = previous
+    return module
+
+def median_of(func, repeat: int) -> float:
+    """Median wall time of func over repeat runs, in milliseconds"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+def bench(name: str, text: str, repeat: int, layers: dict) -> None:
+    """Time specmcp_json's operations under each backend, as the tools call them"""
+    data = text.encode()
+    spec = layers["stdlib"].loads(data)
+    # A 20-digit integer sends orjson-backed loads() to the stdlib fallback
+    big = data.rstrip()[:-1] + b', "x-big": 18446744073709551616}'
+    rows = [
+        ("loads", lambda layer: layer.loads(data)),
+        ("loads big ints", lambda layer: layer.loads(big)),
+        ("dumpb", lambda layer: layer.dumpb(spec)),
+        ("dumpb indent=2", lambda layer: layer.dumpb(spec, indent=2)),
+        ("dumpb sort_keys", lambda layer: layer.dumpb(spec, sort_keys=True)),
+        ("dumps", lambda layer: layer.dumps(spec)),
+    ]
+    
+    print(f"\n📄 {name} ({len(data) / 1024 / 1024:.1f} MB)")
+    print(f"   {'operation':<18} {'stdlib':>10} {'orjson':>10} {'speedup':>8}")
+    for label, operation in rows:
+        stdlib_ms = median_of(lambda: operation(layers["stdlib"]), repeat)
+        if layers["orjson"].BACKEND != "orjson":
+            print(f"   {label:<18} {stdlib_ms:>8.1f}ms {'n/a':>10} {'':>8}")
+            continue
+        fast_ms = median_of(lambda: operation(layers["orjson"]), repeat)
+        print(f"   {label:<18} {stdlib_ms:>8.1f}ms {fast_ms:>8.1f}ms {stdlib_ms / fast_ms:>7.1f}x")
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare JSON backends on specs")
+    parser.add_argument("specs", nargs="*", help="Spec files to benchmark")
+    parser.add_argument("--paths", type=int, default=5000, help="Paths in the synthetic spec when no files are given")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per measurement (median reported)")
+    args = parser.parse_args()
+    
+    layers = {backend: load_backend(backend) for backend in BACKENDS}
+    print("⏱️  JSON backend benchmark (specmcp_json under each SPECMCP_JSON_BACKEND)")
+    print("=" * 70)
+    if layers["orjson"].BACKEND != "orjson":
+        print("orjson not installed - showing stdlib only (pip install orjson)")
+    
+    if args.specs:
+        for spec_file in args.specs:
+            bench(spec_file, Path(spec_file).read_text(), args.repeat, layers)
+    else:
+        text = layers["stdlib"].dumps(synthetic_spec(args.paths))
+        bench(f"synthetic, {args.paths} paths", text, args.repeat, layers)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,507 @@
+#!/usr/bin/env python3
+"""
+Benchmark SpecMCP tools on synthetic specs and constitutions
+
+Each tool is timed called directly and through the in-memory FastMCP Client,
+and the cold import of each module in a fresh interpreter (-X importtime).
+The report shows throughput, p50/p99 latency and peak RSS per case; results
+can be stored as a baseline and later runs compared against it.
+
+Usage:
+    python bench_specmcp.py
+    python bench_specmcp.py --paths 100,10000,100000 --constitution-kb 1,1024
+    python bench_specmcp.py --save-baseline bench_baseline.json
+    python bench_specmcp.py --baseline bench_baseline.json --tolerance 0.25
+"""
+
+import argparse
+import asyncio
+import itertools
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import specmcp_json
+import specmcp_core
+
+# The server and fastmcp are imported when a benchmark runs, so scripts that
+# only borrow the synthetic inputs (test_specmcp.py, load_specmcp.py) don't
+# pay the server's cold import
+
+# ============================================================================
+# SYNTHETIC INPUTS
+# ============================================================================
+
+def synthetic_spec(paths: int, depth: int = 4, refs: int = 3, seed: int = 0) -> dict:
+    """
+    An OpenAPI document with `paths` path items, schemas nested `depth`
+    levels deep and `refs` $refs from each operation into the components
+    """
+    rng = random.Random(seed)
+    schema_count = max(10, paths // 10)
+    
+    def nested(level: int) -> dict:
+        if level == 0:
+            return {"type": "string", "maxLength": 255}
+        return {
+            "type": "object",
+            "properties": {
+                f"field{i}": nested(level - 1) if i == 0 else {"type": rng.choice(["string", "integer", "boolean"])}
+                for i in range(3)
+            }
+        }
+    
+    schemas = {
+        f"Model{i}": {
+            "type": "object",
+            "properties": {
+                "id": {"type": "string", "format": "uuid"},
+                "payload": nested(depth),
+                # Chains of refs between components, as in real models
+                "parent": {"$ref": f"#/components/schemas/Model{(i + 1) % schema_count}"}
+            }
+        }
+        for i in range(schema_count)
+    }
+    schemas["Error"] = {
+        "type": "object",
+        "properties": {"error": {"type": "string"}, "message": {"type": "string"}}
+    }
+    
+    def operation(i: int, method: str) -> dict:
+        targets = [f"#/components/schemas/Model{rng.randrange(schema_count)}" for _ in range(refs)]
+        op = {
+            "summary": f"{method.upper()} resource {i}",
+            "operationId": f"{method}Resource{i}",
+            "security": [{"bearerAuth": []}],
+            "responses": {
+                "200": {
+                    "description": "OK",
+                    "content": {"application/json": {"schema": {"allOf": [{"$ref": t} for t in targets[1:]] or {"type": "object"}}}}
+                },
+                "401": {
+                    "description": "Unauthorized",
+                    "content": {"application/json": {"schema": {"$ref": "#/components/schemas/Error"}}}
+                }
+            }
+        }
+        if method == "post":
+            op["requestBody"] = {
+                "required": True,
+                "content": {"application/json": {"schema": {"$ref": targets[0]}}}
+            }
+        return op
+    
+    spec_paths = {"/health": {"get": {"summary": "Health check", "responses": {"200": {"description": "OK"}}}}}
+    for i in range(paths - 1):
+        spec_paths[f"/v1/resources{i}/{{id}}"] = {"get": operation(i, "get"), "post": operation(i, "post")}
+    
+    return {
+        "openapi": "3.1.0",
+        "info": {"title": "Synthetic API v1", "version": "1.0.0", "description": "Built with FastAPI"},
+        "servers": [{"url": "https://api.example.com/v1"}],
+        "paths": spec_paths,
+        "components": {
+            "schemas": schemas,
+            "securitySchemes": {"bearerAuth": {"type": "http", "scheme": "bearer", "bearerFormat": "JWT"}}
+        }
+    }
+
+def synthetic_constitution(size_kb: int, seed: int = 0) -> str:
+    """A constitution of roughly size_kb kilobytes, padded with principles and notes"""
+    rng = random.Random(seed)
+    words = [
+        "service", "endpoint", "latency", "PostgreSQL", "cache", "Docker", "review",
+        "contract", "schema", "REST", "JWT", "owner", "budget", "rollout", "metrics"
+    ]
+    lines = [
+        "# Project Constitution",
+        "",
+        "## Tech Stack",
+        "",
+        "- **Language**: Python 3.11",
+        "- **Framework**: FastAPI",
+        "- **Database**: PostgreSQL",
+        "- **Deployment**: Docker",
+        "",
+        "## Architectural Patterns",
+        "",
+        "- **Architecture**: Microservices",
+        "- **API Style**: REST",
+        "- **Authentication**: JWT",
+        "",
+        "## Code Standards",
+        "",
+        "- All endpoints require authentication",
+        "- 100% test coverage required",
+        "- Type hints mandatory",
+        "",
+        "## Non-Negotiable Principles",
+        ""
+    ]
+    size = sum(len(line) + 1 for line in lines)
+    target = size_kb * 1024
+    i = 0
+    while size < target:
+        if i % 20 == 0:
+            line = f"\n## Notes {i // 20}\n"
+        elif i % 2:
+            line = f"- Principle {i}: " + " ".join(rng.choice(words) for _ in range(10))
+        else:
+            line = " ".join(rng.choice(words) for _ in range(16)) + "."
+        lines.append(line)
+        size += len(line) + 1
+        i += 1
+    return "\n".join(lines) + "\n"
+
+# ============================================================================
+# MEASUREMENT
+# ============================================================================
+
+def reset_peak_rss() -> None:
+    """Reset the kernel's RSS high-water mark (Linux); elsewhere peaks only grow"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process in MB"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS, kilobytes elsewhere
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+def percentile(samples: list, pct: float) -> float:
+    """Nearest-rank percentile of samples"""
+    ordered = sorted(samples)
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+def summarize(times: list, nbytes: int, rss: float) -> dict:
+    """Latency and throughput stats for one case, times in milliseconds"""
+    total = sum(times) / 1000
+    return {
+        "runs": len(times),
+        "first_ms": times[0],
+        "p50_ms": percentile(times, 50),
+        "p99_ms": percentile(times, 99),
+        "ops_per_s": len(times) / total if total else 0.0,
+        "mb_per_s": nbytes * len(times) / 1024 / 1024 / total if total and nbytes else 0.0,
+        "peak_rss_mb": rss
+    }
+
+def _check(result, case: str) -> None:
+    """Abort the benchmark if a tool reported failure - timing errors is pointless"""
+    data = getattr(result, "data", result)
+    if isinstance(data, str):
+        data = specmcp_json.loads(data)
+    if isinstance(data, dict) and data.get("success") is False:
+        raise RuntimeError(f"{case}: {data.get('error')}")
+
+def run_direct(case: dict, iterations: int, budget: float) -> dict:
+    """Time a case by calling the Python function"""
+    reset_peak_rss()
+    times = []
+    deadline = time.perf_counter() + budget
+    while len(times) < iterations and (len(times) < 3 or time.perf_counter() < deadline):
+        if case.get("setup"):
+            case["setup"]()
+        start = time.perf_counter()
+        result = case["direct"]()
+        times.append((time.perf_counter() - start) * 1000)
+        _check(result, case["name"])
+    return summarize(times, case.get("bytes", 0), peak_rss_mb())
+
+async def run_client(client, case: dict, iterations: int, budget: float) -> dict:
+    """Time a case as an MCP tool call through the in-memory client"""
+    reset_peak_rss()
+    times = []
+    deadline = time.perf_counter() + budget
+    while len(times) < iterations and (len(times) < 3 or time.perf_counter() < deadline):
+        if case.get("setup"):
+            case["setup"]()
+        start = time.perf_counter()
+        result = await client.call_tool(case["tool"], case["args"])
+        times.append((time.perf_counter() - start) * 1000)
+        _check(result, case["name"])
+    return summarize(times, case.get("bytes", 0), peak_rss_mb())
+
+# ============================================================================
+# STARTUP
+# ============================================================================
+
+# Modules whose cold import is timed; scripts and the CLI load only the core
+STARTUP_MODULES = ("specmcp_core", "specmcp_server")
+
+def cold_import(module: str) -> tuple:
+    """
+    Import a module in a fresh interpreter under -X importtime
+    
+    Returns the module's cumulative import time in milliseconds and the
+    names of every module the import loaded.
+    """
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=Path(__file__).resolve().parent,
+        capture_output=True,
+        text=True,
+        check=True
+    )
+    elapsed = None
+    loaded = set()
+    for line in completed.stderr.splitlines():
+        fields = line.split("|")
+        if len(fields) != 3 or not fields[1].strip().isdigit():
+            continue
+        name = fields[2].strip()
+        loaded.add(name)
+        if name == module:
+            elapsed = int(fields[1]) / 1000
+    if elapsed is None:
+        raise RuntimeError(f"-X importtime reported nothing for {module}")
+    return elapsed, loaded
+
+def run_startup(module: str, runs: int) -> dict:
+    """Time the cold import of a module over several fresh interpreters"""
+    times = [cold_import(module)[0] for _ in range(runs)]
+    return summarize(times, 0, 0.0)
+
+# ============================================================================
+# CASES
+# ============================================================================
+
+def build_cases(workdir: Path, paths: list, constitution_kb: list) -> list:
+    """Write the synthetic inputs and describe every case to time"""
+    import specmcp_server
+    
+    cases = []
+    
+    for size_kb in constitution_kb:
+        path = workdir / f"constitution-{size_kb}kb.md"
+        path.write_text(synthetic_constitution(size_kb))
+        nbytes = path.stat().st_size
+        cases.append({
+            "name": f"parse_constitution cold {size_kb}KB",
+            "tool": "parse_constitution",
+            "args": {"path": str(path)},
+            "direct": lambda path=path: specmcp_core._parse_constitution_internal(str(path)),
+            "setup": specmcp_core.invalidate_constitution_cache,
+            "bytes": nbytes
+        })
+        cases.append({
+            "name": f"parse_constitution warm {size_kb}KB",
+            "tool": "parse_constitution",
+            "args": {"path": str(path)},
+            "direct": lambda path=path: specmcp_core._parse_constitution_internal(str(path)),
+            "bytes": nbytes
+        })
+    
+    constitution = workdir / f"constitution-{constitution_kb[0]}kb.md"
+    requirements = "\n".join([
+        "User authentication API with registration, login, logout, password reset and JWT tokens",
+        "POST /auth/register - Register a new user (public)",
+        "POST /auth/login - Log in (public)",
+        "POST /auth/logout - Log out (requires authentication)",
+        "GET /users/{id} - Get a user",
+        "PATCH /users/{id} - Update a user",
+        "DELETE /users/{id} - Delete a user"
+    ])
+    # Generated specs are memoized by requirements, so the cold case makes
+    # every run's requirements unique and the memoized case repeats one
+    cold_args = {"constitution_path": str(constitution), "title": "Bench API", "include_spec": False}
+    memoized_args = {**cold_args, "requirements": requirements}
+    runs = itertools.count()
+    
+    def vary_requirements() -> None:
+        cold_args["requirements"] = f"{requirements}\nGET /runs/r{next(runs)} - Run marker"
+    
+    cases.append({
+        "name": "generate_openapi_spec cold",
+        "tool": "generate_openapi_spec",
+        "args": cold_args,
+        "direct": lambda: specmcp_server.generate_openapi_spec(**cold_args),
+        "setup": vary_requirements
+    })
+    cases.append({
+        "name": "generate_openapi_spec memoized",
+        "tool": "generate_openapi_spec",
+        "args": memoized_args,
+        "direct": lambda: specmcp_server.generate_openapi_spec(**memoized_args)
+    })
+    
+    for count in paths:
+        spec = synthetic_spec(count)
+        spec_path = workdir / f"spec-{count}.json"
+        spec_path.write_bytes(specmcp_json.dumpb(spec))
+        nbytes = spec_path.stat().st_size
+        
+        # Verification reuses the results of every path item and component it
+        # has seen, so time it cold (caches dropped), after a one-path-item
+        # edit, and cached (the same spec again)
+        verify_args = {"spec_path": str(spec_path), "constitution_path": str(constitution)}
+        edited_path = workdir / f"spec-{count}-edited.json"
+        edited_args = {**verify_args, "spec_path": str(edited_path)}
+        edited = {**spec, "paths": dict(spec["paths"])}
+        edits = itertools.count()
+        
+        def edit_one_path_item(edited=edited, edited_path=edited_path, edits=edits) -> None:
+            edited["paths"]["/health"] = {
+                "get": {"summary": f"Health check, edit {next(edits)}", "responses": {"200": {"description": "OK"}}}
+            }
+            edited_path.write_bytes(specmcp_json.dumpb(edited))
+        
+        for variant, args, setup in (
+            ("cold", verify_args, specmcp_core.invalidate_subtree_caches),
+            ("edited", edited_args, edit_one_path_item),
+            ("cached", verify_args, None)
+        ):
+            cases.append({
+                "name": f"verify_spec_compliance {variant} {count} paths",
+                "tool": "verify_spec_compliance",
+                "args": args,
+                "direct": lambda args=args: specmcp_server.verify_spec_compliance(**args),
+                "setup": setup,
+                "bytes": nbytes
+            })
+        
+        # Remove the previous output so every run really writes
+        output = workdir / f"out-{count}.json"
+        save_args = {"spec_handle": specmcp_core.spec_store_put(spec), "output_path": str(output)}
+        cases.append({
+            "name": f"save_spec_to_file {count} paths",
+            "tool": "save_spec_to_file",
+            "args": save_args,
+            "direct": lambda args=save_args: specmcp_server.save_spec_to_file(**args),
+            "setup": lambda output=output: output.unlink(missing_ok=True),
+            "bytes": nbytes
+        })
+        del spec
+    return cases
+
+# ============================================================================
+# REPORTING AND BASELINES
+# ============================================================================
+
+def print_table(results: dict) -> None:
+    print(f"   {'case':<46} {'runs':>5} {'first':>9} {'p50':>9} {'p99':>9} {'ops/s':>8} {'MB/s':>7} {'peak RSS':>9}")
+    for key, r in results.items():
+        mb_per_s = f"{r['mb_per_s']:.1f}" if r["mb_per_s"] else "-"
+        rss = f"{r['peak_rss_mb']:.0f}MB" if r["peak_rss_mb"] else "-"
+        print(
+            f"   {key:<46} {r['runs']:>5} {r['first_ms']:>7.1f}ms {r['p50_ms']:>7.1f}ms "
+            f"{r['p99_ms']:>7.1f}ms {r['ops_per_s']:>8.1f} {mb_per_s:>7} {rss:>9}"
+        )
+
+def compare(results: dict, baseline: dict, tolerance: float, min_delta_ms: float) -> list:
+    """Print p50 changes against a baseline; returns the cases that regressed"""
+    regressions = []
+    print(f"\n📉 Compared with baseline (tolerance {tolerance:.0%})")
+    for key, r in results.items():
+        base = baseline["results"].get(key)
+        if base is None:
+            print(f"   {key:<46} new")
+            continue
+        change = r["p50_ms"] / base["p50_ms"] - 1 if base["p50_ms"] else 0.0
+        # Sub-millisecond cases jitter by more than any sane tolerance
+        regressed = change > tolerance and r["p50_ms"] - base["p50_ms"] > min_delta_ms
+        marker = "❌" if regressed else "✅"
+        if regressed:
+            regressions.append(key)
+        print(f"   {marker} {key:<44} {base['p50_ms']:>8.1f}ms -> {r['p50_ms']:>8.1f}ms ({change:+.0%})")
+    return regressions
+
+def environment() -> dict:
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "json_backend": specmcp_json.BACKEND
+    }
+
+async def run(args) -> dict:
+    from fastmcp import Client
+    
+    import specmcp_server
+    
+    paths = [int(p) for p in args.paths.split(",")]
+    constitution_kb = [int(k) for k in args.constitution_kb.split(",")]
+    results = {}
+    
+    for module in STARTUP_MODULES if args.startup_runs else ():
+        key = f"import {module} [startup]"
+        results[key] = run_startup(module, args.startup_runs)
+        print(f"   ⏱️  {key:<46} p50 {results[key]['p50_ms']:.1f}ms")
+    
+    with tempfile.TemporaryDirectory(prefix="specmcp-bench-") as tmp:
+        print("🧪 Generating synthetic inputs...")
+        cases = build_cases(Path(tmp), paths, constitution_kb)
+        
+        modes = [m for m in ("direct", "client") if args.mode in (m, "both")]
+        async with Client(specmcp_server.mcp) as client:
+            for case in cases:
+                for mode in modes:
+                    key = f"{case['name']} [{mode}]"
+                    if mode == "direct":
+                        results[key] = run_direct(case, args.iterations, args.time_budget)
+                    else:
+                        results[key] = await run_client(client, case, args.iterations, args.time_budget)
+                    print(f"   ⏱️  {key:<46} p50 {results[key]['p50_ms']:.1f}ms")
+    return results
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark SpecMCP tools")
+    parser.add_argument("--paths", default="100,1000,10000", help="Comma-separated synthetic spec sizes (paths)")
+    parser.add_argument("--constitution-kb", default="1,64,1024", help="Comma-separated synthetic constitution sizes (KB)")
+    parser.add_argument("--iterations", type=int, default=20, help="Runs per case")
+    parser.add_argument("--time-budget", type=float, default=10.0, help="Seconds per case before stopping early (after 3 runs)")
+    parser.add_argument("--mode", choices=["direct", "client", "both"], default="both", help="Call tools directly, through the MCP client, or both")
+    parser.add_argument("--startup-runs", type=int, default=5, help="Fresh interpreters per cold-import case (0 to skip)")
+    parser.add_argument("--baseline", help="Baseline JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed p50 slowdown before a case counts as regressed")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0, help="Ignore p50 slowdowns smaller than this many milliseconds")
+    parser.add_argument("--save-baseline", help="Write this run's results as a baseline JSON")
+    args = parser.parse_args(argv)
+    
+    print("⏱️  SpecMCP benchmark")
+    print("=" * 70)
+    results = asyncio.run(run(args))
+    
+    print()
+    print_table(results)
+    
+    if args.save_baseline:
+        Path(args.save_baseline).write_bytes(
+            specmcp_json.dumpb({"environment": environment(), "results": results}, indent=2)
+        )
+        print(f"\n💾 Baseline saved to {args.save_baseline}")
+    
+    if args.baseline:
+        baseline = specmcp_json.loads(Path(args.baseline).read_bytes())
+        if baseline.get("environment") != environment():
+            print("⚠️  Baseline was recorded in a different environment; compare with care")
+        regressions = compare(results, baseline, args.tolerance, args.min_delta_ms)
+        if regressions:
+            print(f"\n❌ {len(regressions)} case(s) regressed")
+            return 1
+        print("\n✅ No regressions")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,17 +3,27 @@
 Generate OpenAPI spec for Authentication API using SpecMCP tools
 """
 
-import json
-from pathlib import Path
-
-# Import the SpecMCP server functions directly
-from specmcp_server import (
+# Import the SpecMCP operations directly (no MCP server needed)
+from specmcp_core import (
     parse_constitution,
     generate_openapi_spec,
     verify_spec_compliance,
     save_spec_to_file
 )
 
+# The shipped example: sign-up, login and password reset must work without a token
+REQUIREMENTS = """User authentication API with registration, login, logout, profile management, and password reset. 
+Include all CRUD operations for user management.
+
+Endpoints:
+- POST /auth/register - Register new user with email and password (public)
+- POST /auth/login - Login and get JWT token (public)
+- POST /auth/logout - Logout (requires authentication)
+- GET /auth/me - Get current user profile (requires authentication)
+- POST /auth/forgot-password - Request password reset with email (public)
+- POST /auth/reset-password - Reset password with token (public)
+- GET /health - Health check endpoint (no auth required)"""
+
 def main():
     print("🚀 Generating OpenAPI Specification with SpecMCP")
     print("=" * 70)
@@ -32,20 +42,8 @@ def main():
     # Step 2: Generate OpenAPI Spec
     print("\n📝 Step 2: Generating OpenAPI 3.1 specification...")
     
-    requirements = """User authentication API with registration, login, logout, profile management, and password reset. 
-    Include all CRUD operations for user management.
-    
-    Endpoints:
-    - POST /auth/register - Register new user with email and password
-    - POST /auth/login - Login and get JWT token
-    - POST /auth/logout - Logout (requires authentication)
-    - GET /auth/me - Get current user profile (requires authentication)
-    - POST /auth/forgot-password - Request password reset with email
-    - POST /auth/reset-password - Reset password with token
-    - GET /health - Health check endpoint (no auth required)"""
-    
     spec_result = generate_openapi_spec(
-        requirements=requirements,
+        requirements=REQUIREMENTS,
         constitution_path=".specify/constitution.md",
         title="Authentication API"
     )
@@ -138,227 +136,90 @@ def main():
         }
     }
     
-    # Add detailed endpoints
-    spec["paths"]["/auth/register"] = {
-        "post": {
+    # Every endpoint line of the requirements was compiled, with security and
+    # shared error responses; add the bodies the compiler can't infer
+    print(f"   {spec_result['endpoints']} endpoints compiled from the requirements")
+    
+    def json_body(schema: dict) -> dict:
+        return {"content": {"application/json": {"schema": schema}}}
+    
+    def schema_ref(name: str) -> dict:
+        return {"$ref": f"#/components/schemas/{name}"}
+    
+    def error(description: str) -> dict:
+        return {"description": description, **json_body(schema_ref("Error"))}
+    
+    def message_body(example: str) -> dict:
+        return json_body({
+            "type": "object",
+            "properties": {"message": {"type": "string", "example": example}}
+        })
+    
+    endpoint_details = {
+        ("/auth/register", "post"): {
             "summary": "Register a new user",
             "description": "Create a new user account with email and password",
-            "tags": ["Authentication"],
-            "requestBody": {
-                "required": True,
-                "content": {
-                    "application/json": {
-                        "schema": {"$ref": "#/components/schemas/RegisterRequest"}
-                    }
-                }
-            },
-            "responses": {
-                "201": {
-                    "description": "User registered successfully",
-                    "content": {
-                        "application/json": {
-                            "schema": {"$ref": "#/components/schemas/User"}
-                        }
-                    }
-                },
-                "400": {
-                    "description": "Invalid request (missing fields, weak password, etc.)",
-                    "content": {
-                        "application/json": {
-                            "schema": {"$ref": "#/components/schemas/Error"}
-                        }
-                    }
-                },
-                "409": {
-                    "description": "Email or username already exists",
-                    "content": {
-                        "application/json": {
-                            "schema": {"$ref": "#/components/schemas/Error"}
-                        }
-                    }
-                }
+            "request": "RegisterRequest",
+            "success": ("201", {"description": "User registered successfully", **json_body(schema_ref("User"))}),
+            "errors": {
+                "400": error("Invalid request (missing fields, weak password, etc.)"),
+                "409": error("Email or username already exists")
             }
-        }
-    }
-    
-    spec["paths"]["/auth/login"] = {
-        "post": {
+        },
+        ("/auth/login", "post"): {
             "summary": "Login user",
             "description": "Authenticate user and get JWT token",
-            "tags": ["Authentication"],
-            "requestBody": {
-                "required": True,
-                "content": {
-                    "application/json": {
-                        "schema": {"$ref": "#/components/schemas/LoginRequest"}
-                    }
-                }
-            },
-            "responses": {
-                "200": {
-                    "description": "Login successful",
-                    "content": {
-                        "application/json": {
-                            "schema": {"$ref": "#/components/schemas/LoginResponse"}
-                        }
-                    }
-                },
-                "401": {
-                    "description": "Invalid credentials",
-                    "content": {
-                        "application/json": {
-                            "schema": {"$ref": "#/components/schemas/Error"}
-                        }
-                    }
-                }
-            }
-        }
-    }
-    
-    spec["paths"]["/auth/logout"] = {
-        "post": {
+            "request": "LoginRequest",
+            "success": ("200", {"description": "Login successful", **json_body(schema_ref("LoginResponse"))}),
+            "errors": {"401": error("Invalid credentials")}
+        },
+        ("/auth/logout", "post"): {
             "summary": "Logout user",
             "description": "Invalidate user session (requires authentication)",
-            "tags": ["Authentication"],
-            "security": [{"bearerAuth": []}],
-            "responses": {
-                "204": {
-                    "description": "Logout successful"
-                },
-                "401": {
-                    "description": "Unauthorized",
-                    "content": {
-                        "application/json": {
-                            "schema": {"$ref": "#/components/schemas/Error"}
-                        }
-                    }
-                }
-            }
-        }
-    }
-    
-    spec["paths"]["/auth/me"] = {
-        "get": {
+            "success": ("204", {"description": "Logout successful"}),
+            "errors": {"401": error("Unauthorized")}
+        },
+        ("/auth/me", "get"): {
             "summary": "Get current user profile",
             "description": "Retrieve the authenticated user's profile information",
-            "tags": ["Authentication"],
-            "security": [{"bearerAuth": []}],
-            "responses": {
-                "200": {
-                    "description": "User profile retrieved successfully",
-                    "content": {
-                        "application/json": {
-                            "schema": {"$ref": "#/components/schemas/User"}
-                        }
-                    }
-                },
-                "401": {
-                    "description": "Unauthorized - missing or invalid token",
-                    "content": {
-                        "application/json": {
-                            "schema": {"$ref": "#/components/schemas/Error"}
-                        }
-                    }
-                }
-            }
-        }
-    }
-    
-    spec["paths"]["/auth/forgot-password"] = {
-        "post": {
+            "success": ("200", {"description": "User profile retrieved successfully", **json_body(schema_ref("User"))}),
+            "errors": {"401": error("Unauthorized - missing or invalid token")}
+        },
+        ("/auth/forgot-password", "post"): {
             "summary": "Request password reset",
             "description": "Send a password reset token to user's email",
-            "tags": ["Authentication"],
-            "requestBody": {
-                "required": True,
-                "content": {
-                    "application/json": {
-                        "schema": {"$ref": "#/components/schemas/ForgotPasswordRequest"}
-                    }
-                }
-            },
-            "responses": {
-                "200": {
-                    "description": "Password reset email sent",
-                    "content": {
-                        "application/json": {
-                            "schema": {
-                                "type": "object",
-                                "properties": {
-                                    "message": {
-                                        "type": "string",
-                                        "example": "Password reset instructions sent to email"
-                                    }
-                                }
-                            }
-                        }
-                    }
-                },
-                "404": {
-                    "description": "User not found",
-                    "content": {
-                        "application/json": {
-                            "schema": {"$ref": "#/components/schemas/Error"}
-                        }
-                    }
-                }
-            }
-        }
-    }
-    
-    spec["paths"]["/auth/reset-password"] = {
-        "post": {
+            "request": "ForgotPasswordRequest",
+            "success": ("200", {"description": "Password reset email sent", **message_body("Password reset instructions sent to email")}),
+            "errors": {"404": error("User not found")}
+        },
+        ("/auth/reset-password", "post"): {
             "summary": "Reset password",
             "description": "Reset user password using reset token",
-            "tags": ["Authentication"],
-            "requestBody": {
-                "required": True,
-                "content": {
-                    "application/json": {
-                        "schema": {"$ref": "#/components/schemas/ResetPasswordRequest"}
-                    }
-                }
-            },
-            "responses": {
-                "200": {
-                    "description": "Password reset successful",
-                    "content": {
-                        "application/json": {
-                            "schema": {
-                                "type": "object",
-                                "properties": {
-                                    "message": {
-                                        "type": "string",
-                                        "example": "Password has been reset successfully"
-                                    }
-                                }
-                            }
-                        }
-                    }
-                },
-                "400": {
-                    "description": "Invalid or expired token",
-                    "content": {
-                        "application/json": {
-                            "schema": {"$ref": "#/components/schemas/Error"}
-                        }
-                    }
-                }
-            }
+            "request": "ResetPasswordRequest",
+            "success": ("200", {"description": "Password reset successful", **message_body("Password has been reset successfully")}),
+            "errors": {"400": error("Invalid or expired token")}
         }
     }
     
-    # Health endpoint already exists, but let's ensure it's not requiring auth
-    spec["paths"]["/health"]["get"]["security"] = []
+    for (path, method), details in endpoint_details.items():
+        operation = spec["paths"][path][method]
+        operation["summary"] = details["summary"]
+        operation["description"] = details["description"]
+        operation["tags"] = ["Authentication"]
+        if "request" in details:
+            operation["requestBody"] = {"required": True, **json_body(schema_ref(details["request"]))}
+        # The documented responses replace the compiler's generic ones
+        status, success = details["success"]
+        errors = {code: response for code, response in operation["responses"].items() if not code.startswith("2")}
+        operation["responses"] = {status: success, **errors, **details.get("errors", {})}
     
     print("✅ Specification enhanced with detailed schemas")
     
     # Step 3: Save Spec to File
     print("\n💾 Step 3: Saving specification to file...")
     
-    spec_json = json.dumps(spec)
     save_result = save_spec_to_file(
-        spec_content=spec_json,
+        spec=spec,
         output_path="specs/auth-complete.json",
         format="json"
     )
@@ -374,7 +235,7 @@ def main():
     print("\n✔️  Step 4: Verifying compliance with constitution...")
     
     compliance_result = verify_spec_compliance(
-        spec_content=spec_json,
+        spec=spec,
         constitution_path=".specify/constitution.md"
     )
     
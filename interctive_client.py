@@ -2,7 +2,7 @@
 
 from fastmcp import Client
 import asyncio
-import json
+import specmcp_json
 import specmcp_server
 
 async def interactive_shell():
@@ -30,8 +30,8 @@ async def interactive_shell():
                 path = input("Constitution path [.specify/constitution.md]: ").strip() or ".specify/constitution.md"
                 result = await client.call_tool("parse_constitution", {"path": path})
                 if hasattr(result, 'data'):
-                    data = json.loads(result.data) if isinstance(result.data, str) else result.data
-                    print(json.dumps(data, indent=2))
+                    data = specmcp_json.loads(result.data) if isinstance(result.data, str) else result.data
+                    print(specmcp_json.dumps(data, indent=2))
                     
             elif choice == '2':
                 requirements = input("Describe the API: ").strip()
@@ -52,7 +52,7 @@ async def interactive_shell():
                 )
                 
                 if hasattr(result, 'data'):
-                    data = json.loads(result.data) if isinstance(result.data, str) else result.data
+                    data = specmcp_json.loads(result.data) if isinstance(result.data, str) else result.data
                     if data.get('success'):
                         print("✅ Spec generated successfully!")
                         
@@ -60,19 +60,18 @@ async def interactive_shell():
                         save = input("Save to file? (y/n): ").strip().lower()
                         if save == 'y':
                             output = input("Output path [specs/api.json]: ").strip() or "specs/api.json"
-                            spec_json = json.dumps(data['specification'])
                             
                             save_result = await client.call_tool(
                                 "save_spec_to_file",
                                 {
-                                    "spec_content": spec_json,
+                                    "spec": data['specification'],
                                     "output_path": output,
                                     "format": "json"
                                 }
                             )
                             
                             if hasattr(save_result, 'data'):
-                                save_data = json.loads(save_result.data) if isinstance(save_result.data, str) else save_result.data
+                                save_data = specmcp_json.loads(save_result.data) if isinstance(save_result.data, str) else save_result.data
                                 if save_data.get('success'):
                                     print(f"✅ {save_data['message']}")
                     else:
@@ -85,20 +84,22 @@ async def interactive_shell():
                     continue
                     
                 try:
-                    from pathlib import Path
-                    spec_content = Path(spec_file).read_text()
                     const_path = input("Constitution path [.specify/constitution.md]: ").strip() or ".specify/constitution.md"
                     
+                    # The server reads the file itself - no need to ship it over MCP
                     result = await client.call_tool(
                         "verify_spec_compliance",
                         {
-                            "spec_content": spec_content,
+                            "spec_path": spec_file,
                             "constitution_path": const_path
                         }
                     )
                     
                     if hasattr(result, 'data'):
-                        data = json.loads(result.data) if isinstance(result.data, str) else result.data
+                        data = specmcp_json.loads(result.data) if isinstance(result.data, str) else result.data
+                        if not data.get('success'):
+                            print(f"❌ {data.get('error', 'Unknown error')}")
+                            continue
                         print(f"\n{data['summary']}")
                         print(f"Score: {data['compliance_score']}/100")
                         if data.get('violations'):
@@ -106,8 +107,6 @@ async def interactive_shell():
                             for v in data['violations']:
                                 print(f"  [{v['severity'].upper()}] {v['message']}")
                         
-                except FileNotFoundError:
-                    print(f"❌ File not found: {spec_file}")
                 except Exception as e:
                     print(f"❌ Error: {e}")
                     
@@ -120,20 +119,17 @@ async def interactive_shell():
                     continue
                     
                 try:
-                    from pathlib import Path
-                    spec_content = Path(spec_file).read_text()
-                    
                     result = await client.call_tool(
                         "save_spec_to_file",
                         {
-                            "spec_content": spec_content,
+                            "spec_path": spec_file,
                             "output_path": output,
                             "format": "json"
                         }
                     )
                     
                     if hasattr(result, 'data'):
-                        data = json.loads(result.data) if isinstance(result.data, str) else result.data
+                        data = specmcp_json.loads(result.data) if isinstance(result.data, str) else result.data
                         if data.get('success'):
                             print(f"✅ {data['message']}")
                         else:
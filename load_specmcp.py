@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Drive concurrent client sessions against a SpecMCP HTTP server
+
+Start the server first:
+    python specmcp_server.py --transport http --port 8000
+
+Then:
+    python load_specmcp.py --sessions 16 --duration 30
+    python load_specmcp.py --mix verify=4,generate=1,save=1 --paths 2000
+    python load_specmcp.py --url http://build-box:8000/mcp --json > load.json
+
+Each session opens its own fastmcp.Client and calls tools back to back for
+the duration. The report gives throughput, p50/p95/p99/max latency and
+error and rejection counts per workload.
+"""
+
+import argparse
+import asyncio
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from fastmcp import Client
+
+import specmcp_json
+from bench_specmcp import percentile, synthetic_spec
+
+DEFAULT_MIX = "verify=3,generate=1,save=1,parse=1"
+
+def parse_mix(value: str) -> list:
+    """Parse "name=weight,..." into [(name, weight)]"""
+    mix = []
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        name, _, weight = item.partition("=")
+        mix.append((name.strip(), int(weight or 1)))
+    return mix
+
+def build_calls(workdir: Path, constitution: str, paths: int) -> dict:
+    """Tool name and arguments for each workload in the mix"""
+    spec_path = workdir / "load-spec.json"
+    spec_path.write_bytes(specmcp_json.dumpb(synthetic_spec(paths)))
+    return {
+        "parse": lambda session: ("parse_constitution", {"path": constitution}),
+        "generate": lambda session: ("generate_openapi_spec", {
+            "requirements": "User authentication API with registration, login, logout and JWT tokens",
+            "constitution_path": constitution,
+            "title": f"Load API {session}",
+            "include_spec": False
+        }),
+        "verify": lambda session: ("verify_spec_compliance", {
+            "spec_path": str(spec_path),
+            "constitution_path": constitution
+        }),
+        "save": lambda session: ("save_spec_to_file", {
+            "spec_path": str(spec_path),
+            "output_path": str(workdir / f"out-{session}.json")
+        })
+    }
+
+async def run_session(url: str, session: int, calls: dict, mix: list, deadline: float, samples: dict, seed: int) -> None:
+    """One client session calling tools until the deadline"""
+    rng = random.Random(seed + session)
+    names = [name for name, _ in mix]
+    weights = [weight for _, weight in mix]
+    async with Client(url) as client:
+        while time.perf_counter() < deadline:
+            workload = rng.choices(names, weights)[0]
+            tool, args = calls[workload](session)
+            start = time.perf_counter()
+            outcome = "ok"
+            try:
+                result = await client.call_tool(tool, args, raise_on_error=False)
+                data = result.data if isinstance(result.data, dict) else {}
+                if result.is_error or data.get("success") is False:
+                    outcome = "rejected" if "retry_after_seconds" in data else "error"
+            except Exception:
+                outcome = "error"
+            elapsed = (time.perf_counter() - start) * 1000
+            samples.setdefault(workload, []).append((elapsed, outcome))
+
+def summarize(samples: dict, seconds: float) -> dict:
+    """Per-workload and overall throughput and latency"""
+    report = {}
+    everything = []
+    for workload, rows in sorted(samples.items()):
+        everything.extend(rows)
+        report[workload] = _stats(rows, seconds)
+    report["all"] = _stats(everything, seconds)
+    return report
+
+def _stats(rows: list, seconds: float) -> dict:
+    ok = [elapsed for elapsed, outcome in rows if outcome == "ok"]
+    return {
+        "calls": len(rows),
+        "ok": len(ok),
+        "errors": sum(1 for _, outcome in rows if outcome == "error"),
+        "rejected": sum(1 for _, outcome in rows if outcome == "rejected"),
+        "throughput": round(len(ok) / seconds, 2) if seconds else 0.0,
+        "p50_ms": round(percentile(ok, 50), 1) if ok else None,
+        "p95_ms": round(percentile(ok, 95), 1) if ok else None,
+        "p99_ms": round(percentile(ok, 99), 1) if ok else None,
+        "max_ms": round(max(ok), 1) if ok else None
+    }
+
+def print_report(report: dict, args, seconds: float) -> None:
+    print(f"\n📊 {args.sessions} session(s) for {seconds:.1f}s against {args.url}")
+    print(f"   {'workload':<10} {'calls':>7} {'ok/s':>8} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9} {'errors':>7} {'rejected':>9}")
+    for workload, r in report.items():
+        latency = [f"{r[key]:.1f}ms" if r[key] is not None else "-" for key in ("p50_ms", "p95_ms", "p99_ms", "max_ms")]
+        print(
+            f"   {workload:<10} {r['calls']:>7} {r['throughput']:>8.1f} "
+            + " ".join(f"{value:>9}" for value in latency)
+            + f" {r['errors']:>7} {r['rejected']:>9}"
+        )
+
+async def run(args) -> tuple:
+    mix = parse_mix(args.mix)
+    # Under the working directory, which is the server's default --root over HTTP
+    with tempfile.TemporaryDirectory(prefix=".specmcp-load-", dir=args.workdir) as tmp:
+        calls = build_calls(Path(tmp), args.constitution, args.paths)
+        unknown = [name for name, _ in mix if name not in calls]
+        if unknown:
+            raise SystemExit(f"Unknown workload(s): {', '.join(unknown)} (choose from {', '.join(calls)})")
+        
+        samples = {}
+        start = time.perf_counter()
+        deadline = start + args.duration
+        await asyncio.gather(*[
+            run_session(args.url, session, calls, mix, deadline, samples, args.seed)
+            for session in range(args.sessions)
+        ])
+        seconds = time.perf_counter() - start
+    return summarize(samples, seconds), seconds
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Load-test a SpecMCP HTTP server")
+    parser.add_argument("--url", default="http://127.0.0.1:8000/mcp", help="Server endpoint")
+    parser.add_argument("--sessions", type=int, default=8, help="Concurrent client sessions")
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds to run")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Weighted workloads: parse, generate, verify, save")
+    parser.add_argument("--paths", type=int, default=500, help="Paths in the synthetic spec verified and saved")
+    parser.add_argument("--constitution", default=str(Path(".specify/constitution.md").absolute()), help="Constitution the server should read")
+    parser.add_argument("--workdir", default=".", help="Where to write the spec the server reads and saves (inside its --root)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the workload choice")
+    parser.add_argument("--json", action="store_true", help="Print a machine-readable report")
+    args = parser.parse_args(argv)
+    
+    report, seconds = asyncio.run(run(args))
+    if args.json:
+        print(specmcp_json.dumps({"sessions": args.sessions, "seconds": round(seconds, 2), "report": report}, indent=2))
+    else:
+        print_report(report, args, seconds)
+    return 1 if report["all"]["errors"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
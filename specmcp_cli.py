@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+SpecMCP command line interface
+
+Usage:
+    python specmcp_cli.py verify specs/*.json
+    python specmcp_cli.py verify "services/**/openapi.json" -j 8 --min-score 90
+    python specmcp_cli.py generate services.yaml -j 8
+    python specmcp_cli.py verify specs/*.json -c org.md -c domain.md -c .specify/constitution.md
+"""
+
+import argparse
+import hashlib
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Optional
+
+import specmcp_json
+from specmcp_core import (
+    RULESET_VERSION,
+    _expand_spec_paths,
+    _init_batch_worker,
+    _parse_constitution_internal,
+    _verify_spec_file,
+    file_sha256,
+    generate_from_manifest,
+)
+
+DEFAULT_CACHE_DIR = ".specmcp_cache"
+DEFAULT_CONSTITUTION = ".specify/constitution.md"
+
+# Set per worker by _init_verify_worker
+_cache_dir: Optional[Path] = None
+_constitution_hash: str = ""
+
+def _init_verify_worker(constitution: dict, constitution_hash: str, cache_dir: Optional[str]) -> None:
+    """Process pool initializer: constitution plus cache settings"""
+    global _cache_dir, _constitution_hash
+    _init_batch_worker(constitution)
+    _constitution_hash = constitution_hash
+    _cache_dir = Path(cache_dir) if cache_dir else None
+
+def _cache_key(spec_hash: str) -> str:
+    """Cache key from (spec SHA-256, constitution SHA-256, rule-set version)"""
+    return hashlib.sha256(f"{spec_hash}:{_constitution_hash}:{RULESET_VERSION}".encode()).hexdigest()
+
+def _verify_cached(path: str) -> dict:
+    """Verify one spec, reusing a cached verdict when nothing relevant changed"""
+    if _cache_dir is None:
+        return _verify_spec_file(path)
+    
+    try:
+        key = _cache_key(file_sha256(path))
+    except OSError as e:
+        return {"file": path, "success": False, "error": str(e)}
+    
+    cache_file = _cache_dir / key[:2] / f"{key}.json"
+    try:
+        result = specmcp_json.loads(cache_file.read_text())
+        return {**result, "file": path, "cached": True}
+    except (OSError, ValueError):
+        pass
+    
+    result = _verify_spec_file(path)
+    if result.get("success"):
+        try:
+            cache_file.parent.mkdir(parents=True, exist_ok=True)
+            tmp_file = cache_file.with_suffix(f".{os.getpid()}.tmp")
+            tmp_file.write_text(specmcp_json.dumps(result))
+            os.replace(tmp_file, cache_file)
+        except OSError:
+            pass  # A cache we can't write is just a slower run
+    return {**result, "cached": False}
+
+def cmd_verify(args: argparse.Namespace) -> int:
+    """Verify spec files; exit status 1 if any spec is below --min-score"""
+    constitution_result = _parse_constitution_internal(args.constitution or DEFAULT_CONSTITUTION)
+    if not constitution_result.get("success"):
+        print(f"❌ Could not parse constitution: {constitution_result.get('error')}", file=sys.stderr)
+        return 2
+    
+    # Covers every layer of a stack, so editing any of them re-verifies
+    constitution_hash = constitution_result["metadata"]["sha256"]
+    cache_dir = None if args.no_cache else args.cache_dir
+    files, results = _expand_spec_paths(args.specs)
+    workers = max(1, min(args.jobs or os.cpu_count() or 1, len(files)))
+    initargs = (constitution_result["constitution"], constitution_hash, cache_dir)
+    
+    if workers == 1:
+        _init_verify_worker(*initargs)
+        results.extend(_verify_cached(path) for path in files)
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_verify_worker, initargs=initargs) as pool:
+            results.extend(pool.map(_verify_cached, files))
+    
+    failed = [
+        r for r in results
+        if not r.get("success") or r["compliance_score"] < args.min_score
+    ]
+    
+    if args.json:
+        print(specmcp_json.dumps({
+            "min_score": args.min_score,
+            "passed": len(results) - len(failed),
+            "failed": len(failed),
+            "results": results
+        }, indent=2))
+    else:
+        for result in results:
+            name = result["file"]
+            if not result.get("success"):
+                print(f"❌ {name}: {result.get('error')}")
+                continue
+            icon = "✅" if result["compliance_score"] >= args.min_score else "❌"
+            cached = " (cached)" if result.get("cached") else ""
+            print(f"{icon} {name}: {result['compliance_score']}/100 compliance{cached}")
+            for violation in result["violations"]:
+                print(f"   - {violation['message']}")
+        
+        cached_count = sum(1 for r in results if r.get("cached"))
+        print()
+        print(f"{len(results) - len(failed)}/{len(results)} passed (min score {args.min_score}, {cached_count} cached)")
+        if failed:
+            print("BUILD FAILED")
+    
+    return 1 if failed else 0
+
+def cmd_generate(args: argparse.Namespace) -> int:
+    """Generate every service in a manifest; exit status 1 if any fails or is below --min-score"""
+    report = generate_from_manifest(args.manifest, args.constitution, args.jobs, args.report)
+    if "results" not in report:
+        print(f"❌ {report.get('error')}", file=sys.stderr)
+        for detail in report.get("details") or []:
+            print(f"   - {detail}", file=sys.stderr)
+        return 2
+    
+    results = report["results"]
+    failed = [
+        r for r in results
+        if not r.get("success") or r["compliance_score"] < args.min_score
+    ]
+    
+    if args.json:
+        print(specmcp_json.dumps({**report, "min_score": args.min_score, "failed": len(failed)}, indent=2))
+    else:
+        for result in results:
+            name = result["output"]
+            if not result.get("success"):
+                print(f"❌ {name}: {result.get('error')}")
+                continue
+            icon = "✅" if result["compliance_score"] >= args.min_score else "❌"
+            unchanged = " (unchanged)" if result["unchanged"] else ""
+            print(f"{icon} {name}: {result['endpoints']} endpoint(s), {result['compliance_score']}/100 compliance{unchanged}")
+        
+        print()
+        print(report["summary"])
+        print(f"Report: {report['report_path']}")
+        if not report["success"]:
+            print(f"⚠️  {report['error']}")
+        if failed:
+            print("BUILD FAILED")
+    
+    return 1 if failed or not report["success"] else 0
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="specmcp", description="SpecMCP command line tools")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    
+    verify = subparsers.add_parser("verify", help="Verify specs against the constitution")
+    verify.add_argument("specs", nargs="+", help="Spec files or glob patterns")
+    verify.add_argument("-c", "--constitution", action="append", help=f"Path to constitution.md (default: {DEFAULT_CONSTITUTION}); repeat to stack layers, org-wide first")
+    verify.add_argument("-j", "--jobs", type=int, default=None, help="Parallel workers (default: CPU count)")
+    verify.add_argument("--min-score", type=int, default=80, help="Fail below this compliance score (default: 80)")
+    verify.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help=f"Verdict cache directory (default: {DEFAULT_CACHE_DIR})")
+    verify.add_argument("--no-cache", action="store_true", help="Re-verify every spec, ignoring the cache")
+    verify.add_argument("--json", action="store_true", help="Print a JSON report instead of text")
+    verify.set_defaults(func=cmd_verify)
+    
+    generate = subparsers.add_parser("generate", help="Generate, save and verify the services in a manifest")
+    generate.add_argument("manifest", help="JSON/YAML manifest of services")
+    generate.add_argument("-c", "--constitution", action="append", help=f"Path to constitution.md (default: the manifest's, else {DEFAULT_CONSTITUTION}); repeat to stack layers")
+    generate.add_argument("-j", "--jobs", type=int, default=None, help="Parallel workers (default: CPU count)")
+    generate.add_argument("--report", default=None, help="Summary report path (default: <manifest>.report.json)")
+    generate.add_argument("--min-score", type=int, default=80, help="Fail below this compliance score (default: 80)")
+    generate.add_argument("--json", action="store_true", help="Print the JSON report instead of text")
+    generate.set_defaults(func=cmd_generate)
+    
+    return parser
+
+def main(argv: Optional[list] = None) -> int:
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
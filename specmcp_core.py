@@ -0,0 +1,2860 @@
+# specmcp_core.py
+#
+# Constitution parsing, spec generation, verification and file output as plain
+# functions. Nothing here imports an MCP framework, so scripts, the CLI and
+# batch worker processes start fast; specmcp_server.py serves these operations
+# as MCP tools.
+
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional, Union
+import bisect
+import copy
+import glob
+import gzip
+import hashlib
+import io
+import os
+import re
+import threading
+import time
+from contextvars import ContextVar
+from urllib.parse import unquote
+
+import specmcp_json
+
+# ============================================================================
+# CONSTITUTION PARSING
+# ============================================================================
+
+# Parsed constitutions, keyed by resolved path. Each entry remembers the
+# (mtime_ns, size) it was parsed from plus a SHA-256 of the content, so a
+# repeat call costs one stat() and a touched-but-identical file is not reparsed.
+CONSTITUTION_CACHE_MAXSIZE = 32
+_constitution_cache: "OrderedDict[str, dict]" = OrderedDict()
+_constitution_cache_lock = threading.Lock()
+_constitution_cache_stats = {"hits": 0, "misses": 0, "revalidations": 0, "evictions": 0}
+
+def constitution_cache_info() -> dict:
+    """Return hit/miss counters and current size of the constitution cache"""
+    with _constitution_cache_lock:
+        return {
+            **_constitution_cache_stats,
+            "currsize": len(_constitution_cache),
+            "maxsize": CONSTITUTION_CACHE_MAXSIZE
+        }
+
+# Merged constitution stacks, keyed by their layers' paths. Each entry keeps
+# the SHA-256 of every layer it was merged from. Layers go through the cache
+# above, so editing one layer reparses only that file, and its new hash
+# redoes just the merge.
+CONSTITUTION_STACK_CACHE_MAXSIZE = 32
+_constitution_stacks: "OrderedDict[tuple, dict]" = OrderedDict()
+_constitution_stack_stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+def constitution_stack_cache_info() -> dict:
+    """Return hit/miss counters and current size of the merged-stack cache"""
+    with _constitution_cache_lock:
+        return {
+            **_constitution_stack_stats,
+            "currsize": len(_constitution_stacks),
+            "maxsize": CONSTITUTION_STACK_CACHE_MAXSIZE
+        }
+
+# SHA-256 of every constitution dict the caches above handed out, by id(),
+# so compile_rules() can key on content identity without reserializing. Each
+# entry holds its dict, so the id cannot be reused while it is listed.
+_constitution_fingerprints: "OrderedDict[int, tuple]" = OrderedDict()
+
+def _remember_fingerprint(result: dict) -> None:
+    """Record the content hash of a parsed or merged constitution; caller holds the lock"""
+    constitution = result["constitution"]
+    _constitution_fingerprints[id(constitution)] = (constitution, result["metadata"]["sha256"])
+    _constitution_fingerprints.move_to_end(id(constitution))
+    while len(_constitution_fingerprints) > CONSTITUTION_CACHE_MAXSIZE + CONSTITUTION_STACK_CACHE_MAXSIZE:
+        _constitution_fingerprints.popitem(last=False)
+
+def constitution_fingerprint(constitution: dict) -> str:
+    """
+    A content identity for a constitution dict
+    
+    Dicts returned by _parse_constitution_internal() map to their SHA-256
+    (file content, or the layer hashes of a stack) with one lookup; any other
+    dict is serialized.
+    """
+    with _constitution_cache_lock:
+        entry = _constitution_fingerprints.get(id(constitution))
+    if entry is not None and entry[0] is constitution:
+        return entry[1]
+    return specmcp_json.dumps(constitution, sort_keys=True)
+
+def invalidate_constitution_cache(path: Optional[str] = None) -> int:
+    """
+    Drop one cached constitution (or all of them) plus every merged stack
+    that uses it; returns entries removed
+    """
+    with _constitution_cache_lock:
+        if path is None:
+            removed = len(_constitution_cache) + len(_constitution_stacks)
+            _constitution_cache.clear()
+            _constitution_stacks.clear()
+            return removed
+        key = os.path.realpath(path)
+        removed = 1 if _constitution_cache.pop(key, None) is not None else 0
+        for stack in [stack for stack in _constitution_stacks if key in map(os.path.realpath, stack)]:
+            del _constitution_stacks[stack]
+            removed += 1
+        return removed
+
+def _parse_constitution_internal(path: Union[str, list]) -> dict:
+    """
+    Internal helper to parse constitution (not an MCP tool)
+    
+    path is one constitution.md or a stack of them, earliest layer first
+    (org-wide, then domain, then repo). The returned dict is shared - callers
+    must not mutate it.
+    """
+    if isinstance(path, (list, tuple)):
+        if len(path) != 1:
+            return _parse_constitution_stack(path)
+        path = path[0]
+    return _parse_constitution_file(path)
+
+def _parse_constitution_file(path: str) -> dict:
+    """
+    Parse one constitution file
+    
+    Results are served from an LRU cache while the file's mtime and size are
+    unchanged, so a layer shared by many stacks is parsed once per process.
+    """
+    constitution_path = Path(path)
+    
+    try:
+        stat = constitution_path.stat()
+    except FileNotFoundError:
+        return {
+            "success": False,
+            "error": f"Constitution file not found: {path}",
+            "suggestion": "Make sure you're in a SpecKit project directory with .specify/constitution.md"
+        }
+    except OSError as e:
+        return {
+            "success": False,
+            "error": str(e),
+            "suggestion": "Check if the file is readable and properly formatted"
+        }
+    
+    # realpath() is resolve() without the pathlib overhead, on every cached call
+    key = os.path.realpath(constitution_path)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    
+    with _constitution_cache_lock:
+        entry = _constitution_cache.get(key)
+        if entry is not None and entry["signature"] == signature:
+            _constitution_cache.move_to_end(key)
+            _constitution_cache_stats["hits"] += 1
+            return entry["result"]
+    
+    try:
+        content = constitution_path.read_text()
+    except Exception as e:
+        return {
+            "success": False,
+            "error": str(e),
+            "suggestion": "Check if the file is readable and properly formatted"
+        }
+    
+    content_hash = hashlib.sha256(content.encode()).hexdigest()
+    
+    # Same bytes under a new mtime (touch, checkout): keep the parsed result
+    if entry is not None and entry["content_hash"] == content_hash:
+        with _constitution_cache_lock:
+            entry["signature"] = signature
+            _constitution_cache[key] = entry
+            _constitution_cache.move_to_end(key)
+            _constitution_cache_stats["revalidations"] += 1
+        return entry["result"]
+    
+    with _constitution_cache_lock:
+        _constitution_cache_stats["misses"] += 1
+    
+    result = _parse_constitution_content(content, constitution_path, content_hash)
+    
+    if result.get("success"):
+        with _constitution_cache_lock:
+            _constitution_cache[key] = {
+                "signature": signature,
+                "content_hash": content_hash,
+                "result": result
+            }
+            _remember_fingerprint(result)
+            _constitution_cache.move_to_end(key)
+            while len(_constitution_cache) > CONSTITUTION_CACHE_MAXSIZE:
+                _constitution_cache.popitem(last=False)
+                _constitution_cache_stats["evictions"] += 1
+    
+    return result
+
+def _parse_constitution_content(content: str, constitution_path: Path, content_hash: str) -> dict:
+    """Parse already-read constitution text into the structured result"""
+    try:
+        tokens = scan_keywords(content)
+        tech_stack = extract_tech_stack(content, tokens)
+        patterns = extract_patterns(content, tokens)
+        principles = extract_principles(content)
+        standards = extract_standards(content, tokens)
+        
+        return {
+            "success": True,
+            "constitution": {
+                "tech_stack": tech_stack,
+                "patterns": patterns,
+                "principles": principles,
+                "standards": standards
+            },
+            "metadata": {
+                "file_path": str(constitution_path.absolute()),
+                "file_size": len(content),
+                "lines": len(content.split('\n')),
+                "sha256": content_hash
+            },
+            "summary": generate_constitution_summary(tech_stack, patterns, principles)
+        }
+        
+    except Exception as e:
+        return {
+            "success": False,
+            "error": str(e),
+            "suggestion": "Check if the file is readable and properly formatted"
+        }
+
+def _parse_constitution_stack(paths: list) -> dict:
+    """Parse every layer of a constitution stack and merge them, cached per stack"""
+    if not paths:
+        return {
+            "success": False,
+            "error": "Constitution stack is empty",
+            "suggestion": "Pass one or more constitution.md paths, org-wide layer first"
+        }
+    
+    layers = []
+    for path in paths:
+        layer = _parse_constitution_file(path)
+        if not layer.get("success"):
+            return layer
+        layers.append(layer)
+    
+    key = tuple(layer["metadata"]["file_path"] for layer in layers)
+    hashes = tuple(layer["metadata"]["sha256"] for layer in layers)
+    with _constitution_cache_lock:
+        entry = _constitution_stacks.get(key)
+        if entry is not None and entry["hashes"] == hashes:
+            _constitution_stacks.move_to_end(key)
+            _constitution_stack_stats["hits"] += 1
+            return entry["result"]
+        _constitution_stack_stats["misses"] += 1
+    
+    result = merge_constitutions(layers)
+    with _constitution_cache_lock:
+        _constitution_stacks[key] = {"hashes": hashes, "result": result}
+        _remember_fingerprint(result)
+        _constitution_stacks.move_to_end(key)
+        while len(_constitution_stacks) > CONSTITUTION_STACK_CACHE_MAXSIZE:
+            _constitution_stacks.popitem(last=False)
+            _constitution_stack_stats["evictions"] += 1
+    return result
+
+def merge_constitutions(layers: list) -> dict:
+    """
+    Merge parsed constitution layers, earliest first, into one result
+    
+    Later layers override earlier ones field by field: a repo layer naming
+    GraphQL replaces the org's REST but keeps its language and database.
+    Principles accumulate across layers with duplicates dropped.
+    metadata.sources records which layer set each field.
+    """
+    merged = {"tech_stack": {}, "patterns": {}, "principles": [], "standards": {}}
+    sources = {}
+    for layer in layers:
+        constitution = layer["constitution"]
+        origin = layer["metadata"]["file_path"]
+        for section in ("tech_stack", "patterns", "standards"):
+            for field, value in constitution[section].items():
+                merged[section][field] = value
+                sources[f"{section}.{field}"] = origin
+        for principle in constitution["principles"]:
+            if principle not in merged["principles"]:
+                merged["principles"].append(principle)
+    
+    layer_metadata = [layer["metadata"] for layer in layers]
+    summary = generate_constitution_summary(merged["tech_stack"], merged["patterns"], merged["principles"])
+    return {
+        "success": True,
+        "constitution": merged,
+        "metadata": {
+            # The most specific layer; all of them are listed under layers
+            "file_path": layer_metadata[-1]["file_path"],
+            "file_size": sum(meta["file_size"] for meta in layer_metadata),
+            "lines": sum(meta["lines"] for meta in layer_metadata),
+            "sha256": hashlib.sha256(":".join(meta["sha256"] for meta in layer_metadata).encode()).hexdigest(),
+            "layers": layer_metadata,
+            "sources": sources
+        },
+        "summary": f"{summary} | {len(layers)} layers"
+    }
+
+# Every keyword the extractors care about, as one word-bounded alternation.
+# Group names are the tokens the extractors look up, so a single finditer()
+# over the document replaces a dozen `in` scans and no longer lets "go" match
+# "Google" or "rest" match "restrict". Suffixes the old substring scan
+# accepted ("python3.12", "JWTs", "Dockerized", "type hinting") are spelled
+# out per keyword.
+_KEYWORD_PATTERNS = {
+    # Languages
+    "python": r"python\d*(?:\.\d+)*",
+    "typescript": r"typescript",
+    "javascript": r"javascript",
+    "java": r"java",
+    "go": r"go(?:lang)?",
+    # Frameworks
+    "fastapi": r"fastapi",
+    "django": r"django",
+    "express": r"express(?:js)?",
+    "spring": r"spring",
+    # Databases
+    "postgresql": r"postgres(?:ql)?",
+    "mongodb": r"mongodb",
+    "mysql": r"mysql",
+    # Deployment
+    "docker": r"docker\w*",
+    "kubernetes": r"kubernetes",
+    # Architecture
+    "microservices": r"microservices?",
+    "monolith": r"monolith(?:ic)?",
+    # API style
+    "rest": r"rest(?:ful)?",
+    "graphql": r"graphql",
+    "grpc": r"grpc",
+    # Auth
+    "jwt": r"jwts?",
+    "oauth": r"oauth2?",
+    # Standards
+    "test": r"test(?:s|ing|ed)?",
+    "coverage": r"coverage",
+    "type_hint": r"type[ -]hint\w*",
+    "typing": r"typing",
+    "documentation": r"documentation",
+    "docstring": r"docstrings?",
+}
+
+_KEYWORD_RE = re.compile(
+    r"\b(?:" + "|".join(f"(?P<{name}>{pattern})" for name, pattern in _KEYWORD_PATTERNS.items()) + r")\b",
+    re.IGNORECASE
+)
+
+# (field, [(tokens, value), ...]) - first matching choice wins, mirroring
+# the if/elif chains these tables replaced
+_TECH_STACK_RULES = [
+    ("language", [
+        (("python",), "Python"),
+        (("typescript", "javascript"), "TypeScript/JavaScript"),
+        (("java",), "Java"),
+        (("go",), "Go"),
+    ]),
+    ("framework", [
+        (("fastapi",), "FastAPI"),
+        (("django",), "Django"),
+        (("express",), "Express"),
+        (("spring",), "Spring"),
+    ]),
+    ("database", [
+        (("postgresql",), "PostgreSQL"),
+        (("mongodb",), "MongoDB"),
+        (("mysql",), "MySQL"),
+    ]),
+    ("deployment", [
+        (("kubernetes",), "Kubernetes"),
+        (("docker",), "Docker"),
+    ]),
+]
+
+_PATTERN_RULES = [
+    ("architecture", [
+        (("microservices",), "Microservices"),
+        (("monolith",), "Monolithic"),
+    ]),
+    ("api_style", [
+        (("rest",), "REST"),
+        (("graphql",), "GraphQL"),
+        (("grpc",), "gRPC"),
+    ]),
+    ("auth", [
+        (("jwt",), "JWT"),
+        (("oauth",), "OAuth2"),
+    ]),
+]
+
+def scan_keywords(content: str) -> frozenset:
+    """Return the set of keyword tokens present in content (one linear pass)"""
+    return frozenset(match.lastgroup for match in _KEYWORD_RE.finditer(content))
+
+def _apply_rules(tokens: frozenset, rules: list) -> dict:
+    """Resolve a rule table against scanned tokens"""
+    result = {}
+    for field, choices in rules:
+        for choice_tokens, value in choices:
+            if not tokens.isdisjoint(choice_tokens):
+                result[field] = value
+                break
+    return result
+
+def extract_tech_stack(content: str, tokens: Optional[frozenset] = None) -> dict:
+    """Extract technology stack from constitution"""
+    if tokens is None:
+        tokens = scan_keywords(content)
+    return _apply_rules(tokens, _TECH_STACK_RULES)
+
+def extract_patterns(content: str, tokens: Optional[frozenset] = None) -> dict:
+    """Extract architectural patterns"""
+    if tokens is None:
+        tokens = scan_keywords(content)
+    return _apply_rules(tokens, _PATTERN_RULES)
+
+def extract_principles(content: str) -> list:
+    """Extract key principles from constitution"""
+    principles = []
+    
+    # Look for bullet points or numbered lists
+    lines = content.split('\n')
+    for line in lines:
+        line = line.strip()
+        # Match lines starting with -, *, or numbers
+        if re.match(r'^[-*•]\s+', line) or re.match(r'^\d+\.\s+', line):
+            principle = re.sub(r'^[-*•\d.]\s+', '', line)
+            if len(principle) > 10:  # Filter out too short
+                principles.append(principle)
+    
+    return principles[:10]  # Return top 10
+
+def extract_standards(content: str, tokens: Optional[frozenset] = None) -> dict:
+    """Extract coding standards"""
+    if tokens is None:
+        tokens = scan_keywords(content)
+    standards = {}
+    
+    if "test" in tokens and "coverage" in tokens:
+        standards["testing"] = "Required"
+    
+    if "type_hint" in tokens or "typing" in tokens:
+        standards["type_hints"] = "Required"
+    
+    if "documentation" in tokens or "docstring" in tokens:
+        standards["documentation"] = "Required"
+    
+    return standards
+
+def generate_constitution_summary(tech_stack: dict, patterns: dict, principles: list) -> str:
+    """Generate human-readable summary"""
+    parts = []
+    
+    if tech_stack.get("language"):
+        parts.append(f"Language: {tech_stack['language']}")
+    if tech_stack.get("framework"):
+        parts.append(f"Framework: {tech_stack['framework']}")
+    if patterns.get("architecture"):
+        parts.append(f"Architecture: {patterns['architecture']}")
+    if patterns.get("api_style"):
+        parts.append(f"API: {patterns['api_style']}")
+    
+    summary = " | ".join(parts) if parts else "No clear tech stack found"
+    summary += f" | {len(principles)} principles defined"
+    
+    return summary
+
+# ============================================================================
+# COMPLIANCE RULES
+# ============================================================================
+
+# Bump whenever a check or the constitution parser changes so cached verdicts
+# are discarded
+RULESET_VERSION = "5"
+
+SEVERITY_WEIGHTS = {"error": 20, "warning": 10, "info": 0}
+
+# rule set name -> ordered rule definitions. A rule's factory receives the
+# parsed constitution and returns None when the constitution doesn't call for
+# the rule. Otherwise it returns check(spec, spec_text) -> list of violations,
+# or - for rules registered with `visits` - a dict of node-kind handlers plus a
+# "finish" callable. Handlers are fed by a single walk_spec() pass and return a
+# partial result (or None) for the node; finish(spec, spec_text, partials)
+# turns the partials into violations. Handlers must not keep state between
+# calls: partials are cached per subtree and reused while the subtree is
+# unchanged, so they must also never be mutated.
+RULE_SETS: dict = {}
+
+# Node kinds walk_spec() can dispatch
+NODE_KINDS = ("path_item", "operation", "response", "schema", "security_requirement")
+HTTP_METHODS = ("get", "put", "post", "delete", "options", "head", "patch", "trace")
+
+COMPILED_RULES_MAXSIZE = 32
+_compiled_rules: "OrderedDict[tuple, CompiledRules]" = OrderedDict()
+_compiled_rules_lock = threading.Lock()
+_compiled_rules_stats = {"hits": 0, "misses": 0}
+_rules_generation = 0
+
+def register_rule(
+    name: str,
+    severity: str = "warning",
+    weight: Optional[int] = None,
+    rule_sets: tuple = ("default",),
+    visits: Optional[tuple] = None,
+    uses_ref_index: bool = False
+):
+    """
+    Decorator registering a rule factory in one or more rule sets
+    
+    Rules that call ref_index() set uses_ref_index so streaming verification
+    knows to collect $refs while the document goes by.
+    """
+    unknown = set(visits or ()) - set(NODE_KINDS)
+    if unknown:
+        raise ValueError(f"Unknown node kinds: {', '.join(sorted(unknown))}")
+    
+    def decorator(factory):
+        global _rules_generation
+        definition = {
+            "name": name,
+            "severity": severity,
+            "weight": SEVERITY_WEIGHTS[severity] if weight is None else weight,
+            "visits": tuple(visits or ()),
+            "uses_ref_index": uses_ref_index,
+            "factory": factory
+        }
+        with _compiled_rules_lock:
+            for rule_set in rule_sets:
+                RULE_SETS.setdefault(rule_set, []).append(definition)
+            # Registering a rule invalidates everything compiled so far
+            _rules_generation += 1
+            _compiled_rules.clear()
+        return factory
+    return decorator
+
+# Subtrees whose visitor partials each compiled rule list remembers
+SUBTREE_CACHE_MAXSIZE = 65536
+
+class CompiledRules(list):
+    """
+    Ordered (definition, check) pairs plus the visitor partials they produced,
+    keyed by subtree hash
+    """
+    def __init__(self, pairs):
+        super().__init__(pairs)
+        self.partials: "OrderedDict[str, tuple]" = OrderedDict()
+
+def compile_rules(constitution: dict, rule_sets: tuple = ("default",)) -> CompiledRules:
+    """
+    Compile a constitution into an ordered list of (definition, check) pairs
+    
+    Compiled lists are cached per constitution_fingerprint() and rule sets,
+    so repeat verifications pay no per-rule setup and reuse the visitor
+    results of every subtree they have already seen.
+    """
+    key = (rule_sets, _rules_generation, constitution_fingerprint(constitution))
+    with _compiled_rules_lock:
+        compiled = _compiled_rules.get(key)
+        if compiled is not None:
+            _compiled_rules.move_to_end(key)
+            _compiled_rules_stats["hits"] += 1
+            return compiled
+        _compiled_rules_stats["misses"] += 1
+    
+    pairs = []
+    for rule_set in rule_sets:
+        for definition in RULE_SETS.get(rule_set, []):
+            check = definition["factory"](constitution)
+            if check is not None:
+                pairs.append((definition, check))
+    compiled = CompiledRules(pairs)
+    
+    with _compiled_rules_lock:
+        _compiled_rules[key] = compiled
+        while len(_compiled_rules) > COMPILED_RULES_MAXSIZE:
+            _compiled_rules.popitem(last=False)
+    return compiled
+
+def compiled_rules_info() -> dict:
+    """Return hit/miss counters and current size of the compiled-rules cache"""
+    with _compiled_rules_lock:
+        return {**_compiled_rules_stats, "currsize": len(_compiled_rules), "maxsize": COMPILED_RULES_MAXSIZE}
+
+def _escape_pointer(token: str) -> str:
+    """Escape one JSON pointer reference token (RFC 6901)"""
+    if "~" not in token and "/" not in token:
+        return token
+    return token.replace("~", "~0").replace("/", "~1")
+
+def walk_path_item(path: str, path_item, handlers: dict) -> None:
+    """Dispatch one path item and everything below it to handlers"""
+    if not isinstance(path_item, dict):
+        return
+    on_path_item = handlers.get("path_item", ())
+    on_operation = handlers.get("operation", ())
+    on_response = handlers.get("response", ())
+    on_schema = handlers.get("schema", ())
+    on_security = handlers.get("security_requirement", ())
+    
+    path_pointer = f"/paths/{_escape_pointer(path)}"
+    for handler in on_path_item:
+        handler(path_item, path_pointer, {"path": path})
+    
+    if not (on_operation or on_response or on_schema or on_security):
+        return
+    
+    for method, operation in path_item.items():
+        if method not in HTTP_METHODS or not isinstance(operation, dict):
+            continue
+        op_pointer = f"{path_pointer}/{method}"
+        context = {"path": path, "method": method}
+        for handler in on_operation:
+            handler(operation, op_pointer, context)
+        
+        if on_security and "security" in operation:
+            op_context = {"scope": "operation", "path": path, "method": method}
+            for i, requirement in enumerate(operation["security"] or []):
+                for handler in on_security:
+                    handler(requirement, f"{op_pointer}/security/{i}", op_context)
+        
+        if on_schema:
+            content = (operation.get("requestBody") or {}).get("content") or {}
+            for media_type, media in content.items():
+                if isinstance(media, dict) and "schema" in media:
+                    pointer = f"{op_pointer}/requestBody/content/{_escape_pointer(media_type)}/schema"
+                    for handler in on_schema:
+                        handler(media["schema"], pointer, {**context, "location": "request"})
+        
+        if on_response or on_schema:
+            for status, response in (operation.get("responses") or {}).items():
+                if not isinstance(response, dict):
+                    continue
+                resp_pointer = f"{op_pointer}/responses/{_escape_pointer(str(status))}"
+                resp_context = {**context, "status": str(status)}
+                for handler in on_response:
+                    handler(response, resp_pointer, resp_context)
+                if on_schema:
+                    for media_type, media in (response.get("content") or {}).items():
+                        if isinstance(media, dict) and "schema" in media:
+                            pointer = f"{resp_pointer}/content/{_escape_pointer(media_type)}/schema"
+                            for handler in on_schema:
+                                handler(media["schema"], pointer, {**resp_context, "location": "response"})
+
+def walk_component_schema(name: str, schema, handlers: dict) -> None:
+    """Dispatch one components.schemas entry to schema handlers"""
+    context = {"location": "component", "name": name}
+    for handler in handlers.get("schema", ()):
+        handler(schema, f"/components/schemas/{_escape_pointer(name)}", context)
+
+def walk_document_security(spec: dict, handlers: dict) -> None:
+    """Dispatch the document-level security requirements"""
+    on_security = handlers.get("security_requirement", ())
+    if on_security:
+        for i, requirement in enumerate(spec.get("security", []) or []):
+            context = {"scope": "document"}
+            for handler in on_security:
+                handler(requirement, f"/security/{i}", context)
+
+def walk_spec(spec: dict, handlers: dict) -> None:
+    """
+    Walk an OpenAPI document once, dispatching nodes to registered handlers
+    
+    handlers maps a node kind to a list of callables taking
+    (node, pointer, context); subtrees nobody listens for are skipped.
+    """
+    walk_document_security(spec, handlers)
+    
+    if any(handlers.get(kind) for kind in NODE_KINDS):
+        for path, path_item in (spec.get("paths") or {}).items():
+            walk_path_item(path, path_item, handlers)
+    
+    if handlers.get("schema"):
+        for name, schema in ((spec.get("components") or {}).get("schemas") or {}).items():
+            walk_component_schema(name, schema, handlers)
+
+def spec_contains(spec: dict, spec_text: Optional[str], needle: str) -> bool:
+    """
+    Case-insensitive substring test over the spec
+    
+    Searches the original text when the spec arrived as text, otherwise the
+    keys and scalar values of the parsed tree - never a lowercased copy.
+    """
+    if isinstance(spec_text, StreamedSpecText):
+        return spec_text.contains(needle)
+    if spec_text is not None:
+        return re.search(re.escape(needle), spec_text, re.IGNORECASE) is not None
+    
+    needle = needle.lower()
+    # Inside run_rules() unchanged leaves answer from the subtree cache
+    memo = _run_ref_indexes.get()
+    leaves = memo.get(("leaves", id(spec))) if memo else None
+    digests = {id(subtree): digest for _, _, subtree, digest in leaves or () if digest is not None}
+    return _tree_contains(spec, needle, digests)
+
+def _tree_contains(node, needle: str, digests: dict) -> bool:
+    """Whether needle (lowercased) occurs in a key or scalar under node"""
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        digest = digests.get(id(node)) if digests else None
+        if digest is not None:
+            if subtree_contains(node, needle, digest):
+                return True
+        elif isinstance(node, dict):
+            for key, value in node.items():
+                if needle in str(key).lower():
+                    return True
+                stack.append(value)
+        elif isinstance(node, list):
+            stack.extend(node)
+        elif node is not None and needle in str(node).lower():
+            return True
+    return False
+
+def _collect_partials(index: int, handler, bucket: list, elapsed: list):
+    """
+    Wrap a visitor handler so its partial results land in bucket as
+    (rule index, partial) and its time is added to elapsed[index]
+    """
+    def collect(node, pointer: str, context: dict) -> None:
+        start = time.perf_counter()
+        partial = handler(node, pointer, context)
+        elapsed[index] += time.perf_counter() - start
+        if partial is not None:
+            bucket.append((index, partial))
+    return collect
+
+def _visitor_handlers(compiled: list, elapsed: list) -> tuple:
+    """Node-kind handlers for every visitor rule; returns (handlers, bucket)"""
+    bucket = []
+    handlers = {}
+    for index, (definition, hooks) in enumerate(compiled):
+        for kind in definition["visits"]:
+            handlers.setdefault(kind, []).append(_collect_partials(index, hooks[kind], bucket, elapsed))
+    return handlers, bucket
+
+def _run_checks(spec: dict, spec_text, compiled: list, results: list, elapsed: list) -> None:
+    """Run every document-level rule, timing each"""
+    for index, (definition, check) in enumerate(compiled):
+        if not definition["visits"]:
+            check_deadline()
+            start = time.perf_counter()
+            results[index] = check(spec, spec_text)
+            elapsed[index] += time.perf_counter() - start
+
+def _finish_visitors(spec: dict, spec_text, compiled: list, partials: list, results: list, elapsed: list) -> None:
+    """Hand each visitor rule its partials in document order and store its violations"""
+    by_rule = {index: [] for index, (definition, _) in enumerate(compiled) if definition["visits"]}
+    for index, partial in partials:
+        by_rule[index].append(partial)
+    for index, found in by_rule.items():
+        check_deadline()
+        start = time.perf_counter()
+        results[index] = compiled[index][1]["finish"](spec, spec_text, found)
+        elapsed[index] += time.perf_counter() - start
+
+def _score_results(compiled: list, results: list) -> dict:
+    """Turn per-rule violation lists into the compliance report"""
+    violations = []
+    passed = []
+    deductions = 0
+    
+    for (definition, _), found in zip(compiled, results):
+        if not found:
+            passed.append(definition["name"])
+            continue
+        for violation in found:
+            violations.append({
+                "rule": definition["name"],
+                "severity": definition["severity"],
+                **violation
+            })
+            deductions += definition["weight"]
+    
+    # Calculate compliance score
+    score = max(0, 100 - deductions)
+    blocking = [v for v in violations if v["severity"] != "info"]
+    
+    return {
+        "success": True,
+        "is_compliant": len(blocking) == 0,
+        "compliance_score": score,
+        "violations": violations,
+        "passed_rules": passed,
+        "summary": f"{'✅ Fully compliant' if len(blocking) == 0 else f'⚠️  {len(blocking)} violation(s) found'}",
+        "recommendations": [v["suggestion"] for v in violations] if violations else ["Specification follows all constitution rules"]
+    }
+
+def run_rules(spec: dict, spec_text: Optional[str], compiled: list) -> dict:
+    """
+    Run a compiled rule list against a parsed spec and score the result
+    
+    spec_text is the document's original text when there is one; rules use
+    spec_contains() rather than searching it directly. Path items and
+    components are hashed first, and visitor partials and $ref scans are
+    reused for every subtree seen before, so re-verifying an edited spec
+    only walks the subtrees the edit touched.
+    """
+    token = _run_ref_indexes.set({})
+    try:
+        results = [None] * len(compiled)
+        elapsed = [0.0] * len(compiled)
+        handlers, bucket = _visitor_handlers(compiled, elapsed)
+        leaves = None
+        if handlers or any(definition["uses_ref_index"] for definition, _ in compiled):
+            leaves = spec_leaves(spec)
+            _run_ref_indexes.get()[("leaves", id(spec))] = leaves
+        
+        _run_checks(spec, spec_text, compiled, results, elapsed)
+        
+        if handlers:
+            walk_document_security(spec, handlers)
+            partials = list(bucket)
+            bucket.clear()
+            partials.extend(_walk_leaves(leaves, compiled, handlers, bucket))
+            _finish_visitors(spec, spec_text, compiled, partials, results, elapsed)
+    finally:
+        _run_ref_indexes.reset(token)
+    
+    _record_rule_metrics(compiled, results, elapsed)
+    return _score_results(compiled, results)
+
+@register_rule("Tech Stack Compliance", severity="warning")
+def _rule_tech_stack(constitution: dict):
+    framework = constitution.get("tech_stack", {}).get("framework")
+    if not framework:
+        return None
+    violation = {
+        "message": f"Constitution requires {framework}, not found in spec",
+        "suggestion": f"Add {framework} references to spec description",
+        "pointer": "/info/description"
+    }
+    
+    def check(spec: dict, spec_text: Optional[str]) -> list:
+        return [] if spec_contains(spec, spec_text, framework) else [violation]
+    return check
+
+@register_rule("Authentication Required", severity="error")
+def _rule_authentication(constitution: dict):
+    required_auth = constitution.get("patterns", {}).get("auth")
+    if not required_auth:
+        return None
+    violation = {
+        "message": f"Constitution requires {required_auth} authentication",
+        "suggestion": f"Add {required_auth} security scheme to components.securitySchemes",
+        "pointer": "/components/securitySchemes"
+    }
+    
+    def check(spec: dict, spec_text: Optional[str]) -> list:
+        return [] if "securitySchemes" in spec.get("components", {}) else [violation]
+    return check
+
+@register_rule("Health Endpoint Required", severity="warning")
+def _rule_health_endpoint(constitution: dict):
+    violation = {
+        "message": "All services should have a /health endpoint",
+        "suggestion": "Add GET /health endpoint for monitoring",
+        "pointer": "/paths/~1health"
+    }
+    
+    def check(spec: dict, spec_text: Optional[str]) -> list:
+        return [] if "/health" in spec.get("paths", {}) else [violation]
+    return check
+
+# ============================================================================
+# REFERENCE INDEX
+# ============================================================================
+
+# Ref indexes (keyed by spec id) and hashed leaves (keyed by ("leaves", spec
+# id)) of the current verification run
+_run_ref_indexes: ContextVar = ContextVar("_run_ref_indexes", default=None)
+
+def _unescape_pointer(token: str) -> str:
+    """Undo JSON pointer escaping for one reference token"""
+    return token.replace("~1", "/").replace("~0", "~")
+
+def _ref_node(ref: str) -> str:
+    """Graph node a local $ref points into: a component, a path item, or the ref itself"""
+    parts = ref.split("/")
+    if len(parts) >= 4 and parts[1] == "components":
+        return "/".join(parts[:4])
+    if len(parts) >= 3 and parts[1] in ("paths", "webhooks"):
+        return "/".join(parts[:3])
+    return ref
+
+def _scan_refs(node, pointer: str, owner: str, refs: list) -> None:
+    """Append (site pointer, $ref, owner node) for every $ref under node"""
+    # Locations are (parent location, key) links; pointer strings are only
+    # built for the few nodes that actually hold a $ref
+    stack = [(node, None)]
+    while stack:
+        node, location = stack.pop()
+        if isinstance(node, dict):
+            ref = node.get("$ref")
+            if isinstance(ref, str):
+                keys = []
+                link = location
+                while link is not None:
+                    link, key = link
+                    keys.append(_escape_pointer(str(key)))
+                refs.append(("/".join([pointer, *reversed(keys)]), ref, owner))
+            for key, value in node.items():
+                if isinstance(value, (dict, list)):
+                    stack.append((value, (location, key)))
+        elif isinstance(node, list):
+            for i, value in enumerate(node):
+                if isinstance(value, (dict, list)):
+                    stack.append((value, (location, i)))
+
+def _ref_owners(spec: dict):
+    """Yield (owner node, pointer, subtree) for each part of the document that can hold $refs"""
+    for key, value in spec.items():
+        if key in ("paths", "webhooks") and isinstance(value, dict):
+            for name, item in value.items():
+                if item is not _STREAM_PLACEHOLDER:
+                    pointer = f"/{key}/{_escape_pointer(name)}"
+                    yield f"#{pointer}", pointer, item
+        elif key == "components" and isinstance(value, dict):
+            for kind, entries in value.items():
+                if not isinstance(entries, dict):
+                    continue
+                for name, item in entries.items():
+                    if item is not _STREAM_PLACEHOLDER:
+                        pointer = f"/components/{_escape_pointer(kind)}/{_escape_pointer(name)}"
+                        yield f"#{pointer}", pointer, item
+        elif isinstance(value, (dict, list)):
+            yield "#", f"/{_escape_pointer(key)}", value
+
+def _resolve_local_ref(spec: dict, ref: str) -> bool:
+    """Whether a local $ref ("#/...") points at something in the document"""
+    node = spec
+    for token in unquote(ref[1:]).split("/")[1:]:
+        if node is _STREAM_PLACEHOLDER:
+            return True  # Streamed away; only its key is known
+        token = _unescape_pointer(token)
+        if isinstance(node, dict) and token in node:
+            node = node[token]
+        elif isinstance(node, list) and token.isdigit() and int(token) < len(node):
+            node = node[int(token)]
+        else:
+            return False
+    return True
+
+def _find_cycles(graph: dict) -> list:
+    """Strongly connected components that form cycles (Tarjan, iterative)"""
+    index_of = {}
+    lowlink = {}
+    on_stack = set()
+    stack = []
+    cycles = []
+    counter = 0
+    
+    for root in graph:
+        if root in index_of:
+            continue
+        work = [(root, iter(graph.get(root, ())))]
+        index_of[root] = lowlink[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack.add(root)
+        while work:
+            node, children = work[-1]
+            advanced = False
+            for child in children:
+                if child not in index_of:
+                    index_of[child] = lowlink[child] = counter
+                    counter += 1
+                    stack.append(child)
+                    on_stack.add(child)
+                    work.append((child, iter(graph.get(child, ()))))
+                    advanced = True
+                    break
+                if child in on_stack:
+                    lowlink[node] = min(lowlink[node], index_of[child])
+            if advanced:
+                continue
+            work.pop()
+            if work:
+                parent = work[-1][0]
+                lowlink[parent] = min(lowlink[parent], lowlink[node])
+            if lowlink[node] == index_of[node]:
+                component = []
+                while True:
+                    member = stack.pop()
+                    on_stack.discard(member)
+                    component.append(member)
+                    if member == node:
+                        break
+                if len(component) > 1 or node in graph.get(node, ()):
+                    cycles.append(sorted(component))
+    return cycles
+
+def build_ref_index(spec: dict, leaves: Optional[list] = None) -> dict:
+    """
+    Index every $ref in a spec in one pass
+    
+    Returns the ref sites, the owner -> target dependency graph, dangling
+    refs, cycles, and components that no path item or webhook can reach.
+    leaves are the spec's hashed subtrees from spec_leaves(), whose scans
+    are reused while unchanged. Streaming verification uses
+    StreamedRefIndex instead.
+    """
+    refs = []
+    if leaves is None:
+        for owner, pointer, subtree in _ref_owners(spec):
+            _scan_refs(subtree, pointer, owner, refs)
+    else:
+        for leaf in leaves:
+            check_deadline()
+            refs.extend(subtree_refs(*leaf))
+    
+    graph = {}
+    dangling = []
+    external = []
+    # Distinct targets are few compared to ref sites; resolve each once
+    targets = {}
+    for site, ref, owner in refs:
+        if not ref.startswith("#"):
+            external.append({"site": site, "ref": ref})
+            continue
+        target = targets.get(ref)
+        if target is None:
+            target = targets[ref] = _ref_node(ref) if _resolve_local_ref(spec, ref) else ""
+        if not target:
+            dangling.append({"site": site, "ref": ref})
+            continue
+        graph.setdefault(owner, set()).add(target)
+    
+    return {
+        "refs": [{"site": site, "ref": ref, "owner": owner} for site, ref, owner in refs],
+        "graph": {node: sorted(targets) for node, targets in graph.items()},
+        "dangling": dangling,
+        "external": external,
+        "cycles": sorted(_find_cycles(graph)),
+        "unreachable": _unreachable_components(spec, graph)
+    }
+
+def _unreachable_components(spec: dict, graph: dict, seeds: tuple = ()) -> list:
+    """Components no path item or webhook reaches, following graph from them and from seeds"""
+    components = {
+        f"#/components/{_escape_pointer(kind)}/{_escape_pointer(name)}"
+        for kind, entries in (spec.get("components") or {}).items()
+        if isinstance(entries, dict) and kind != "securitySchemes"
+        for name in entries
+    }
+    
+    # Reachability from the API surface: path items and webhooks
+    roots = [
+        f"#/{section}/{_escape_pointer(name)}"
+        for section in ("paths", "webhooks")
+        for name in (spec.get(section) or {})
+    ]
+    reachable = set(roots)
+    reachable.update(seeds)
+    pending = list(reachable)
+    while pending:
+        for target in graph.get(pending.pop(), ()):
+            if target not in reachable:
+                reachable.add(target)
+                pending.append(target)
+    return sorted(components - reachable)
+
+class StreamedRefIndex:
+    """
+    $ref index fed subtree by subtree while a spec streams past
+    
+    Holds only what the ref rules need, never the full list of ref sites:
+    the edges of components and other non-path owners, the distinct targets
+    streamed path items point at (reachability only needs them as seeds), and
+    the first site of each distinct ref. Sites of dangling refs, and edges of
+    path items that a $ref points back into, are recovered by a second pass
+    over the file - only when the spec has any. The index carries no "refs"
+    list, and "external" holds the first site of each distinct external ref.
+    """
+    
+    def __init__(self):
+        self.edges = {}
+        self.surface = set()
+        self.first_sites = {}
+    
+    def add(self, owner: str, pointer: str, subtree, surface: bool = False) -> None:
+        """Record the $refs under one subtree; surface marks a streamed path item"""
+        refs = []
+        _scan_refs(subtree, pointer, owner, refs)
+        if not refs:
+            return
+        targets = self.surface if surface else self.edges.setdefault(owner, set())
+        for site, ref, _ in refs:
+            self.first_sites.setdefault(ref, site)
+            targets.add(ref)
+    
+    def index(self, spec: dict, restream) -> dict:
+        """
+        Finish the index against the skeleton once streaming is done
+        
+        restream(visit) must stream the file again, calling visit(owner,
+        pointer, subtree) for each path item and component schema.
+        """
+        for owner, pointer, subtree in _ref_owners(spec):
+            self.add(owner, pointer, subtree)
+        
+        targets = {}
+        external = []
+        for ref, site in self.first_sites.items():
+            if ref.startswith("#"):
+                targets[ref] = _ref_node(ref) if _resolve_local_ref(spec, ref) else ""
+            else:
+                external.append({"site": site, "ref": ref})
+        missing = {ref for ref, target in targets.items() if not target}
+        path_targets = {target for target in targets.values() if target.startswith("#/paths/")}
+        
+        edges = dict(self.edges)
+        dangling = []
+        if missing or path_targets:
+            def visit(owner: str, pointer: str, subtree) -> None:
+                refs = []
+                _scan_refs(subtree, pointer, owner, refs)
+                for site, ref, _ in refs:
+                    if ref in missing:
+                        dangling.append({"site": site, "ref": ref})
+                    if owner in path_targets:
+                        edges.setdefault(owner, set()).add(ref)
+            restream(visit)
+            # Skeleton refs come after the streamed ones, as in build_ref_index
+            for owner, pointer, subtree in _ref_owners(spec):
+                refs = []
+                _scan_refs(subtree, pointer, owner, refs)
+                dangling.extend({"site": site, "ref": ref} for site, ref, _ in refs if ref in missing)
+        
+        graph = {}
+        for owner, refs in edges.items():
+            resolved = {targets[ref] for ref in refs if targets.get(ref)}
+            if resolved:
+                graph[owner] = resolved
+        seeds = tuple(targets[ref] for ref in self.surface if targets.get(ref))
+        
+        return {
+            "graph": {node: sorted(nodes) for node, nodes in graph.items()},
+            "dangling": dangling,
+            "external": external,
+            "cycles": sorted(_find_cycles(graph)),
+            "unreachable": _unreachable_components(spec, graph, seeds)
+        }
+
+def ref_index(spec: dict) -> dict:
+    """
+    The $ref index for a spec
+    
+    Inside run_rules() the index is built on first use and shared by every
+    rule of that run, and whole indexes are reused across runs while no leaf
+    of the spec changes. Outside a run it is built fresh on each call.
+    """
+    cache = _run_ref_indexes.get()
+    if cache is None:
+        return build_ref_index(spec)
+    index = cache.get(id(spec))
+    if index is None:
+        leaves = cache.get(("leaves", id(spec)))
+        digest = spec_digest(spec, leaves) if leaves is not None else None
+        if digest is not None:
+            with _subtree_cache_lock:
+                index = _lru_get(_ref_indexes, digest, "index_")
+        if index is None:
+            index = build_ref_index(spec, leaves=leaves)
+            if digest is not None:
+                with _subtree_cache_lock:
+                    _lru_put(_ref_indexes, digest, index, REF_INDEX_CACHE_MAXSIZE)
+        cache[id(spec)] = index
+    return index
+
+@register_rule("Dangling References", severity="error", uses_ref_index=True)
+def _rule_dangling_refs(constitution: dict):
+    def check(spec: dict, spec_text: Optional[str]) -> list:
+        return [{
+            "message": f"$ref target does not exist: {item['ref']}",
+            "suggestion": "Define the referenced component or fix the $ref",
+            "pointer": item["site"]
+        } for item in ref_index(spec)["dangling"]]
+    return check
+
+@register_rule("Reference Cycles", severity="info", uses_ref_index=True)
+def _rule_ref_cycles(constitution: dict):
+    def check(spec: dict, spec_text: Optional[str]) -> list:
+        return [{
+            "message": f"Reference cycle: {' -> '.join(cycle)}",
+            "suggestion": "Make sure recursive structures are intentional and generators support them",
+            "pointer": cycle[0][1:]
+        } for cycle in ref_index(spec)["cycles"]]
+    return check
+
+@register_rule("Unused Components", severity="info", uses_ref_index=True)
+def _rule_unused_components(constitution: dict):
+    def check(spec: dict, spec_text: Optional[str]) -> list:
+        return [{
+            "message": f"Component is not reachable from any path: {node}",
+            "suggestion": "Remove the component or reference it from an operation",
+            "pointer": node[1:]
+        } for node in ref_index(spec)["unreachable"]]
+    return check
+
+def _check_spec_compliance(
+    spec: dict,
+    spec_text: Optional[str],
+    constitution: dict,
+    rule_sets: tuple = ("default",)
+) -> dict:
+    """Run the compiled constitution rules against an already-parsed spec"""
+    return run_rules(spec, spec_text, compile_rules(constitution, rule_sets))
+
+# ============================================================================
+# SUBTREE HASHES
+# ============================================================================
+
+# Each path item, webhook and component is a leaf hashed over its pointer and
+# canonical JSON, so equal hashes mean identical content at the same place.
+# Visitor partials (per compiled rule list), $ref scans and text searches are
+# cached by leaf hash; an edit costs a re-walk of the leaves it changed.
+_subtree_refs: "OrderedDict[str, tuple]" = OrderedDict()
+_subtree_matches: "OrderedDict[tuple, bool]" = OrderedDict()
+_subtree_cache_lock = threading.Lock()
+_subtree_cache_stats = {"hits": 0, "misses": 0, "ref_hits": 0, "ref_misses": 0, "index_hits": 0, "index_misses": 0}
+
+# Whole $ref indexes, keyed by spec_digest(). An edited leaf changes the
+# digest: its refs are rescanned and the graph, cycles and reachability are
+# rebuilt from the cached scans of every other leaf. Indexes of large specs
+# are large, so only a few are kept.
+REF_INDEX_CACHE_MAXSIZE = 16
+_ref_indexes: "OrderedDict[str, dict]" = OrderedDict()
+
+def subtree_cache_info() -> dict:
+    """Return hit/miss counters for reused visitor partials, $ref scans and $ref indexes"""
+    with _subtree_cache_lock:
+        return {
+            **_subtree_cache_stats,
+            "ref_entries": len(_subtree_refs),
+            "index_entries": len(_ref_indexes),
+            "maxsize": SUBTREE_CACHE_MAXSIZE
+        }
+
+def invalidate_subtree_caches() -> int:
+    """
+    Drop every cached visitor partial, $ref scan, text search and $ref index
+    so the next verification runs cold; returns entries removed
+    """
+    with _compiled_rules_lock:
+        compiled_lists = list(_compiled_rules.values())
+    with _subtree_cache_lock:
+        caches = [_subtree_refs, _subtree_matches, _ref_indexes, *(compiled.partials for compiled in compiled_lists)]
+        removed = sum(len(cache) for cache in caches)
+        for cache in caches:
+            cache.clear()
+    return removed
+
+def subtree_hash(pointer: str, subtree) -> Optional[str]:
+    """SHA-256 of a subtree's pointer and canonical JSON; None if it isn't JSON-serializable"""
+    try:
+        data = specmcp_json.dumpb(subtree, sort_keys=True)
+    except (TypeError, ValueError):
+        return None  # e.g. YAML dates; such leaves are simply not cached
+    return hashlib.sha256(pointer.encode() + b"\0" + data).hexdigest()
+
+def spec_leaves(spec: dict) -> list:
+    """(owner node, pointer, subtree, hash) for each independently cached part of a spec"""
+    return [
+        (owner, pointer, subtree, subtree_hash(pointer, subtree))
+        for owner, pointer, subtree in _ref_owners(spec)
+    ]
+
+def spec_digest(spec: dict, leaves: list) -> Optional[str]:
+    """
+    SHA-256 over a spec's leaf hashes and the parts no leaf covers (top-level
+    scalars, key order, non-object component kinds); None if a leaf has no hash
+    """
+    digest = hashlib.sha256()
+    for leaf in leaves:
+        if leaf[3] is None:
+            return None
+        digest.update(leaf[3].encode())
+    components = spec.get("components")
+    rest = {
+        "keys": list(spec),
+        "scalars": {key: value for key, value in spec.items() if not isinstance(value, (dict, list))},
+        "components": {
+            kind: None if isinstance(entries, dict) else entries
+            for kind, entries in components.items()
+        } if isinstance(components, dict) else None
+    }
+    try:
+        digest.update(specmcp_json.dumpb(rest, sort_keys=True))
+    except (TypeError, ValueError):
+        return None
+    return digest.hexdigest()
+
+def _lru_get(cache: OrderedDict, key: str, stat: str):
+    """Look key up in a subtree LRU, counting the hit or miss; caller holds the lock"""
+    value = cache.get(key)
+    if value is None:
+        _subtree_cache_stats[stat + "misses"] += 1
+    else:
+        cache.move_to_end(key)
+        _subtree_cache_stats[stat + "hits"] += 1
+    return value
+
+def _lru_put(cache: OrderedDict, key: str, value, maxsize: int = SUBTREE_CACHE_MAXSIZE) -> None:
+    """Store into a subtree LRU, evicting the oldest entries; caller holds the lock"""
+    cache[key] = value
+    while len(cache) > maxsize:
+        cache.popitem(last=False)
+
+def subtree_refs(owner: str, pointer: str, subtree, digest: Optional[str]) -> tuple:
+    """The (site, $ref, owner) triples under one leaf, scanned once per distinct hash"""
+    if digest is not None:
+        with _subtree_cache_lock:
+            cached = _lru_get(_subtree_refs, digest, "ref_")
+        if cached is not None:
+            return cached
+    refs = []
+    _scan_refs(subtree, pointer, owner, refs)
+    refs = tuple(refs)
+    if digest is not None:
+        with _subtree_cache_lock:
+            _lru_put(_subtree_refs, digest, refs)
+    return refs
+
+def subtree_contains(subtree, needle: str, digest: str) -> bool:
+    """spec_contains() for one leaf, searched once per distinct hash and needle"""
+    key = (digest, needle)
+    with _subtree_cache_lock:
+        found = _subtree_matches.get(key)
+        if found is not None:
+            _subtree_matches.move_to_end(key)
+            return found
+    found = _tree_contains(subtree, needle, None)
+    with _subtree_cache_lock:
+        _lru_put(_subtree_matches, key, found)
+    return found
+
+def _walk_leaves(leaves: list, compiled: CompiledRules, handlers: dict, bucket: list) -> list:
+    """
+    Visitor partials for every path item and component schema, in walk_spec()
+    order, walking only the leaves whose hash this rule list hasn't seen
+    """
+    path_leaves = []
+    schema_leaves = []
+    for leaf in leaves:
+        if leaf[1].startswith("/paths/"):
+            path_leaves.append((walk_path_item, _unescape_pointer(leaf[1][len("/paths/"):]), leaf))
+        elif leaf[1].startswith("/components/schemas/"):
+            schema_leaves.append((walk_component_schema, _unescape_pointer(leaf[1][len("/components/schemas/"):]), leaf))
+    
+    partials = []
+    for walk, name, (_, _, subtree, digest) in path_leaves + schema_leaves:
+        check_deadline()
+        cached = None
+        if digest is not None:
+            with _subtree_cache_lock:
+                cached = _lru_get(compiled.partials, digest, "")
+        if cached is None:
+            walk(name, subtree, handlers)
+            cached = tuple(bucket)
+            bucket.clear()
+            if digest is not None:
+                with _subtree_cache_lock:
+                    _lru_put(compiled.partials, digest, cached)
+        partials.extend(cached)
+    return partials
+
+# ============================================================================
+# FILE ACCESS
+# ============================================================================
+
+# Directory every file a tool reads or writes must resolve into, or None for
+# no restriction. Over stdio the client already runs as the user; over HTTP
+# anyone who can reach the port names the paths, so the server sets a root.
+_file_root: Optional[str] = None
+
+def set_file_root(root: Optional[str]) -> None:
+    """Confine tool file access to root (symlinks resolved); None lifts it"""
+    global _file_root
+    _file_root = os.path.realpath(root) if root is not None else None
+
+def file_root() -> Optional[str]:
+    """The directory tool file access is confined to, or None"""
+    return _file_root
+
+def outside_file_root(path) -> bool:
+    """Whether path, with symlinks and .. resolved, escapes the file root"""
+    if _file_root is None:
+        return False
+    resolved = os.path.realpath(path)
+    return resolved != _file_root and not resolved.startswith(os.path.join(_file_root, ""))
+
+def file_root_error(paths: list) -> dict:
+    """Tool-style failure for paths outside the file root"""
+    return {
+        "success": False,
+        "error": f"Outside the server's file root {_file_root}: {', '.join(map(str, paths))}",
+        "suggestion": "Use paths under the directory the server was started with --root"
+    }
+
+# ============================================================================
+# SPEC INPUTS AND STORE
+# ============================================================================
+
+# Specs held server-side so multi-step workflows pass a handle instead of the
+# document. Content-addressed: the handle is derived from the canonical JSON,
+# so storing the same spec twice yields the same handle and one entry.
+SPEC_STORE_MAX_ENTRIES = 256
+SPEC_STORE_MAX_BYTES = 256 * 1024 * 1024
+_spec_store: "OrderedDict[str, dict]" = OrderedDict()
+_spec_store_lock = threading.Lock()
+_spec_store_bytes = 0
+_spec_store_stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+def spec_store_put(spec: dict, canonical: Optional[bytes] = None, frozen: bool = False) -> str:
+    """
+    Store a spec and return its handle
+    
+    The store keeps its own deep copy; stored specs are treated as immutable.
+    Callers that already hold the spec's sort_keys JSON pass it as canonical,
+    and frozen=True stores a spec nobody mutates (a memoized one) uncopied.
+    """
+    global _spec_store_bytes
+    if canonical is None:
+        canonical = specmcp_json.dumpb(spec, sort_keys=True)
+    handle = "spec:" + hashlib.sha256(canonical).hexdigest()[:24]
+    size = len(canonical)
+    
+    with _spec_store_lock:
+        if handle in _spec_store:
+            _spec_store.move_to_end(handle)
+            return handle
+    
+    entry = {"spec": spec if frozen else copy.deepcopy(spec), "size": size}
+    with _spec_store_lock:
+        if handle not in _spec_store:
+            _spec_store[handle] = entry
+            _spec_store_bytes += size
+        _spec_store.move_to_end(handle)
+        # Evict least recently used entries, but never the one just stored
+        while len(_spec_store) > 1 and (
+            len(_spec_store) > SPEC_STORE_MAX_ENTRIES or _spec_store_bytes > SPEC_STORE_MAX_BYTES
+        ):
+            _, evicted = _spec_store.popitem(last=False)
+            _spec_store_bytes -= evicted["size"]
+            _spec_store_stats["evictions"] += 1
+    return handle
+
+def spec_store_get(handle: str) -> Optional[dict]:
+    """Return the stored spec for a handle (shared - do not mutate), or None"""
+    with _spec_store_lock:
+        entry = _spec_store.get(handle)
+        if entry is None:
+            _spec_store_stats["misses"] += 1
+            return None
+        _spec_store.move_to_end(handle)
+        _spec_store_stats["hits"] += 1
+        return entry["spec"]
+
+def spec_store_info() -> dict:
+    """Return size and hit/miss counters of the spec store"""
+    with _spec_store_lock:
+        return {
+            **_spec_store_stats,
+            "entries": len(_spec_store),
+            "bytes": _spec_store_bytes,
+            "max_entries": SPEC_STORE_MAX_ENTRIES,
+            "max_bytes": SPEC_STORE_MAX_BYTES
+        }
+
+def _load_spec_input(
+    spec_content: Optional[str] = None,
+    spec_path: Optional[str] = None,
+    spec: Optional[dict] = None,
+    spec_handle: Optional[str] = None
+) -> tuple:
+    """
+    Resolve exactly one of the spec inputs a tool accepts
+    
+    Returns (spec, spec_text, error); spec_text is None for parsed objects and
+    error is a tool-style failure dict or None.
+    """
+    provided = [name for name, value in (
+        ("spec_content", spec_content), ("spec_path", spec_path),
+        ("spec", spec), ("spec_handle", spec_handle)
+    ) if value is not None]
+    if len(provided) != 1:
+        return None, None, {
+            "success": False,
+            "error": "Provide exactly one of spec_content, spec_path, spec or spec_handle" + (
+                f" (got {', '.join(provided)})" if provided else ""
+            ),
+            "suggestion": "Use spec_path for large specs the server can read directly"
+        }
+    
+    if spec_handle is not None:
+        stored = spec_store_get(spec_handle)
+        if stored is None:
+            return None, None, {
+                "success": False,
+                "error": f"Unknown or evicted spec handle: {spec_handle}",
+                "suggestion": "Store the spec again with store_spec and use the new handle"
+            }
+        return stored, None, None
+    
+    if spec is not None:
+        if not isinstance(spec, dict):
+            return None, None, {
+                "success": False,
+                "error": "Spec object must be a JSON object",
+                "suggestion": "Pass the parsed OpenAPI document"
+            }
+        return spec, None, None
+    
+    try:
+        if spec_path is not None:
+            spec, spec_content = read_spec_file(spec_path)
+        else:
+            spec = parse_spec_text(spec_content)
+        return spec, spec_content, None
+    except OSError as e:
+        return None, None, {
+            "success": False,
+            "error": f"Could not read spec file: {e}",
+            "suggestion": "Check the spec_path exists and is readable by the server"
+        }
+    except ImportError as e:
+        return None, None, _missing_dependency_error(e)
+    except ValueError:
+        return None, None, {
+            "success": False,
+            "error": "Spec content is not valid JSON or YAML",
+            "suggestion": "Make sure you're providing a valid OpenAPI document"
+        }
+
+def _missing_dependency_error(e: ImportError) -> dict:
+    """Tool-style error for an optional dependency that isn't installed"""
+    name, package = {"yaml": ("PyYAML", "pyyaml")}.get(e.name, (e.name, e.name))
+    return {
+        "success": False,
+        "error": f"{name} not installed",
+        "suggestion": f"Install with: pip install {package}"
+    }
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+COMPRESSED_SUFFIXES = (".gz", ".zst", ".zstd")
+YAML_SUFFIXES = (".yaml", ".yml")
+
+def _spec_compression(path: str) -> Optional[str]:
+    """Detect gzip/zstd compression from the file's magic bytes"""
+    with open(path, "rb") as f:
+        magic = f.read(4)
+    if magic.startswith(GZIP_MAGIC):
+        return "gzip"
+    if magic == ZSTD_MAGIC:
+        return "zstd"
+    return None
+
+def open_spec_stream(path: str):
+    """Open a spec file for binary reading, decompressing gzip or zstd on the fly"""
+    compression = _spec_compression(path)
+    if compression == "gzip":
+        return gzip.open(path, "rb")
+    if compression == "zstd":
+        import zstandard
+        return zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), read_across_frames=True, closefd=True)
+    return open(path, "rb")
+
+def _is_yaml_path(path: str) -> bool:
+    """Whether a spec path names YAML, looking past any compression suffix"""
+    name = path.lower()
+    for suffix in COMPRESSED_SUFFIXES:
+        if name.endswith(suffix):
+            name = name[:-len(suffix)]
+            break
+    return name.endswith(YAML_SUFFIXES)
+
+def parse_spec_text(text: str, is_yaml: bool = False) -> dict:
+    """
+    Parse spec text as JSON, or as YAML when hinted or when it isn't JSON
+    
+    Raises ValueError for malformed documents and ImportError when YAML is
+    needed but PyYAML isn't installed.
+    """
+    if not is_yaml:
+        try:
+            return specmcp_json.loads(text)
+        except ValueError:
+            if text.lstrip()[:1] in ("{", "["):
+                raise
+    
+    import yaml
+    try:
+        spec = yaml.load(text, Loader=getattr(yaml, "CSafeLoader", yaml.SafeLoader))
+    except yaml.YAMLError as e:
+        raise ValueError(f"Invalid YAML: {e}") from e
+    if not isinstance(spec, dict):
+        raise ValueError("Spec must be a JSON/YAML object")
+    return spec
+
+def read_spec_file(path: str) -> tuple:
+    """
+    Read a JSON or YAML spec file, gzip/zstd-compressed or not; returns (spec, text)
+    
+    A corrupt or truncated archive raises OSError, like an unreadable file.
+    """
+    with open_spec_stream(path) as f:
+        try:
+            data = f.read()
+        except OSError:
+            raise
+        except Exception as e:
+            # EOFError, zlib.error or zstandard.ZstdError from the decompressor
+            raise OSError(f"Corrupt compressed spec file: {e}") from e
+    text = data.decode("utf-8")
+    return parse_spec_text(text, is_yaml=_is_yaml_path(path)), text
+
+# ============================================================================
+# STREAMING VERIFICATION
+# ============================================================================
+
+# Specs at least this large are verified from incremental parse events
+# instead of being loaded whole (when ijson is installed)
+STREAM_THRESHOLD_BYTES = 64 * 1024 * 1024
+STREAM_CHUNK_SIZE = 1024 * 1024
+
+# Shared stand-in for streamed-away subtrees in the skeleton; never mutate
+_STREAM_PLACEHOLDER: dict = {}
+
+class StreamedSpecText:
+    """
+    Stand-in for spec_text when a spec is streamed from disk
+    
+    spec_contains() searches the file chunk by chunk, so text rules work
+    without the document ever being held in memory.
+    """
+    
+    def __init__(self, path: str):
+        self.path = path
+    
+    def contains(self, needle: str) -> bool:
+        needle = needle.lower()
+        overlap = max(0, len(needle) - 1)
+        tail = ""
+        with io.TextIOWrapper(open_spec_stream(self.path), encoding="utf-8") as f:
+            while True:
+                chunk = f.read(STREAM_CHUNK_SIZE)
+                if not chunk:
+                    return False
+                window = tail + chunk.lower()
+                if needle in window:
+                    return True
+                tail = window[-overlap:] if overlap else ""
+
+def _stream_spec(stream, skeleton: dict, on_path_item, on_component_schema) -> None:
+    """
+    Build the spec skeleton from ijson events, handing off large subtrees
+    
+    Each paths entry and components.schemas entry is built on its own, passed
+    to the callbacks, then dropped; the skeleton keeps an empty placeholder
+    under its key. Peak memory is the skeleton plus the largest single entry.
+    """
+    import ijson
+    
+    # Each frame: [container, pending key, key path]
+    stack = []
+    capture = None
+    depth = 0
+    capture_target = None
+    
+    def location() -> tuple:
+        container, key, path = stack[-1]
+        return path + ((key if isinstance(container, dict) else len(container)),)
+    
+    def attach(value) -> None:
+        container, key, _ = stack[-1]
+        if isinstance(container, dict):
+            container[key] = value
+        else:
+            container.append(value)
+    
+    for event, value in ijson.basic_parse(stream, use_float=True):
+        if capture is not None:
+            capture.event(event, value)
+            if event in ("start_map", "start_array"):
+                depth += 1
+            elif event in ("end_map", "end_array"):
+                depth -= 1
+            if depth == 0:
+                kind, key = capture_target
+                if kind == "path":
+                    on_path_item(key, capture.value)
+                else:
+                    on_component_schema(key, capture.value)
+                attach(_STREAM_PLACEHOLDER)
+                capture = None
+            continue
+        
+        if event == "map_key":
+            stack[-1][1] = value
+            continue
+        
+        if event in ("start_map", "start_array"):
+            if not stack:
+                if event != "start_map":
+                    raise ValueError("Spec must be a JSON object")
+                stack.append([skeleton, None, ()])
+                continue
+            where = location()
+            if len(where) == 2 and where[0] == "paths":
+                capture_target = ("path", where[1])
+            elif len(where) == 3 and where[:2] == ("components", "schemas"):
+                capture_target = ("schema", where[2])
+            else:
+                container = {} if event == "start_map" else []
+                attach(container)
+                stack.append([container, None, where])
+                continue
+            capture = ijson.ObjectBuilder()
+            capture.event(event, value)
+            depth = 1
+            continue
+        
+        if event in ("end_map", "end_array"):
+            stack.pop()
+            continue
+        
+        # Scalar
+        if stack:
+            attach(value)
+
+def verify_spec_stream(
+    spec_path: str,
+    constitution: dict,
+    rule_sets: tuple = ("default",)
+) -> dict:
+    """
+    Verify a spec file from incremental parse events in bounded memory
+    
+    Visitor rules receive path items and component schemas as they are
+    parsed. Document-level rules see a skeleton in which those entries are
+    empty placeholders, and text rules search the file in chunks.
+    """
+    try:
+        import ijson  # noqa: F401
+    except ImportError:
+        return {
+            "success": False,
+            "error": "ijson not installed",
+            "suggestion": "Install with: pip install ijson"
+        }
+    
+    compiled = compile_rules(constitution, rule_sets)
+    spec_text = StreamedSpecText(spec_path)
+    skeleton = {}
+    elapsed = [0.0] * len(compiled)
+    handlers, bucket = _visitor_handlers(compiled, elapsed)
+    
+    # Index $refs from streamed-away subtrees if any rule needs the index
+    refs = StreamedRefIndex() if any(definition["uses_ref_index"] for definition, _ in compiled) else None
+    
+    def on_path_item(path: str, item) -> None:
+        check_deadline()
+        walk_path_item(path, item, handlers)
+        if refs is not None:
+            pointer = f"/paths/{_escape_pointer(path)}"
+            refs.add(f"#{pointer}", pointer, item, surface=True)
+    
+    def on_component_schema(name: str, schema) -> None:
+        walk_component_schema(name, schema, handlers)
+        if refs is not None:
+            pointer = f"/components/schemas/{_escape_pointer(name)}"
+            refs.add(f"#{pointer}", pointer, schema)
+    
+    def restream(visit) -> None:
+        def on_path_item(path: str, item) -> None:
+            check_deadline()
+            pointer = f"/paths/{_escape_pointer(path)}"
+            visit(f"#{pointer}", pointer, item)
+        
+        def on_component_schema(name: str, schema) -> None:
+            pointer = f"/components/schemas/{_escape_pointer(name)}"
+            visit(f"#{pointer}", pointer, schema)
+        
+        with open_spec_stream(spec_path) as stream:
+            _stream_spec(stream, {}, on_path_item, on_component_schema)
+    
+    run_indexes = {}
+    try:
+        with open_spec_stream(spec_path) as stream:
+            _stream_spec(stream, skeleton, on_path_item, on_component_schema)
+        if refs is not None:
+            run_indexes[id(skeleton)] = refs.index(skeleton, restream)
+    except OSError as e:
+        return {
+            "success": False,
+            "error": f"Could not read spec file: {e}",
+            "suggestion": "Check the spec_path exists and is readable by the server"
+        }
+    except ImportError as e:
+        return _missing_dependency_error(e)
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        return {
+            "success": False,
+            "error": f"Spec content is not valid JSON: {e}",
+            "suggestion": "Make sure you're providing valid OpenAPI JSON"
+        }
+    
+    token = _run_ref_indexes.set(run_indexes)
+    try:
+        # Security requirements come first in walk_spec() order
+        streamed = list(bucket)
+        bucket.clear()
+        walk_document_security(skeleton, handlers)
+        partials = [*bucket, *streamed]
+        results = [None] * len(compiled)
+        _run_checks(skeleton, spec_text, compiled, results, elapsed)
+        _finish_visitors(skeleton, spec_text, compiled, partials, results, elapsed)
+    finally:
+        _run_ref_indexes.reset(token)
+    
+    _record_rule_metrics(compiled, results, elapsed)
+    return {**_score_results(compiled, results), "streamed": True}
+
+# Compressed specs are assumed to expand about this much when deciding to stream
+COMPRESSION_RATIO_ESTIMATE = 10
+
+def _should_stream(spec_path: str) -> bool:
+    """Stream JSON specs past STREAM_THRESHOLD_BYTES when ijson is available"""
+    if _is_yaml_path(spec_path):
+        return False
+    try:
+        size = os.path.getsize(spec_path)
+        if _spec_compression(spec_path):
+            size *= COMPRESSION_RATIO_ESTIMATE
+        if size < STREAM_THRESHOLD_BYTES:
+            return False
+        import ijson  # noqa: F401
+        return True
+    except (OSError, ImportError):
+        return False
+
+# ============================================================================
+# BATCH VERIFICATION
+# ============================================================================
+
+# Worker processes come from a fork server, or are spawned where there is
+# none: forking the server itself would copy its executor threads' locks
+# mid-use. The fork server preloads this module, but like spawned workers
+# each one still re-imports the main script (hence the __main__ guards), so
+# a pool costs about one import of it per worker.
+_worker_context = None
+
+def worker_context():
+    """The multiprocessing context every process pool here is created with"""
+    global _worker_context
+    if _worker_context is None:
+        import multiprocessing
+        
+        if "forkserver" in multiprocessing.get_all_start_methods():
+            _worker_context = multiprocessing.get_context("forkserver")
+            _worker_context.set_forkserver_preload([__name__])
+        else:
+            _worker_context = multiprocessing.get_context("spawn")
+    return _worker_context
+
+# Constitution handed to each batch worker process once, via the pool initializer
+_batch_constitution: Optional[dict] = None
+
+def _init_batch_worker(constitution: dict) -> None:
+    """Process pool initializer: keep the parsed constitution in the worker"""
+    global _batch_constitution
+    _batch_constitution = constitution
+
+def _verify_spec_file(path: str, constitution: Optional[dict] = None) -> dict:
+    """Verify one spec file; never raises so one bad spec can't sink a batch"""
+    if constitution is None:
+        constitution = _batch_constitution
+    if _should_stream(path):
+        return {"file": path, **verify_spec_stream(path, constitution)}
+    try:
+        spec, spec_content = read_spec_file(path)
+    except ValueError as e:
+        return {"file": path, "success": False, "error": f"Spec content is not valid JSON or YAML: {e}"}
+    except ImportError as e:
+        return {"file": path, **_missing_dependency_error(e)}
+    except Exception as e:
+        return {"file": path, "success": False, "error": str(e)}
+    
+    try:
+        return {"file": path, **_check_spec_compliance(spec, spec_content, constitution)}
+    except Exception as e:
+        return {"file": path, "success": False, "error": f"Verification failed: {e}"}
+
+def _expand_spec_paths(specs: list) -> tuple:
+    """Expand glob patterns into unique file paths; returns (files, errors)"""
+    files = []
+    errors = []
+    seen = set()
+    for pattern in specs:
+        matches = sorted(glob.glob(pattern, recursive=True)) if glob.has_magic(pattern) else [pattern]
+        matches = [m for m in matches if Path(m).is_file()]
+        outside = [m for m in matches if outside_file_root(m)]
+        if outside:
+            errors.append({"file": pattern, **file_root_error(outside)})
+            matches = [m for m in matches if m not in outside]
+        elif not matches:
+            errors.append({"file": pattern, "success": False, "error": f"No spec files matched: {pattern}"})
+        for match in matches:
+            if match not in seen:
+                seen.add(match)
+                files.append(match)
+    return files, errors
+
+# ============================================================================
+# FILE OUTPUT
+# ============================================================================
+
+_yaml_dumper = None
+
+def yaml_dumper():
+    """
+    Safe YAML dumper, through libyaml when available, that writes repeated
+    objects out in full instead of as &id001 / *id001 anchors and aliases
+    """
+    global _yaml_dumper
+    if _yaml_dumper is None:
+        import yaml
+        
+        class Dumper(getattr(yaml, "CSafeDumper", yaml.SafeDumper)):
+            def ignore_aliases(self, data) -> bool:
+                return True
+        
+        _yaml_dumper = Dumper
+    return _yaml_dumper
+
+def file_sha256(path) -> str:
+    """SHA-256 of a file, read in chunks so huge specs aren't held in memory"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _same_content(path: Path, size: int, sha256: str) -> bool:
+    """Whether path already holds exactly this content"""
+    try:
+        return path.stat().st_size == size and file_sha256(path) == sha256
+    except FileNotFoundError:
+        return False
+
+def atomic_write(output_file: Path, data: Optional[bytes] = None, writer=None, fsync: bool = False) -> dict:
+    """
+    Write a file via temp file + rename, skipping the write if nothing changed
+    
+    Pass either the bytes to write or writer(binary_file). Readers never see
+    a half-written file, and byte-identical content leaves the existing file
+    (and its mtime) alone. Returns {"unchanged": bool, "sha256": str}.
+    """
+    if data is not None:
+        sha256 = hashlib.sha256(data).hexdigest()
+        if _same_content(output_file, len(data), sha256):
+            return {"unchanged": True, "sha256": sha256}
+    
+    # os.open honours the umask, unlike tempfile's 0600 files
+    tmp_file = output_file.with_name(f".{output_file.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    fd = os.open(tmp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            if data is not None:
+                f.write(data)
+            else:
+                writer(f)
+            f.flush()
+            if fsync:
+                os.fsync(f.fileno())
+        
+        if data is None:
+            sha256 = file_sha256(tmp_file)
+            if _same_content(output_file, tmp_file.stat().st_size, sha256):
+                tmp_file.unlink()
+                return {"unchanged": True, "sha256": sha256}
+        
+        try:
+            os.chmod(tmp_file, output_file.stat().st_mode & 0o7777)
+        except FileNotFoundError:
+            pass
+        os.replace(tmp_file, output_file)
+    except BaseException:
+        tmp_file.unlink(missing_ok=True)
+        raise
+    
+    if fsync:
+        # Persist the rename itself
+        dir_fd = os.open(output_file.parent, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+    
+    return {"unchanged": False, "sha256": sha256}
+
+# ============================================================================
+# SPEC GENERATION
+# ============================================================================
+
+# Fragments every generated spec is assembled from, built once at import.
+# Generated specs reference them rather than copying, so never mutate them;
+# callers only ever receive copies (see generate_openapi_spec).
+DEFAULT_SERVERS = [
+    {"url": "https://api.example.com", "description": "Production server"}
+]
+
+HEALTH_PATH_ITEM = {
+    "get": {
+        "summary": "Health check endpoint",
+        "responses": {
+            "200": {
+                "description": "Service is healthy",
+                "content": {
+                    "application/json": {
+                        "schema": {
+                            "type": "object",
+                            "properties": {
+                                "status": {"type": "string", "example": "ok"}
+                            }
+                        }
+                    }
+                }
+            }
+        }
+    }
+}
+
+# Security schemes and document-level security per constitution auth pattern
+AUTH_FRAGMENTS = {
+    "JWT": {
+        "securitySchemes": {
+            "bearerAuth": {
+                "type": "http",
+                "scheme": "bearer",
+                "bearerFormat": "JWT"
+            }
+        },
+        "security": [{"bearerAuth": []}],
+        "requirement": [{"bearerAuth": []}]
+    },
+    "OAuth2": {
+        "securitySchemes": {
+            "oauth2": {
+                "type": "oauth2",
+                "flows": {
+                    "authorizationCode": {
+                        "authorizationUrl": "https://example.com/oauth/authorize",
+                        "tokenUrl": "https://example.com/oauth/token",
+                        "scopes": {}
+                    }
+                }
+            }
+        },
+        "security": None,
+        "requirement": [{"oauth2": []}]
+    }
+}
+NO_AUTH = {"securitySchemes": {}, "security": None, "requirement": None}
+
+# Error responses operations share by $ref, all carrying the Error schema
+ERROR_SCHEMA = {
+    "type": "object",
+    "required": ["error", "message"],
+    "properties": {
+        "error": {"type": "string", "description": "Error code"},
+        "message": {"type": "string", "description": "Error message"}
+    }
+}
+_ERRORS = (
+    ("BadRequest", "400", "Invalid request"),
+    ("Unauthorized", "401", "Missing or invalid credentials"),
+    ("NotFound", "404", "Resource not found"),
+    ("InternalError", "500", "Unexpected server error")
+)
+ERROR_RESPONSES = {
+    name: {
+        "description": description,
+        "content": {
+            "application/json": {
+                "schema": {"$ref": "#/components/schemas/Error"}
+            }
+        }
+    }
+    for name, _, description in _ERRORS
+}
+# name -> (status, $ref response)
+_ERROR_REFS = {name: (status, {"$ref": f"#/components/responses/{name}"}) for name, status, _ in _ERRORS}
+
+# Success response per method (anything else answers 200)
+SUCCESS_RESPONSES = {
+    "post": ("201", {"description": "Created"}),
+    "delete": ("204", {"description": "Deleted"})
+}
+DEFAULT_SUCCESS = ("200", {"description": "Successful response"})
+
+# One endpoint per requirements line, e.g.
+#   - POST /auth/logout - Logout (requires authentication)
+# Anchored to single lines with no nested repetition, so a document listing
+# hundreds of endpoints compiles in one linear pass
+_ENDPOINT_RE = re.compile(
+    r"^[ \t]*(?:[-*+][ \t]+|\d+[.)][ \t]+)?"
+    r"(GET|PUT|POST|DELETE|OPTIONS|HEAD|PATCH|TRACE)[ \t]+(/\S*)([^\n]*)$",
+    re.IGNORECASE | re.MULTILINE
+)
+# Opt-outs only count in the trailing note or at the start of the description,
+# so "Upload a public key" stays secured. They are removed before looking for
+# _AUTH_HINT_RE, since "no auth required" also reads as "auth required"
+_PUBLIC_HINT_RE = re.compile(r"\b(?:no auth\w*|public|unauthenticated|anonymous)\b", re.IGNORECASE)
+_AUTH_HINT_RE = re.compile(r"\b(?:requires? auth\w*|auth\w* required|authenticated|protected)\b", re.IGNORECASE)
+_TRAILING_NOTE_RE = re.compile(r"\s*\(([^()]*)\)\s*$")
+_PATH_PARAM_RE = re.compile(r"\{([^{}/]+)\}")
+_OPERATION_ID_RE = re.compile(r"[^0-9A-Za-z]+")
+
+# Generated specs, keyed by (constitution SHA-256, requirements SHA-256, title)
+GENERATED_SPECS_MAXSIZE = 1024
+_generated_specs: "OrderedDict[tuple, dict]" = OrderedDict()
+_generated_specs_lock = threading.Lock()
+_generated_specs_stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+def generation_cache_info() -> dict:
+    """Return hit/miss counters and current size of the generated-spec cache"""
+    with _generated_specs_lock:
+        return {
+            **_generated_specs_stats,
+            "currsize": len(_generated_specs),
+            "maxsize": GENERATED_SPECS_MAXSIZE
+        }
+
+def spec_template(constitution: Optional[dict]) -> dict:
+    """The frozen fragments a constitution contributes to every spec generated under it"""
+    auth = (constitution or {}).get("patterns", {}).get("auth")
+    return {
+        "servers": DEFAULT_SERVERS,
+        "paths": {"/health": HEALTH_PATH_ITEM},
+        **AUTH_FRAGMENTS.get(auth, NO_AUTH)
+    }
+
+def _endpoint_hints(text: str) -> tuple:
+    """Summary and auth hint ("required", "public" or None) from the text after an endpoint's path"""
+    summary = text.strip().lstrip("-–—:").strip()
+    note = _TRAILING_NOTE_RE.search(summary)
+    if note:
+        # Drop a trailing "(requires authentication)": security says it already
+        if _AUTH_HINT_RE.search(_PUBLIC_HINT_RE.sub("", note.group(1))):
+            return summary[:note.start()], "required"
+        if _PUBLIC_HINT_RE.search(note.group(1)):
+            return summary[:note.start()], "public"
+    # An explicit auth hint anywhere beats an incidental "public"
+    if _AUTH_HINT_RE.search(_PUBLIC_HINT_RE.sub("", summary)):
+        return summary, "required"
+    if _PUBLIC_HINT_RE.match(summary):
+        return summary, "public"
+    return summary, None
+
+def compile_requirements(requirements: str, template: dict) -> dict:
+    """
+    Compile the endpoint lines of a requirements text into path items
+    
+    Endpoints asking for authentication get the constitution's security
+    requirement; public ones opt out of document-level security. Every
+    compiled operation owns its containers, and a template operation listed
+    again (GET /health) keeps its definition, with only security applied.
+    """
+    paths = dict(template["paths"])
+    requirement = template["requirement"]
+    secured_by_default = template["security"] is not None
+    seen = set()
+    errors = set()
+    unsecured = 0
+    
+    for match in _ENDPOINT_RE.finditer(requirements):
+        method = match.group(1).lower()
+        path = match.group(2).rstrip(".,;:")
+        if (path, method) in seen:
+            continue
+        seen.add((path, method))
+        summary, auth = _endpoint_hints(match.group(3))
+        
+        item = paths.get(path)
+        if item is None:
+            item = {}
+            params = _PATH_PARAM_RE.findall(path)
+            if params:
+                item["parameters"] = [
+                    {"name": name, "in": "path", "required": True, "schema": {"type": "string"}}
+                    for name in params
+                ]
+        elif item is template["paths"].get(path):
+            item = dict(item)  # never write into a template path item
+        paths[path] = item
+        
+        if method in item:
+            operation = dict(item[method])
+        else:
+            status, success = SUCCESS_RESPONSES.get(method, DEFAULT_SUCCESS)
+            names = []
+            if method in ("post", "put", "patch"):
+                names.append("BadRequest")
+            if auth == "required" or (auth is None and secured_by_default):
+                names.append("Unauthorized")
+            if "{" in path:
+                names.append("NotFound")
+            names.append("InternalError")
+            errors.update(names)
+            # Fresh containers per operation: a caller editing one operation
+            # must not edit them all, and YAML output must not grow aliases
+            operation = {
+                "summary": summary or f"{method.upper()} {path}",
+                "operationId": _OPERATION_ID_RE.sub("_", f"{method}{path}").strip("_"),
+                "responses": {
+                    status: dict(success),
+                    **{_ERROR_REFS[name][0]: dict(_ERROR_REFS[name][1]) for name in names}
+                }
+            }
+        
+        if auth == "required":
+            if requirement is None:
+                unsecured += 1
+            else:
+                operation["security"] = [{name: list(scopes) for name, scopes in entry.items()} for entry in requirement]
+        elif auth == "public" and secured_by_default:
+            operation["security"] = []
+        item[method] = operation
+    
+    return {
+        "paths": paths,
+        "errors": [name for name in ERROR_RESPONSES if name in errors],
+        "endpoints": len(seen),
+        "unsecured": unsecured
+    }
+
+def build_spec(template: dict, compiled: dict, requirements: str, title: Optional[str]) -> dict:
+    """Assemble a spec: fresh top-level containers around the template's shared fragments"""
+    spec = {
+        "openapi": "3.1.0",
+        "info": {
+            "title": title or "Generated API",
+            "version": "1.0.0",
+            "description": requirements
+        },
+        "servers": template["servers"],
+        "paths": compiled["paths"],
+        "components": {
+            "schemas": {},
+            "securitySchemes": dict(template["securitySchemes"])
+        }
+    }
+    if compiled["errors"]:
+        spec["components"]["schemas"]["Error"] = ERROR_SCHEMA
+        spec["components"]["responses"] = {name: ERROR_RESPONSES[name] for name in compiled["errors"]}
+    if template["security"] is not None:
+        spec["security"] = template["security"]
+    return spec
+
+def _generate_spec(constitution: Optional[dict], constitution_hash: Optional[str], requirements: str, title: Optional[str]) -> dict:
+    """
+    Generate (or recall) a spec with its JSON and canonical JSON
+    
+    The returned entry is shared and frozen - callers must not mutate it.
+    """
+    key = (constitution_hash, hashlib.sha256(requirements.encode()).hexdigest(), title)
+    with _generated_specs_lock:
+        entry = _generated_specs.get(key)
+        if entry is not None:
+            _generated_specs.move_to_end(key)
+            _generated_specs_stats["hits"] += 1
+            return entry
+        _generated_specs_stats["misses"] += 1
+    
+    template = spec_template(constitution)
+    compiled = compile_requirements(requirements, template)
+    spec = build_spec(template, compiled, requirements, title)
+    entry = {
+        "spec": spec,
+        "endpoints": compiled["endpoints"],
+        "unsecured": compiled["unsecured"],
+        "json": specmcp_json.dumpb(spec),
+        "canonical": specmcp_json.dumpb(spec, sort_keys=True)
+    }
+    
+    with _generated_specs_lock:
+        _generated_specs[key] = entry
+        _generated_specs.move_to_end(key)
+        while len(_generated_specs) > GENERATED_SPECS_MAXSIZE:
+            _generated_specs.popitem(last=False)
+            _generated_specs_stats["evictions"] += 1
+    return entry
+
+# ============================================================================
+# MANIFEST GENERATION
+# ============================================================================
+
+# Constitution and its SHA-256 handed to each manifest worker once, via the
+# pool initializer
+_manifest_constitution: Optional[tuple] = None
+
+def _init_manifest_worker(constitution: dict, constitution_hash: str) -> None:
+    """Process pool initializer: keep the parsed constitution in the worker"""
+    global _manifest_constitution
+    _manifest_constitution = (constitution, constitution_hash)
+
+def load_manifest(path: str) -> dict:
+    """
+    Read a JSON/YAML manifest of services to generate
+    
+    Relative paths in the manifest are resolved against its directory.
+    Returns the services to generate, or a tool-style failure dict.
+    """
+    try:
+        manifest, _ = read_spec_file(path)
+    except OSError as e:
+        return {
+            "success": False,
+            "error": f"Could not read manifest: {e}",
+            "suggestion": "Check the manifest_path exists and is readable"
+        }
+    except ImportError as e:
+        return _missing_dependency_error(e)
+    except ValueError as e:
+        return {
+            "success": False,
+            "error": f"Manifest is not valid JSON or YAML: {e}",
+            "suggestion": "The manifest must be an object with a services list"
+        }
+    
+    base = Path(path).parent
+    entries = manifest.get("services")
+    if not isinstance(entries, list) or not entries:
+        return {
+            "success": False,
+            "error": "Manifest has no services",
+            "suggestion": "Add services: [{title, requirements, output}, ...]"
+        }
+    
+    services = []
+    problems = []
+    outputs = set()
+    for index, entry in enumerate(entries):
+        if not isinstance(entry, dict) or not entry.get("output") or not (
+            isinstance(entry.get("requirements"), str) or entry.get("requirements_file")
+        ):
+            problems.append(f"services[{index}] needs output and requirements (or requirements_file)")
+            continue
+        output = str(base / entry["output"])
+        if output in outputs:
+            problems.append(f"services[{index}] writes {output}, like an earlier service")
+            continue
+        outputs.add(output)
+        services.append({
+            "title": entry.get("title") or Path(output).stem,
+            "requirements": entry.get("requirements"),
+            "requirements_file": str(base / entry["requirements_file"]) if entry.get("requirements_file") else None,
+            "output": output,
+            "format": entry.get("format") or manifest.get("format") or ("yaml" if _is_yaml_path(output) else "json")
+        })
+    if problems:
+        return {
+            "success": False,
+            "error": f"{len(problems)} invalid service(s) in manifest",
+            "details": problems,
+            "suggestion": "Give every service an output path and requirements"
+        }
+    
+    constitution = manifest.get("constitution") or None
+    if isinstance(constitution, list):
+        constitution = [str(base / layer) for layer in constitution]
+    elif constitution:
+        constitution = str(base / constitution)
+    report = str(base / manifest["report"]) if manifest.get("report") else None
+    
+    paths = [*(constitution if isinstance(constitution, list) else [constitution]), report]
+    for service in services:
+        paths += [service["output"], service["requirements_file"]]
+    outside = [path for path in paths if path is not None and outside_file_root(path)]
+    if outside:
+        return {
+            **file_root_error(outside),
+            "suggestion": "Keep every path the manifest names under the server's --root"
+        }
+    
+    return {
+        "success": True,
+        "services": services,
+        "constitution": constitution,
+        "report": report
+    }
+
+def _generate_service(service: dict, constitution: Optional[dict] = None, constitution_hash: Optional[str] = None) -> dict:
+    """Generate, save and verify one manifest service; never raises so one bad service can't sink a run"""
+    if constitution is None:
+        constitution, constitution_hash = _manifest_constitution
+    result = {"title": service["title"], "output": service["output"]}
+    try:
+        requirements = service["requirements"]
+        if requirements is None:
+            requirements = Path(service["requirements_file"]).read_text()
+        generated = _generate_spec(constitution, constitution_hash, requirements, service["title"])
+        saved = save_spec_to_file(spec=generated["spec"], output_path=service["output"], format=service["format"])
+        if not saved.get("success"):
+            return {**result, **saved}
+        report = _check_spec_compliance(generated["spec"], None, constitution)
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        return {**result, "success": False, "error": str(e)}
+    
+    return {
+        **result,
+        "success": True,
+        "endpoints": generated["endpoints"],
+        "unchanged": saved["unchanged"],
+        "sha256": saved["sha256"],
+        "compliance_score": report["compliance_score"],
+        "is_compliant": report["is_compliant"],
+        "violations": report["violations"]
+    }
+
+# ============================================================================
+# DEADLINES
+# ============================================================================
+
+class DeadlineExceeded(Exception):
+    """Raised at a cancellation point once the current call's deadline has passed"""
+
+# Absolute time.monotonic() deadline of the current tool call, or None
+_call_deadline: ContextVar = ContextVar("_call_deadline", default=None)
+
+def check_deadline() -> None:
+    """Cancellation point: raise DeadlineExceeded if the current call is out of time"""
+    deadline = _call_deadline.get()
+    if deadline is not None and time.monotonic() > deadline:
+        raise DeadlineExceeded()
+
+# ============================================================================
+# METRICS
+# ============================================================================
+
+# Upper bounds (seconds) of the latency histogram buckets; the last bucket is +Inf
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# kind ("tool" or "rule") -> name -> series
+_metrics: dict = {"tool": {}, "rule": {}}
+_metrics_lock = threading.Lock()
+
+def _observe(kind: str, name: str, seconds: float, errors: int = 0, violations: Optional[int] = None) -> None:
+    """Record one call of a tool or rule"""
+    with _metrics_lock:
+        series = _metrics[kind].get(name)
+        if series is None:
+            series = _metrics[kind][name] = {
+                "calls": 0,
+                "errors": 0,
+                "seconds": 0.0,
+                "max_seconds": 0.0,
+                "buckets": [0] * (len(LATENCY_BUCKETS) + 1)
+            }
+            if violations is not None:
+                series["violations"] = 0
+        series["calls"] += 1
+        series["errors"] += errors
+        series["seconds"] += seconds
+        series["max_seconds"] = max(series["max_seconds"], seconds)
+        series["buckets"][bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        if violations is not None:
+            series["violations"] += violations
+
+def _record_rule_metrics(compiled: list, results: list, elapsed: list) -> None:
+    """Record one run of every compiled rule: time spent and violations found"""
+    for (definition, _), found, seconds in zip(compiled, results, elapsed):
+        _observe("rule", definition["name"], seconds, violations=len(found or ()))
+
+# ============================================================================
+# OPERATIONS
+# ============================================================================
+
+def parse_constitution(path: Union[str, list[str]] = ".specify/constitution.md") -> dict:
+    """
+    Parse a SpecKit constitution.md file and extract structured information
+    
+    Args:
+        path: Path to constitution.md file (default: .specify/constitution.md), or a
+            stack of them, org-wide layer first; later layers override field by field
+        
+    Returns:
+        Structured constitution data including tech stack, patterns, and principles
+    """
+    # Call internal helper function; copy so callers can't mutate the cache
+    return copy.deepcopy(_parse_constitution_internal(path))
+
+def generate_openapi_spec(
+    requirements: str,
+    constitution_path: Optional[Union[str, list[str]]] = None,
+    title: Optional[str] = None,
+    include_spec: bool = True
+) -> dict:
+    """
+    Generate an OpenAPI 3.1 specification from natural language requirements
+    
+    Args:
+        requirements: Natural language description of what to build. Lines like
+            "POST /users - Create a user (requires authentication)" become endpoints
+        constitution_path: Optional path to constitution.md to follow constraints,
+            or a stack of them (org-wide layer first)
+        title: Optional API title (auto-generated if not provided)
+        include_spec: Return the full specification; set False to get only
+            spec_handle for use with the other tools
+        
+    Returns:
+        OpenAPI 3.1 specification and a spec_handle referencing it server-side
+    """
+    # Parse constitution if provided (use internal helper)
+    constitution = None
+    constitution_hash = None
+    if constitution_path:
+        result = _parse_constitution_internal(constitution_path)
+        if result.get("success"):
+            constitution = result["constitution"]
+            constitution_hash = result["metadata"]["sha256"]
+    
+    generated = _generate_spec(constitution, constitution_hash, requirements, title)
+    endpoints = generated["endpoints"]
+    
+    notes = [
+        "Basic OpenAPI 3.1 specification generated",
+        f"{endpoints} endpoint(s) compiled from the requirements" if endpoints else "Add more endpoints based on your requirements",
+        "Authentication configured" if constitution else "No authentication configured"
+    ]
+    if generated["unsecured"]:
+        notes.append(f"{generated['unsecured']} endpoint(s) require authentication, but the constitution names no auth pattern")
+    
+    result = {
+        "success": True,
+        "spec_handle": spec_store_put(generated["spec"], canonical=generated["canonical"], frozen=True),
+        "format": "openapi-3.1",
+        "constitution_applied": constitution is not None,
+        "endpoints": endpoints,
+        "notes": notes
+    }
+    if include_spec:
+        # The caller's own copy, decoded from JSON: far cheaper than deepcopy,
+        # and edits can't reach the memoized spec or its shared fragments
+        result["specification"] = specmcp_json.loads(generated["json"])
+    
+    return result
+
+def verify_spec_compliance(
+    spec_content: Optional[str] = None,
+    constitution_path: Union[str, list[str]] = ".specify/constitution.md",
+    spec_path: Optional[str] = None,
+    spec: Optional[dict] = None,
+    spec_handle: Optional[str] = None,
+    stream: Optional[bool] = None
+) -> dict:
+    """
+    Verify that a specification follows constitution rules
+    
+    Args:
+        spec_content: The specification content (JSON or YAML)
+        constitution_path: Path to constitution.md, or a stack of them (org-wide layer first)
+        spec_path: Path to a JSON/YAML spec file the server reads directly, optionally
+            gzip/zstd-compressed (instead of spec_content)
+        spec: An already-parsed spec object (instead of spec_content)
+        spec_handle: Handle of a spec held by the server (instead of spec_content)
+        stream: Verify spec_path from parse events without loading it whole
+            (default: automatic for very large files when ijson is installed)
+        
+    Returns:
+        Compliance report with violations and score
+    """
+    # Parse constitution using internal helper (NOT the MCP tool)
+    constitution_result = _parse_constitution_internal(constitution_path)
+    
+    if not constitution_result.get("success"):
+        return {
+            "success": False,
+            "error": "Could not parse constitution",
+            "details": constitution_result.get("error")
+        }
+    
+    if stream is None:
+        stream = spec_path is not None and _should_stream(spec_path)
+    if stream:
+        if spec_path is None or any(v is not None for v in (spec_content, spec, spec_handle)):
+            return {
+                "success": False,
+                "error": "Streaming verification needs spec_path and no other spec input",
+                "suggestion": "Pass the spec file as spec_path"
+            }
+        return verify_spec_stream(spec_path, constitution_result["constitution"])
+    
+    spec, spec_text, error = _load_spec_input(spec_content, spec_path, spec, spec_handle)
+    if error:
+        return error
+    
+    return _check_spec_compliance(spec, spec_text, constitution_result["constitution"])
+
+def store_spec(
+    spec_content: Optional[str] = None,
+    spec_path: Optional[str] = None,
+    spec: Optional[dict] = None
+) -> dict:
+    """
+    Keep a specification on the server and get a short handle for it
+    
+    Args:
+        spec_content: The specification content (JSON or YAML)
+        spec_path: Path to a JSON/YAML spec file (optionally gzip/zstd-compressed)
+        spec: An already-parsed spec object
+        
+    Returns:
+        spec_handle to pass to verify_spec_compliance, save_spec_to_file or get_spec
+    """
+    spec, _, error = _load_spec_input(spec_content, spec_path, spec)
+    if error:
+        return error
+    
+    handle = spec_store_put(spec)
+    return {
+        "success": True,
+        "spec_handle": handle,
+        "store": spec_store_info()
+    }
+
+def get_spec(spec_handle: str) -> dict:
+    """
+    Fetch a specification held on the server by its handle
+    
+    Args:
+        spec_handle: Handle returned by generate_openapi_spec or store_spec
+        
+    Returns:
+        The full specification
+    """
+    spec, _, error = _load_spec_input(spec_handle=spec_handle)
+    if error:
+        return error
+    
+    return {
+        "success": True,
+        "spec_handle": spec_handle,
+        "specification": copy.deepcopy(spec)
+    }
+
+def save_spec_to_file(
+    spec_content: Optional[str] = None,
+    output_path: Optional[str] = None,
+    format: str = "json",
+    spec_path: Optional[str] = None,
+    spec: Optional[dict] = None,
+    spec_handle: Optional[str] = None,
+    fsync: bool = False
+) -> dict:
+    """
+    Save a specification to a file
+    
+    Args:
+        spec_content: The specification content (JSON or YAML)
+        output_path: Where to save the file (e.g., "specs/api.json")
+        format: Output format - "json" or "yaml" (default: json)
+        spec_path: Path to a JSON/YAML spec file the server reads directly, optionally
+            gzip/zstd-compressed (instead of spec_content)
+        spec: An already-parsed spec object (instead of spec_content)
+        spec_handle: Handle of a spec held by the server (instead of spec_content)
+        fsync: Flush the file to disk before reporting success
+        
+    Returns:
+        Success status, file location and whether the file was left unchanged
+    """
+    if not output_path:
+        return {
+            "success": False,
+            "error": "output_path is required",
+            "suggestion": "Pass where to save the file (e.g., \"specs/api.json\")"
+        }
+    
+    try:
+        output_file = Path(output_path)
+        
+        # Parse spec
+        spec, _, error = _load_spec_input(spec_content, spec_path, spec, spec_handle)
+        if error:
+            return error
+        
+        # Create parent directories if needed
+        output_file.parent.mkdir(parents=True, exist_ok=True)
+        
+        # Write file (atomically; identical content is left untouched)
+        if format == "json":
+            data = specmcp_json.dumpb(spec, indent=2)
+            check_deadline()
+            written = atomic_write(output_file, data=data, fsync=fsync)
+        elif format == "yaml":
+            try:
+                import yaml
+                
+                Dumper = yaml_dumper()
+                
+                def write_yaml(f) -> None:
+                    check_deadline()
+                    # Stream straight to the file, through libyaml when available
+                    text = io.TextIOWrapper(f, encoding="utf-8", write_through=True)
+                    yaml.dump(
+                        spec, text,
+                        Dumper=Dumper,
+                        default_flow_style=False,
+                        sort_keys=False
+                    )
+                    text.flush()
+                    text.detach()  # leave f open for atomic_write
+                
+                written = atomic_write(output_file, writer=write_yaml, fsync=fsync)
+            except ImportError:
+                return {
+                    "success": False,
+                    "error": "PyYAML not installed",
+                    "suggestion": "Install with: pip install pyyaml"
+                }
+        else:
+            return {
+                "success": False,
+                "error": f"Unsupported format: {format}",
+                "suggestion": "Use 'json' or 'yaml'"
+            }
+        
+        return {
+            "success": True,
+            "file_path": str(output_file.absolute()),
+            "file_size": output_file.stat().st_size,
+            "format": format,
+            "unchanged": written["unchanged"],
+            "sha256": written["sha256"],
+            "message": f"✅ Spec {'already up to date at' if written['unchanged'] else 'saved to'} {output_path}"
+        }
+        
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        return {
+            "success": False,
+            "error": str(e),
+            "suggestion": "Check file path and permissions"
+        }
+
+def generate_from_manifest(
+    manifest_path: str,
+    constitution_path: Optional[Union[str, list[str]]] = None,
+    max_workers: Optional[int] = None,
+    report_path: Optional[str] = None
+) -> dict:
+    """
+    Generate, save and verify every service listed in a manifest, in parallel
+    
+    Args:
+        manifest_path: JSON/YAML manifest: {constitution?, report?, format?,
+            services: [{title, requirements or requirements_file, output, format?}]}
+        constitution_path: Path to constitution.md, or a stack of them (default:
+            the manifest's constitution, else .specify/constitution.md)
+        max_workers: Worker processes to use (default: one per CPU core)
+        report_path: Where to write the summary report (default: the manifest's
+            report, else <manifest>.report.json next to it)
+        
+    Returns:
+        Per-service results in manifest order plus an aggregate summary
+    """
+    start = time.perf_counter()
+    manifest = load_manifest(manifest_path)
+    if not manifest.get("success"):
+        return manifest
+    services = manifest["services"]
+    
+    constitution_path = constitution_path or manifest["constitution"] or ".specify/constitution.md"
+    constitution_result = _parse_constitution_internal(constitution_path)
+    if not constitution_result.get("success"):
+        return {
+            "success": False,
+            "error": "Could not parse constitution",
+            "details": constitution_result.get("error")
+        }
+    constitution = constitution_result["constitution"]
+    metadata = constitution_result["metadata"]
+    constitution_hash = metadata["sha256"]
+    
+    workers = max(1, min(max_workers or os.cpu_count() or 1, len(services)))
+    results = []
+    if workers == 1:
+        # Not worth spawning processes for a single worker
+        for service in services:
+            check_deadline()
+            results.append(_generate_service(service, constitution, constitution_hash))
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=worker_context(),
+            initializer=_init_manifest_worker,
+            initargs=(constitution, constitution_hash)
+        ) as pool:
+            try:
+                for result in pool.map(_generate_service, services, chunksize=max(1, len(services) // (workers * 4))):
+                    check_deadline()
+                    results.append(result)
+            except DeadlineExceeded:
+                pool.shutdown(wait=False, cancel_futures=True)
+                raise
+    
+    scores = [r["compliance_score"] for r in results if r.get("success")]
+    failed = sum(1 for r in results if not r.get("success"))
+    compliant = sum(1 for r in results if r.get("is_compliant"))
+    unchanged = sum(1 for r in results if r.get("unchanged"))
+    aggregate = round(sum(scores) / len(scores), 1) if scores else 0
+    seconds = round(time.perf_counter() - start, 2)
+    report_file = Path(report_path or manifest["report"] or Path(manifest_path).with_suffix(".report.json"))
+    
+    report = {
+        "success": True,
+        "manifest": str(Path(manifest_path).absolute()),
+        "constitution": [layer["file_path"] for layer in metadata["layers"]] if "layers" in metadata else metadata["file_path"],
+        "total": len(results),
+        "generated": len(scores),
+        "unchanged": unchanged,
+        "compliant": compliant,
+        "errors": failed,
+        "aggregate_score": aggregate,
+        "workers": workers,
+        "seconds": seconds,
+        "report_path": str(report_file.absolute()),
+        "results": results,
+        "summary": (
+            f"{len(scores)}/{len(results)} generated ({unchanged} unchanged) | {compliant} compliant | "
+            f"average score {aggregate}/100 | {failed} error(s) | {seconds}s on {workers} worker(s)"
+        )
+    }
+    try:
+        report_file.parent.mkdir(parents=True, exist_ok=True)
+        atomic_write(report_file, data=specmcp_json.dumpb(report, indent=2))
+    except OSError as e:
+        return {
+            **report,
+            "success": False,
+            "error": f"Could not write report: {e}",
+            "suggestion": "Check report_path is writable"
+        }
+    return report
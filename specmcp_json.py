@@ -0,0 +1,74 @@
+# specmcp_json.py
+
+"""
+JSON serialization layer for SpecMCP
+
+Uses orjson when it is installed and the stdlib json module otherwise. Both
+backends produce the same text for the same options - UTF-8 output (no
+\\u escapes), compact separators unless indent is given, optional sorted
+keys - apart from float exponents (1e20 vs 1e+20), which parse identically.
+Integers beyond 64 bits stay exact either way: loads() hands input that
+could hold one to the stdlib, and dumpb() does the same for such values.
+Set SPECMCP_JSON_BACKEND=stdlib to force the fallback.
+"""
+
+import json
+import os
+from typing import Any, Union
+
+try:
+    if os.environ.get("SPECMCP_JSON_BACKEND", "").lower() == "stdlib":
+        raise ImportError("stdlib JSON backend requested")
+    import orjson
+except ImportError:
+    orjson = None
+
+BACKEND = "orjson" if orjson is not None else "stdlib"
+
+# Raised by loads() for malformed input, whichever backend is active
+# (orjson.JSONDecodeError subclasses it)
+JSONDecodeError = json.JSONDecodeError
+
+# orjson turns integers outside the 64-bit range into floats without a word
+# (18446744073709551616 -> 1.8446744073709552e+19). Any such literal has at
+# least 19 digits in a row, so inputs with a run that long go to the stdlib,
+# which keeps integers exact. Mapping every byte to "0" (digit) or " " and
+# searching for 19 zeros adds well under a tenth to the parse.
+_DIGIT_MAP = bytes(0x30 if 0x30 <= byte <= 0x39 else 0x20 for byte in range(256))
+_LONG_DIGIT_RUN = b"0" * 19
+
+def loads(data: Union[str, bytes]) -> Any:
+    """Parse JSON text or UTF-8 bytes"""
+    if orjson is not None:
+        try:
+            raw = data.encode() if isinstance(data, str) else bytes(data)
+        except UnicodeEncodeError:
+            return orjson.loads(data)  # lone surrogates: let orjson report them
+        if raw.translate(_DIGIT_MAP).find(_LONG_DIGIT_RUN) < 0:
+            return orjson.loads(raw)
+    return json.loads(data)
+
+def dumpb(obj: Any, indent: int = None, sort_keys: bool = False) -> bytes:
+    """Serialize to UTF-8 JSON bytes"""
+    if orjson is not None and indent in (None, 2):
+        option = 0
+        if indent == 2:
+            option |= orjson.OPT_INDENT_2
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        try:
+            return orjson.dumps(obj, option=option)
+        except TypeError:
+            pass  # e.g. non-str keys or big ints - the stdlib copes
+    return _stdlib_dumps(obj, indent, sort_keys).encode()
+
+def dumps(obj: Any, indent: int = None, sort_keys: bool = False) -> str:
+    """Serialize to JSON text"""
+    if orjson is not None and indent in (None, 2):
+        return dumpb(obj, indent, sort_keys).decode()
+    return _stdlib_dumps(obj, indent, sort_keys)
+
+def _stdlib_dumps(obj: Any, indent: int, sort_keys: bool) -> str:
+    """stdlib encoding with orjson-compatible formatting"""
+    separators = (",", ": ") if indent is not None else (",", ":")
+    return json.dumps(obj, indent=indent, sort_keys=sort_keys, separators=separators, ensure_ascii=False)
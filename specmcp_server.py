@@ -1,454 +1,850 @@
 # specmcp_server.py
 
-from fastmcp import FastMCP
+from fastmcp import FastMCP, Context
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Optional
-import json
-import re
+from typing import Optional, Union
+import argparse
+import asyncio
+import copy
+import functools
+import inspect
+import os
+import threading
+import time
+import weakref
+from contextvars import copy_context
+
+import specmcp_core
+from specmcp_core import (
+    LATENCY_BUCKETS,
+    DeadlineExceeded,
+    _call_deadline,
+    _expand_spec_paths,
+    _init_batch_worker,
+    _metrics,
+    _metrics_lock,
+    _observe,
+    _parse_constitution_internal,
+    _verify_spec_file,
+    atomic_write,
+    check_deadline,
+    compiled_rules_info,
+    constitution_cache_info,
+    constitution_stack_cache_info,
+    file_root,
+    file_root_error,
+    generation_cache_info,
+    outside_file_root,
+    spec_store_info,
+    subtree_cache_info,
+    worker_context,
+)
 
 mcp = FastMCP("SpecMCP - Spec-Driven Development Tools")
 
 # ============================================================================
-# HELPER FUNCTIONS (Not MCP tools - just regular Python functions)
+# METRICS
 # ============================================================================
 
-def _parse_constitution_internal(path: str) -> dict:
-    """Internal helper to parse constitution (not an MCP tool)"""
-    constitution_path = Path(path)
+# When set, metrics are mirrored to this Prometheus textfile (for the
+# node_exporter textfile collector) at most every METRICS_TEXTFILE_INTERVAL seconds
+METRICS_TEXTFILE = os.environ.get("SPECMCP_METRICS_TEXTFILE")
+METRICS_TEXTFILE_INTERVAL = 15.0
+
+_metrics_started = time.time()
+_metrics_textfile_written = float("-inf")
+
+def _is_failure(result) -> bool:
+    return isinstance(result, dict) and result.get("success") is False
+
+def instrumented(func):
+    """
+    Count calls, failures and latency of a tool
+    
+    A call fails when it raises or returns {"success": False}. While a
+    profiling session is armed the call also runs under cProfile.
+    """
+    name = func.__name__
+    
+    if asyncio.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            profiler = _profile_begin(name) if _profile_session is not None else None
+            start = time.perf_counter()
+            failed = 1
+            try:
+                result = await func(*args, **kwargs)
+                failed = int(_is_failure(result))
+                return result
+            finally:
+                if profiler is not None:
+                    _profile_end(profiler)
+                _observe("tool", name, time.perf_counter() - start, errors=failed)
+                _refresh_metrics_textfile()
+        return async_wrapper
+    
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        profiler = _profile_begin(name) if _profile_session is not None else None
+        start = time.perf_counter()
+        failed = 1
+        try:
+            result = func(*args, **kwargs)
+            failed = int(_is_failure(result))
+            return result
+        finally:
+            if profiler is not None:
+                _profile_end(profiler)
+            _observe("tool", name, time.perf_counter() - start, errors=failed)
+            _refresh_metrics_textfile()
+    return wrapper
+
+def _hit_rate(hits: int, misses: int) -> Optional[float]:
+    return round(hits / (hits + misses), 4) if hits + misses else None
+
+def cache_metrics() -> dict:
+    """Counters of every cache in the server, each with its hit rate"""
+    caches = {
+        "constitution": constitution_cache_info(),
+        "constitution_stack": constitution_stack_cache_info(),
+        "compiled_rules": compiled_rules_info(),
+        "generation": generation_cache_info(),
+        "subtree": subtree_cache_info(),
+        "spec_store": spec_store_info()
+    }
+    for info in caches.values():
+        info["hit_rate"] = _hit_rate(info["hits"], info["misses"])
+    caches["subtree"]["ref_hit_rate"] = _hit_rate(caches["subtree"]["ref_hits"], caches["subtree"]["ref_misses"])
+    return caches
+
+def _latency_quantile(buckets: list, calls: int, q: float) -> Optional[float]:
+    """Upper bound (ms) of the bucket holding the q-quantile; None past the last bound"""
+    rank = q * calls
+    seen = 0
+    for bound, count in zip(LATENCY_BUCKETS, buckets):
+        seen += count
+        if seen >= rank:
+            return bound * 1000
+    return None
+
+def metrics_snapshot() -> dict:
+    """Per-tool and per-rule series with derived latency figures, plus cache counters"""
+    with _metrics_lock:
+        kinds = {kind: copy.deepcopy(series) for kind, series in _metrics.items()}
+    
+    for series_by_name in kinds.values():
+        for series in series_by_name.values():
+            calls = series["calls"]
+            series["mean_ms"] = round(series["seconds"] * 1000 / calls, 3) if calls else 0.0
+            series["max_ms"] = round(series.pop("max_seconds") * 1000, 3)
+            series["p50_ms_le"] = _latency_quantile(series["buckets"], calls, 0.50)
+            series["p99_ms_le"] = _latency_quantile(series["buckets"], calls, 0.99)
+            # Cumulative, as in a Prometheus histogram
+            cumulative = 0
+            buckets = {}
+            for bound, count in zip((*LATENCY_BUCKETS, "+Inf"), series["buckets"]):
+                cumulative += count
+                buckets[str(bound)] = cumulative
+            series["buckets"] = buckets
+    
+    return {
+        "uptime_seconds": round(time.time() - _metrics_started, 1),
+        "tools": kinds["tool"],
+        "rules": kinds["rule"],
+        "caches": cache_metrics(),
+        "admission": admission_info()
+    }
+
+def _prometheus_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def prometheus_text(snapshot: Optional[dict] = None) -> str:
+    """Render a metrics snapshot in the Prometheus text exposition format"""
+    snapshot = snapshot or metrics_snapshot()
+    lines = [
+        "# HELP specmcp_uptime_seconds Seconds since the server started",
+        "# TYPE specmcp_uptime_seconds gauge",
+        f"specmcp_uptime_seconds {snapshot['uptime_seconds']}"
+    ]
+    
+    for kind, label in (("tools", "tool"), ("rules", "rule")):
+        series_by_name = snapshot[kind]
+        lines += [
+            f"# HELP specmcp_{label}_calls_total {label.capitalize()} calls",
+            f"# TYPE specmcp_{label}_calls_total counter"
+        ]
+        lines += [f'specmcp_{label}_calls_total{{{label}="{_prometheus_label(name)}"}} {s["calls"]}' for name, s in series_by_name.items()]
+        if kind == "tools":
+            lines += ["# HELP specmcp_tool_errors_total Tool calls that raised or returned success=false", "# TYPE specmcp_tool_errors_total counter"]
+            lines += [f'specmcp_tool_errors_total{{tool="{_prometheus_label(name)}"}} {s["errors"]}' for name, s in series_by_name.items()]
+        else:
+            lines += ["# HELP specmcp_rule_violations_total Violations reported by a rule", "# TYPE specmcp_rule_violations_total counter"]
+            lines += [f'specmcp_rule_violations_total{{rule="{_prometheus_label(name)}"}} {s["violations"]}' for name, s in series_by_name.items()]
+        
+        metric = f"specmcp_{label}_duration_seconds"
+        lines += [f"# HELP {metric} {label.capitalize()} latency", f"# TYPE {metric} histogram"]
+        for name, s in series_by_name.items():
+            name = _prometheus_label(name)
+            for bound, count in s["buckets"].items():
+                lines.append(f'{metric}_bucket{{{label}="{name}",le="{bound}"}} {count}')
+            lines.append(f'{metric}_sum{{{label}="{name}"}} {s["seconds"]}')
+            lines.append(f'{metric}_count{{{label}="{name}"}} {s["calls"]}')
+    
+    for counter in ("hits", "misses"):
+        lines += [f"# HELP specmcp_cache_{counter}_total Cache {counter}", f"# TYPE specmcp_cache_{counter}_total counter"]
+        lines += [f'specmcp_cache_{counter}_total{{cache="{name}"}} {info[counter]}' for name, info in snapshot["caches"].items()]
+    
+    admission = snapshot["admission"]
+    lines += [
+        "# HELP specmcp_calls_in_flight Admitted tool calls running or queued",
+        "# TYPE specmcp_calls_in_flight gauge",
+        f"specmcp_calls_in_flight {admission['in_flight']}",
+        "# HELP specmcp_calls_rejected_total Tool calls rejected because the queue was full",
+        "# TYPE specmcp_calls_rejected_total counter",
+        f"specmcp_calls_rejected_total {admission['rejected']}",
+        "# HELP specmcp_calls_deadline_exceeded_total Tool calls cancelled at their deadline",
+        "# TYPE specmcp_calls_deadline_exceeded_total counter",
+        f"specmcp_calls_deadline_exceeded_total {admission['deadline_exceeded']}"
+    ]
+    return "\n".join(lines) + "\n"
+
+def write_prometheus_textfile(path: str, snapshot: Optional[dict] = None) -> dict:
+    """Atomically write the metrics to a Prometheus textfile"""
+    return atomic_write(Path(path), data=prometheus_text(snapshot).encode())
+
+def _refresh_metrics_textfile() -> None:
+    """Rewrite METRICS_TEXTFILE when it is configured and due; never fails a tool call"""
+    global _metrics_textfile_written
+    if not METRICS_TEXTFILE or time.monotonic() - _metrics_textfile_written < METRICS_TEXTFILE_INTERVAL:
+        return
+    _metrics_textfile_written = time.monotonic()
+    try:
+        write_prometheus_textfile(METRICS_TEXTFILE)
+    except OSError:
+        pass
+
+# ============================================================================
+# PROFILING
+# ============================================================================
+
+# The armed profiling session, or None. Tool wrappers test this one global,
+# so an idle server pays nothing for the feature, and cProfile, pstats and
+# marshal are only imported once a session profiles or saves something.
+_profile_session: Optional[dict] = None
+_profile_lock = threading.Lock()
+
+# Tools that manage profiling are never profiled themselves
+PROFILER_TOOLS = ("start_profiling", "get_profile")
+
+def _profile_active(session: dict) -> bool:
+    """Whether a session still accepts calls; caller holds the lock"""
+    if session["calls_remaining"] is not None and session["calls_remaining"] <= 0:
+        return False
+    return session["deadline"] is None or time.monotonic() < session["deadline"]
+
+def _profile_begin(name: str):
+    """Start profiling one tool call if the session wants it; returns the profiler or None"""
+    if name in PROFILER_TOOLS:
+        return None
+    with _profile_lock:
+        session = _profile_session
+        # cProfile can't nest, so calls overlapping a profiled one run unprofiled
+        if session is None or session["busy"] or not _profile_active(session):
+            return None
+        session["busy"] = True
+        if session["calls_remaining"] is not None:
+            session["calls_remaining"] -= 1
+        session["tools"][name] = session["tools"].get(name, 0) + 1
+    import cProfile
+    
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+def _profile_end(profiler) -> None:
+    """Stop a profiled call and fold its stats into the session"""
+    profiler.disable()
+    with _profile_lock:
+        session = _profile_session
+        if session is None:
+            return
+        session["busy"] = False
+        session["profiled_calls"] += 1
+        if session["stats"] is None:
+            import pstats
+            
+            session["stats"] = pstats.Stats(profiler)
+        else:
+            session["stats"].add(profiler)
+
+def _profile_rows(stats, top: int, sort: str) -> list:
+    """The top functions of a pstats.Stats as plain dicts"""
+    rows = []
+    for (filename, line, function), (primitive, calls, tottime, cumtime, _) in stats.stats.items():
+        rows.append({
+            "function": f"{os.path.basename(filename)}:{line}({function})" if line else function,
+            "calls": calls,
+            "primitive_calls": primitive,
+            "tottime": round(tottime, 6),
+            "cumtime": round(cumtime, 6),
+            "file": filename
+        })
+    rows.sort(key=lambda row: row[sort], reverse=True)
+    return rows[:top]
+
+# ============================================================================
+# BLOCKING WORK
+# ============================================================================
+
+# File I/O, parsing and rule runs happen on this many threads, never on the
+# event loop. Bounded so a burst of large calls can't pile dozens of threads
+# onto the GIL; small calls still find a free worker while a large one runs.
+BLOCKING_WORKERS = int(os.environ.get("SPECMCP_BLOCKING_WORKERS", "4"))
+
+_blocking_executor: Optional[ThreadPoolExecutor] = None
+_blocking_executor_lock = threading.Lock()
+
+def _get_blocking_executor() -> ThreadPoolExecutor:
+    """The shared blocking-work executor, created on first use"""
+    global _blocking_executor
+    with _blocking_executor_lock:
+        if _blocking_executor is None:
+            _blocking_executor = ThreadPoolExecutor(
+                max_workers=max(1, BLOCKING_WORKERS),
+                thread_name_prefix="specmcp-blocking"
+            )
+        return _blocking_executor
+
+async def run_blocking(func, *args, **kwargs):
+    """Run a blocking callable in the bounded executor, keeping the caller's contextvars"""
+    loop = asyncio.get_running_loop()
+    context = copy_context()
+    return await loop.run_in_executor(
+        _get_blocking_executor(),
+        functools.partial(context.run, func, *args, **kwargs)
+    )
+
+def blocking_tool(func):
+    """
+    Register a blocking function as an async MCP tool
+    
+    The tool passes admission control, then awaits func in the blocking
+    executor, so the event loop keeps serving other clients. func itself is
+    returned unchanged for direct (synchronous) callers.
+    """
+    @functools.wraps(func)
+    async def tool(*args, **kwargs):
+        return await run_blocking(func, *args, **kwargs)
     
-    if not constitution_path.exists():
+    mcp.tool()(admitted(tool))
+    return func
+
+# ============================================================================
+# ADMISSION CONTROL
+# ============================================================================
+
+# Calls admitted beyond the worker count wait in a queue this deep; past it
+# they are rejected at once with a retry hint instead of piling up in memory
+MAX_QUEUE_DEPTH = int(os.environ.get("SPECMCP_MAX_QUEUE", "32"))
+
+# Concurrent executions per tool; unlisted tools are bounded by the worker
+# pool alone. Override with SPECMCP_TOOL_LIMITS="verify_spec_compliance=4,..."
+TOOL_CONCURRENCY = {
+    "verify_spec_compliance": 2,
+    "save_spec_to_file": 2,
+    "verify_specs_batch": 1,
+    "generate_from_manifest": 1
+}
+
+def _parse_tool_limits(value: str) -> dict:
+    """Parse "tool=N,tool=N" into {tool: N}"""
+    limits = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        name, _, limit = item.partition("=")
+        limits[name.strip()] = int(limit)
+    return limits
+
+TOOL_CONCURRENCY.update(_parse_tool_limits(os.environ.get("SPECMCP_TOOL_LIMITS", "")))
+
+_admission_lock = threading.Lock()
+_admission_stats = {"in_flight": 0, "admitted": 0, "rejected": 0, "deadline_exceeded": 0}
+# Per-tool semaphores, per event loop (asyncio primitives are loop-bound)
+_tool_slots: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+def admission_info() -> dict:
+    """Return admission counters and limits"""
+    with _admission_lock:
         return {
-            "success": False,
-            "error": f"Constitution file not found: {path}",
-            "suggestion": "Make sure you're in a SpecKit project directory with .specify/constitution.md"
+            **_admission_stats,
+            "workers": BLOCKING_WORKERS,
+            "max_queue_depth": MAX_QUEUE_DEPTH,
+            "tool_limits": dict(TOOL_CONCURRENCY)
         }
+
+def _retry_after(name: str, queued: int) -> float:
+    """Seconds until a rejected call is likely to get in, from the tool's mean latency"""
+    with _metrics_lock:
+        series = _metrics["tool"].get(name)
+        mean = series["seconds"] / series["calls"] if series and series["calls"] else 1.0
+    waves = -(-queued // max(1, BLOCKING_WORKERS))
+    return round(max(1.0, mean * waves), 1)
+
+def _admit(name: str) -> Optional[dict]:
+    """Count a call in, or return the rejection when the queue is full"""
+    with _admission_lock:
+        queued = _admission_stats["in_flight"] - BLOCKING_WORKERS
+        if queued >= MAX_QUEUE_DEPTH:
+            _admission_stats["rejected"] += 1
+        else:
+            _admission_stats["in_flight"] += 1
+            _admission_stats["admitted"] += 1
+            return None
+    retry_after = _retry_after(name, queued)
+    return {
+        "success": False,
+        "error": f"Server busy: {queued} call(s) already queued",
+        "retry_after_seconds": retry_after,
+        "suggestion": f"Retry in about {retry_after:g}s"
+    }
+
+def _release(slot: Optional[asyncio.Semaphore]) -> None:
+    with _admission_lock:
+        _admission_stats["in_flight"] -= 1
+    if slot is not None:
+        slot.release()
+
+def _tool_slot(name: str) -> Optional[asyncio.Semaphore]:
+    """The running loop's semaphore for a concurrency-limited tool"""
+    limit = TOOL_CONCURRENCY.get(name)
+    if not limit:
+        return None
+    slots = _tool_slots.setdefault(asyncio.get_running_loop(), {})
+    if name not in slots:
+        slots[name] = asyncio.Semaphore(limit)
+    return slots[name]
+
+def _deadline_error(deadline_seconds: float) -> dict:
+    with _admission_lock:
+        _admission_stats["deadline_exceeded"] += 1
+    return {
+        "success": False,
+        "error": f"Deadline of {deadline_seconds:g}s exceeded; work was cancelled",
+        "suggestion": "Retry with a larger deadline_seconds, or split the work"
+    }
+
+def admitted(func):
+    """
+    Put an async tool behind admission control and give it a deadline_seconds argument
     
-    try:
-        content = constitution_path.read_text()
+    A call is rejected when the queue is full, then waits for its tool's
+    concurrency slot. Past the deadline the caller gets an error straight
+    away; the work itself stops at its next check_deadline(), and only then
+    frees its slot.
+    """
+    name = func.__name__
+    
+    @functools.wraps(func)
+    async def wrapper(*args, deadline_seconds: Optional[float] = None, **kwargs):
+        rejection = _admit(name)
+        if rejection is not None:
+            return rejection
         
-        tech_stack = extract_tech_stack(content)
-        patterns = extract_patterns(content)
-        principles = extract_principles(content)
-        standards = extract_standards(content)
+        deadline = time.monotonic() + deadline_seconds if deadline_seconds else None
+        token = _call_deadline.set(deadline)
+        slot = _tool_slot(name)
+        acquired = False
+        task = None
+        try:
+            if slot is not None:
+                try:
+                    await asyncio.wait_for(slot.acquire(), None if deadline is None else max(0.0, deadline - time.monotonic()))
+                except asyncio.TimeoutError:
+                    return _deadline_error(deadline_seconds)
+                acquired = True
+            task = asyncio.ensure_future(func(*args, **kwargs))
+        finally:
+            _call_deadline.reset(token)
+            # Timed out, cancelled while queued (client went away) or failed
+            # to start: nothing will run, so give the admission back now
+            if task is None:
+                _release(slot if acquired else None)
         
-        return {
-            "success": True,
-            "constitution": {
-                "tech_stack": tech_stack,
-                "patterns": patterns,
-                "principles": principles,
-                "standards": standards
-            },
-            "metadata": {
-                "file_path": str(constitution_path.absolute()),
-                "file_size": len(content),
-                "lines": len(content.split('\n'))
-            },
-            "summary": generate_constitution_summary(tech_stack, patterns, principles)
-        }
+        def finished(done: asyncio.Future) -> None:
+            # The work holds its slot until it really stops, even past the deadline
+            _release(slot)
+            if not done.cancelled():
+                done.exception()  # Retrieved here when the caller already gave up
         
-    except Exception as e:
-        return {
-            "success": False,
-            "error": str(e),
-            "suggestion": "Check if the file is readable and properly formatted"
-        }
+        task.add_done_callback(finished)
+        done, _ = await asyncio.wait({task}, timeout=None if deadline is None else max(0.0, deadline - time.monotonic()))
+        if not done:
+            return _deadline_error(deadline_seconds)
+        try:
+            return task.result()
+        except DeadlineExceeded:
+            return _deadline_error(deadline_seconds)
+    
+    signature = inspect.signature(func)
+    deadline_param = inspect.Parameter(
+        "deadline_seconds", inspect.Parameter.KEYWORD_ONLY, default=None, annotation=Optional[float]
+    )
+    wrapper.__signature__ = signature.replace(parameters=[*signature.parameters.values(), deadline_param])
+    wrapper.__annotations__ = {**func.__annotations__, "deadline_seconds": Optional[float]}
+    return wrapper
 
-def extract_tech_stack(content: str) -> dict:
-    """Extract technology stack from constitution"""
-    tech_stack = {}
-    content_lower = content.lower()
-    
-    # Languages
-    if "python" in content_lower:
-        tech_stack["language"] = "Python"
-    elif "typescript" in content_lower or "javascript" in content_lower:
-        tech_stack["language"] = "TypeScript/JavaScript"
-    elif "java" in content_lower:
-        tech_stack["language"] = "Java"
-    elif "go" in content_lower:
-        tech_stack["language"] = "Go"
-    
-    # Frameworks
-    if "fastapi" in content_lower:
-        tech_stack["framework"] = "FastAPI"
-    elif "django" in content_lower:
-        tech_stack["framework"] = "Django"
-    elif "express" in content_lower:
-        tech_stack["framework"] = "Express"
-    elif "spring" in content_lower:
-        tech_stack["framework"] = "Spring"
-    
-    # Databases
-    if "postgresql" in content_lower or "postgres" in content_lower:
-        tech_stack["database"] = "PostgreSQL"
-    elif "mongodb" in content_lower:
-        tech_stack["database"] = "MongoDB"
-    elif "mysql" in content_lower:
-        tech_stack["database"] = "MySQL"
-    
-    # Deployment
-    if "docker" in content_lower:
-        tech_stack["deployment"] = "Docker"
-    if "kubernetes" in content_lower:
-        tech_stack["deployment"] = "Kubernetes"
-    
-    return tech_stack
-
-def extract_patterns(content: str) -> dict:
-    """Extract architectural patterns"""
-    patterns = {}
-    content_lower = content.lower()
-    
-    # Architecture
-    if "microservices" in content_lower:
-        patterns["architecture"] = "Microservices"
-    elif "monolith" in content_lower:
-        patterns["architecture"] = "Monolithic"
-    
-    # API Style
-    if "rest" in content_lower or "restful" in content_lower:
-        patterns["api_style"] = "REST"
-    elif "graphql" in content_lower:
-        patterns["api_style"] = "GraphQL"
-    elif "grpc" in content_lower:
-        patterns["api_style"] = "gRPC"
-    
-    # Auth
-    if "jwt" in content_lower:
-        patterns["auth"] = "JWT"
-    elif "oauth" in content_lower:
-        patterns["auth"] = "OAuth2"
-    
-    return patterns
-
-def extract_principles(content: str) -> list:
-    """Extract key principles from constitution"""
-    principles = []
-    
-    # Look for bullet points or numbered lists
-    lines = content.split('\n')
-    for line in lines:
-        line = line.strip()
-        # Match lines starting with -, *, or numbers
-        if re.match(r'^[-*•]\s+', line) or re.match(r'^\d+\.\s+', line):
-            principle = re.sub(r'^[-*•\d.]\s+', '', line)
-            if len(principle) > 10:  # Filter out too short
-                principles.append(principle)
-    
-    return principles[:10]  # Return top 10
-
-def extract_standards(content: str) -> dict:
-    """Extract coding standards"""
-    standards = {}
-    content_lower = content.lower()
-    
-    if "test" in content_lower and "coverage" in content_lower:
-        standards["testing"] = "Required"
-    
-    if "type hint" in content_lower or "typing" in content_lower:
-        standards["type_hints"] = "Required"
-    
-    if "documentation" in content_lower or "docstring" in content_lower:
-        standards["documentation"] = "Required"
-    
-    return standards
-
-def generate_constitution_summary(tech_stack: dict, patterns: dict, principles: list) -> str:
-    """Generate human-readable summary"""
-    parts = []
-    
-    if tech_stack.get("language"):
-        parts.append(f"Language: {tech_stack['language']}")
-    if tech_stack.get("framework"):
-        parts.append(f"Framework: {tech_stack['framework']}")
-    if patterns.get("architecture"):
-        parts.append(f"Architecture: {patterns['architecture']}")
-    if patterns.get("api_style"):
-        parts.append(f"API: {patterns['api_style']}")
-    
-    summary = " | ".join(parts) if parts else "No clear tech stack found"
-    summary += f" | {len(principles)} principles defined"
-    
-    return summary
+# ============================================================================
+# FILE ACCESS
+# ============================================================================
+
+def confined(*params: str):
+    """
+    Reject a call whose named path arguments fall outside the file root
+    
+    Each parameter may hold one path or a list of them (constitution
+    stacks). Without a root (stdio by default) calls pass straight through.
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+        
+        def violation(args: tuple, kwargs: dict) -> Optional[dict]:
+            if file_root() is None:
+                return None
+            arguments = signature.bind_partial(*args, **kwargs).arguments
+            outside = []
+            for param in params:
+                value = arguments.get(param)
+                for path in value if isinstance(value, (list, tuple)) else [value]:
+                    if isinstance(path, str) and outside_file_root(path):
+                        outside.append(path)
+            return file_root_error(outside) if outside else None
+        
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                return violation(args, kwargs) or await func(*args, **kwargs)
+            return async_wrapper
+        
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return violation(args, kwargs) or func(*args, **kwargs)
+        return wrapper
+    return decorator
 
 # ============================================================================
 # MCP TOOLS (These are exposed to AI assistants)
 # ============================================================================
 
+# The operations live in specmcp_core; registering them here adds metrics,
+# admission control, the file root and the blocking executor. Each name
+# stays a plain synchronous function for direct callers.
+parse_constitution = blocking_tool(instrumented(confined("path")(specmcp_core.parse_constitution)))
+generate_openapi_spec = blocking_tool(instrumented(confined("constitution_path")(specmcp_core.generate_openapi_spec)))
+verify_spec_compliance = blocking_tool(instrumented(
+    confined("constitution_path", "spec_path")(specmcp_core.verify_spec_compliance)
+))
+store_spec = blocking_tool(instrumented(confined("spec_path")(specmcp_core.store_spec)))
+get_spec = blocking_tool(instrumented(specmcp_core.get_spec))
+save_spec_to_file = blocking_tool(instrumented(confined("output_path", "spec_path")(specmcp_core.save_spec_to_file)))
+generate_from_manifest = blocking_tool(instrumented(
+    confined("manifest_path", "constitution_path", "report_path")(specmcp_core.generate_from_manifest)
+))
+
 @mcp.tool()
-def parse_constitution(path: str = ".specify/constitution.md") -> dict:
+@admitted
+@instrumented
+@confined("constitution_path")
+async def verify_specs_batch(
+    specs: list[str],
+    constitution_path: Union[str, list[str]] = ".specify/constitution.md",
+    max_workers: Optional[int] = None,
+    ctx: Optional[Context] = None
+) -> dict:
     """
-    Parse a SpecKit constitution.md file and extract structured information
+    Verify many specification files against the constitution in parallel
     
     Args:
-        path: Path to constitution.md file (default: .specify/constitution.md)
+        specs: Spec file paths or glob patterns (e.g., "services/**/openapi.json")
+        constitution_path: Path to constitution.md, or a stack of them (org-wide layer first)
+        max_workers: Worker processes to use (default: one per CPU core)
         
     Returns:
-        Structured constitution data including tech stack, patterns, and principles
+        Per-file compliance reports in completion order plus an aggregate score
     """
-    # Call internal helper function
-    return _parse_constitution_internal(path)
+    constitution_result = await run_blocking(_parse_constitution_internal, constitution_path)
+    
+    if not constitution_result.get("success"):
+        return {
+            "success": False,
+            "error": "Could not parse constitution",
+            "details": constitution_result.get("error")
+        }
+    
+    constitution = constitution_result["constitution"]
+    files, results = await run_blocking(_expand_spec_paths, specs)
+    workers = max(1, min(max_workers or os.cpu_count() or 1, len(files)))
+    
+    async def report(result: dict) -> None:
+        check_deadline()
+        results.append(result)
+        if ctx is not None:
+            status = result.get("compliance_score", "error")
+            await ctx.report_progress(len(results), len(files), f"{result['file']}: {status}")
+    
+    if workers == 1:
+        # Not worth spawning processes for a single worker
+        for path in files:
+            await report(await run_blocking(_verify_spec_file, path, constitution))
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        
+        loop = asyncio.get_running_loop()
+        pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=worker_context(),
+            initializer=_init_batch_worker,
+            initargs=(constitution,)
+        )
+        
+        async def run(path: str) -> dict:
+            try:
+                return await loop.run_in_executor(pool, _verify_spec_file, path)
+            except Exception as e:
+                return {"file": path, "success": False, "error": f"Worker failed: {e}"}
+        
+        tasks = [asyncio.ensure_future(run(path)) for path in files]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                await report(await next_done)
+        finally:
+            # Past a deadline (or any error) drop the queued files and let the
+            # busy workers exit on their own: waiting for them here would
+            # stall the event loop, and every other call, until they finish
+            for task in tasks:
+                task.cancel()
+            pool.shutdown(wait=False, cancel_futures=True)
+    
+    scores = [r["compliance_score"] for r in results if r.get("success")]
+    failed = sum(1 for r in results if not r.get("success"))
+    compliant = sum(1 for r in results if r.get("is_compliant"))
+    aggregate = round(sum(scores) / len(scores), 1) if scores else 0
+    
+    return {
+        "success": True,
+        "total": len(results),
+        "verified": len(scores),
+        "compliant": compliant,
+        "errors": failed,
+        "aggregate_score": aggregate,
+        "workers": workers,
+        "results": results,
+        "summary": f"{compliant}/{len(results)} compliant | average score {aggregate}/100 | {failed} error(s)"
+    }
+
+# Metrics and profiling tools skip admission control and the blocking
+# executor, so an overloaded server can still be inspected
 
 @mcp.tool()
-def generate_openapi_spec(
-    requirements: str,
-    constitution_path: Optional[str] = None,
-    title: Optional[str] = None
-) -> dict:
+@instrumented
+@confined("prometheus_path")
+def get_server_metrics(prometheus_path: Optional[str] = None) -> dict:
     """
-    Generate an OpenAPI 3.1 specification from natural language requirements
+    Report where the server spends its time
     
     Args:
-        requirements: Natural language description of what to build
-        constitution_path: Optional path to constitution.md to follow constraints
-        title: Optional API title (auto-generated if not provided)
+        prometheus_path: Optional file to also write the metrics to in Prometheus text format
         
     Returns:
-        OpenAPI 3.1 specification
+        Per-tool and per-rule call counts, errors and latency histograms, plus cache hit rates
     """
-    # Parse constitution if provided (use internal helper)
-    constitution = None
-    if constitution_path:
-        result = _parse_constitution_internal(constitution_path)
-        if result.get("success"):
-            constitution = result["constitution"]
-    
-    # Generate spec
-    spec = {
-        "openapi": "3.1.0",
-        "info": {
-            "title": title or "Generated API",
-            "version": "1.0.0",
-            "description": requirements
-        },
-        "servers": [
-            {"url": "https://api.example.com", "description": "Production server"}
-        ],
-        "paths": {},
-        "components": {
-            "schemas": {},
-            "securitySchemes": {}
-        }
-    }
+    snapshot = metrics_snapshot()
+    result = {"success": True, **snapshot}
     
-    # Add authentication based on constitution
-    if constitution and constitution.get("patterns", {}).get("auth"):
-        auth_type = constitution["patterns"]["auth"]
-        if auth_type == "JWT":
-            spec["components"]["securitySchemes"]["bearerAuth"] = {
-                "type": "http",
-                "scheme": "bearer",
-                "bearerFormat": "JWT"
-            }
-            spec["security"] = [{"bearerAuth": []}]
-        elif auth_type == "OAuth2":
-            spec["components"]["securitySchemes"]["oauth2"] = {
-                "type": "oauth2",
-                "flows": {
-                    "authorizationCode": {
-                        "authorizationUrl": "https://example.com/oauth/authorize",
-                        "tokenUrl": "https://example.com/oauth/token",
-                        "scopes": {}
-                    }
-                }
-            }
-    
-    # Add basic health endpoint
-    spec["paths"]["/health"] = {
-        "get": {
-            "summary": "Health check endpoint",
-            "responses": {
-                "200": {
-                    "description": "Service is healthy",
-                    "content": {
-                        "application/json": {
-                            "schema": {
-                                "type": "object",
-                                "properties": {
-                                    "status": {"type": "string", "example": "ok"}
-                                }
-                            }
-                        }
-                    }
-                }
+    if prometheus_path:
+        try:
+            write_prometheus_textfile(prometheus_path, snapshot)
+        except OSError as e:
+            return {
+                "success": False,
+                "error": f"Could not write metrics: {e}",
+                "suggestion": "Check the directory exists and is writable by the server"
             }
-        }
-    }
+        result["prometheus_path"] = str(Path(prometheus_path).absolute())
     
-    return {
-        "success": True,
-        "specification": spec,
-        "format": "openapi-3.1",
-        "constitution_applied": constitution is not None,
-        "notes": [
-            "Basic OpenAPI 3.1 specification generated",
-            "Add more endpoints based on your requirements",
-            "Authentication configured" if constitution else "No authentication configured"
-        ]
-    }
+    return result
 
 @mcp.tool()
-def verify_spec_compliance(
-    spec_content: str,
-    constitution_path: str = ".specify/constitution.md"
-) -> dict:
+@instrumented
+def start_profiling(calls: Optional[int] = None, seconds: Optional[float] = None) -> dict:
     """
-    Verify that a specification follows constitution rules
+    Profile the next tool calls with cProfile
     
     Args:
-        spec_content: The specification content (JSON)
-        constitution_path: Path to constitution.md
+        calls: Profile this many tool calls
+        seconds: Profile tool calls starting within this many seconds
         
     Returns:
-        Compliance report with violations and score
+        Confirmation; fetch results with get_profile
     """
-    # Parse constitution using internal helper (NOT the MCP tool)
-    constitution_result = _parse_constitution_internal(constitution_path)
-    
-    if not constitution_result.get("success"):
+    global _profile_session
+    if calls is None and seconds is None:
         return {
             "success": False,
-            "error": "Could not parse constitution",
-            "details": constitution_result.get("error")
+            "error": "Nothing to profile",
+            "suggestion": "Pass calls (e.g. 10) and/or seconds (e.g. 60)"
         }
-    
-    constitution = constitution_result["constitution"]
-    violations = []
-    
-    # Try to parse spec as JSON
-    try:
-        spec = json.loads(spec_content)
-    except:
+    if (calls is not None and calls < 1) or (seconds is not None and seconds <= 0):
         return {
             "success": False,
-            "error": "Spec content is not valid JSON",
-            "suggestion": "Make sure you're providing valid OpenAPI JSON"
+            "error": "calls and seconds must be positive",
+            "suggestion": "Pass calls >= 1 or seconds > 0"
         }
     
-    # Check tech stack compliance
-    tech_stack = constitution.get("tech_stack", {})
-    spec_str = spec_content.lower()
-    
-    if tech_stack.get("framework"):
-        framework = tech_stack["framework"].lower()
-        if framework not in spec_str:
-            violations.append({
-                "rule": "Tech Stack Compliance",
-                "severity": "warning",
-                "message": f"Constitution requires {tech_stack['framework']}, not found in spec",
-                "suggestion": f"Add {tech_stack['framework']} references to spec description"
-            })
-    
-    # Check authentication
-    patterns = constitution.get("patterns", {})
-    if patterns.get("auth"):
-        required_auth = patterns["auth"]
-        has_security = "securitySchemes" in spec.get("components", {})
-        
-        if not has_security:
-            violations.append({
-                "rule": "Authentication Required",
-                "severity": "error",
-                "message": f"Constitution requires {required_auth} authentication",
-                "suggestion": f"Add {required_auth} security scheme to components.securitySchemes"
-            })
-    
-    # Check for health endpoint
-    has_health = "/health" in spec.get("paths", {})
-    if not has_health:
-        violations.append({
-            "rule": "Health Endpoint Required",
-            "severity": "warning",
-            "message": "All services should have a /health endpoint",
-            "suggestion": "Add GET /health endpoint for monitoring"
-        })
-    
-    # Calculate compliance score
-    max_score = 100
-    deductions = sum(20 if v["severity"] == "error" else 10 for v in violations)
-    score = max(0, max_score - deductions)
+    with _profile_lock:
+        replaced = _profile_session is not None
+        _profile_session = {
+            "calls_remaining": calls,
+            "deadline": time.monotonic() + seconds if seconds is not None else None,
+            "busy": False,
+            "profiled_calls": 0,
+            "tools": {},
+            "stats": None
+        }
     
+    limits = [f"the next {calls} tool call(s)"] if calls is not None else []
+    if seconds is not None:
+        limits.append(f"{seconds:g} second(s)")
     return {
         "success": True,
-        "is_compliant": len(violations) == 0,
-        "compliance_score": score,
-        "violations": violations,
-        "summary": f"{'✅ Fully compliant' if len(violations) == 0 else f'⚠️  {len(violations)} violation(s) found'}",
-        "recommendations": [v["suggestion"] for v in violations] if violations else ["Specification follows all constitution rules"]
+        "calls": calls,
+        "seconds": seconds,
+        "replaced_session": replaced,
+        "message": f"Profiling {' or '.join(limits)}" + (", whichever ends first" if len(limits) > 1 else ""),
+        "suggestion": "Run the slow calls, then call get_profile"
     }
 
 @mcp.tool()
-def save_spec_to_file(
-    spec_content: str,
-    output_path: str,
-    format: str = "json"
+@instrumented
+@confined("pstats_path")
+def get_profile(
+    top: int = 25,
+    sort: str = "cumulative",
+    pstats_path: Optional[str] = None,
+    stop: bool = False
 ) -> dict:
     """
-    Save a specification to a file
+    Report the functions that took the most time in profiled tool calls
     
     Args:
-        spec_content: The specification content (JSON or YAML)
-        output_path: Where to save the file (e.g., "specs/api.json")
-        format: Output format - "json" or "yaml" (default: json)
+        top: Number of functions to return
+        sort: "cumulative", "tottime" or "calls"
+        pstats_path: Optional .pstats file to write for snakeviz / pstats
+        stop: End the session after reporting
         
     Returns:
-        Success status and file location
+        Session status, profiled calls per tool and the top functions
     """
-    try:
-        output_file = Path(output_path)
-        
-        # Create parent directories if needed
-        output_file.parent.mkdir(parents=True, exist_ok=True)
-        
-        # Parse spec
-        try:
-            spec = json.loads(spec_content)
-        except:
+    global _profile_session
+    sort_keys = {"cumulative": "cumtime", "tottime": "tottime", "calls": "calls"}
+    if sort not in sort_keys:
+        return {
+            "success": False,
+            "error": f"Unknown sort: {sort}",
+            "suggestion": f"Use one of: {', '.join(sort_keys)}"
+        }
+    
+    with _profile_lock:
+        session = _profile_session
+        if session is None:
             return {
                 "success": False,
-                "error": "Invalid JSON content",
-                "suggestion": "Make sure spec_content is valid JSON"
+                "error": "No profiling session",
+                "suggestion": "Call start_profiling first"
             }
-        
-        # Write file
-        if format == "json":
-            output_file.write_text(json.dumps(spec, indent=2))
-        elif format == "yaml":
-            try:
-                import yaml
-                output_file.write_text(yaml.dump(spec, default_flow_style=False, sort_keys=False))
-            except ImportError:
-                return {
-                    "success": False,
-                    "error": "PyYAML not installed",
-                    "suggestion": "Install with: pip install pyyaml"
-                }
+        stats = session["stats"]
+        result = {
+            "success": True,
+            "status": "running" if _profile_active(session) else "complete",
+            "profiled_calls": session["profiled_calls"],
+            "tools": dict(session["tools"]),
+            "calls_remaining": session["calls_remaining"],
+            "seconds_remaining": (
+                round(max(0.0, session["deadline"] - time.monotonic()), 1)
+                if session["deadline"] is not None else None
+            ),
+            "functions": _profile_rows(stats, top, sort_keys[sort]) if stats is not None else [],
+            "total_seconds": round(stats.total_tt, 6) if stats is not None else 0.0
+        }
+        if pstats_path and stats is not None:
+            import marshal
+            
+            data = marshal.dumps(stats.stats)
         else:
+            data = None
+        if stop:
+            _profile_session = None
+    
+    if pstats_path:
+        if data is None:
+            result["pstats_path"] = None
+            result["suggestion"] = "No calls profiled yet; nothing written"
+            return result
+        try:
+            atomic_write(Path(pstats_path), data=data)
+        except OSError as e:
             return {
                 "success": False,
-                "error": f"Unsupported format: {format}",
-                "suggestion": "Use 'json' or 'yaml'"
+                "error": f"Could not write profile: {e}",
+                "suggestion": "Check the directory exists and is writable by the server"
             }
-        
-        return {
-            "success": True,
-            "file_path": str(output_file.absolute()),
-            "file_size": output_file.stat().st_size,
-            "format": format,
-            "message": f"✅ Spec saved to {output_path}"
-        }
-        
-    except Exception as e:
-        return {
-            "success": False,
-            "error": str(e),
-            "suggestion": "Check file path and permissions"
-        }
+        result["pstats_path"] = str(Path(pstats_path).absolute())
+    
+    return result
 
 # ============================================================================
 # Run Server
 # ============================================================================
 
+def set_blocking_workers(workers: int) -> None:
+    """Size the blocking executor; takes effect for an executor not yet started"""
+    global BLOCKING_WORKERS, _blocking_executor
+    with _blocking_executor_lock:
+        BLOCKING_WORKERS = max(1, workers)
+        if _blocking_executor is not None:
+            _blocking_executor.shutdown(wait=False)
+            _blocking_executor = None
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="SpecMCP server")
+    parser.add_argument(
+        "--transport", choices=["stdio", "http"], default=os.environ.get("SPECMCP_TRANSPORT", "stdio"),
+        help="stdio serves one client; http serves many sessions from one process"
+    )
+    parser.add_argument("--host", default=os.environ.get("SPECMCP_HOST", "127.0.0.1"), help="HTTP bind address")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("SPECMCP_PORT", "8000")), help="HTTP port")
+    parser.add_argument("--path", default=os.environ.get("SPECMCP_PATH", "/mcp"), help="HTTP endpoint path")
+    parser.add_argument(
+        "--root", default=os.environ.get("SPECMCP_ROOT"),
+        help="Directory tools may read and write files in (default: the working directory over HTTP, "
+             "unrestricted over stdio)"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=BLOCKING_WORKERS,
+        help="Threads running tool work, shared by all sessions (default: SPECMCP_BLOCKING_WORKERS or 4)"
+    )
+    return parser
+
+def main(argv: Optional[list] = None) -> None:
+    args = build_parser().parse_args(argv)
+    set_blocking_workers(args.workers)
+    # Over HTTP every client names paths the server then reads and writes
+    specmcp_core.set_file_root(args.root or ("." if args.transport == "http" else None))
+    if args.transport == "http":
+        # A single process on purpose: every session shares the constitution,
+        # rule and subtree caches, the spec store and the metrics
+        mcp.run(transport="http", host=args.host, port=args.port, path=args.path)
+    else:
+        mcp.run()
+
 if __name__ == "__main__":
-    mcp.run()
\ No newline at end of file
+    main()
\ No newline at end of file
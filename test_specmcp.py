@@ -2,9 +2,24 @@
 
 from fastmcp import Client
 import asyncio
-import json
+import contextlib
+import io
+import multiprocessing
+import os
+import re
+import tempfile
+import time
+import tracemalloc
+import specmcp_json
 from pathlib import Path
+import specmcp_cli
+import specmcp_core
 import specmcp_server
+from bench_specmcp import cold_import, synthetic_spec
+
+# Cold import budget for specmcp_core, which scripts, the CLI and worker
+# processes load instead of the server
+IMPORT_BUDGET_MS = float(os.environ.get("SPECMCP_IMPORT_BUDGET_MS", "200"))
 
 def print_result(title, result):
     """Print result nicely"""
@@ -13,8 +28,8 @@ def print_result(title, result):
     print('='*70)
     if hasattr(result, 'data'):
         try:
-            data = json.loads(result.data) if isinstance(result.data, str) else result.data
-            print(json.dumps(data, indent=2))
+            data = specmcp_json.loads(result.data) if isinstance(result.data, str) else result.data
+            print(specmcp_json.dumps(data, indent=2))
         except:
             print(result.data)
     else:
@@ -47,15 +62,13 @@ async def test_specmcp():
         
         # Save the spec from test 2
         if hasattr(result, 'data'):
-            data = json.loads(result.data) if isinstance(result.data, str) else result.data
-            if data.get('success') and data.get('specification'):
-                spec_json = json.dumps(data['specification'])
-                
-                # Test 4: Save spec to file
+            data = specmcp_json.loads(result.data) if isinstance(result.data, str) else result.data
+            if data.get('success') and data.get('spec_handle'):
+                # Test 4: Save spec to file (by handle - the spec stays on the server)
                 result = await client.call_tool(
                     "save_spec_to_file",
                     {
-                        "spec_content": spec_json,
+                        "spec_handle": data['spec_handle'],
                         "output_path": "specs/auth-api.json",
                         "format": "json"
                     }
@@ -72,12 +85,145 @@ async def test_specmcp():
         result = await client.call_tool(
             "verify_spec_compliance",
             {
-                "spec_content": json.dumps(spec),
+                "spec_content": specmcp_json.dumps(spec),
                 "constitution_path": ".specify/constitution.md"
             }
         )
         print_result("3️⃣  Verify Spec Compliance (No Auth - Should Fail)", result)
         
+        # Test 3b: Verify a saved spec by path (server reads the file)
+        result = await client.call_tool(
+            "verify_spec_compliance",
+            {
+                "spec_path": "specs/auth-api.json",
+                "constitution_path": ".specify/constitution.md"
+            }
+        )
+        print_result("3️⃣b Verify Spec Compliance (By Path)", result)
+        
+        # Test 5: Batch verify saved specs
+        result = await client.call_tool(
+            "verify_specs_batch",
+            {
+                "specs": ["specs/*.json"],
+                "constitution_path": ".specify/constitution.md"
+            }
+        )
+        print_result("5️⃣  Batch Verify Specs", result)
+        
+        # Test 6: Server metrics
+        result = await client.call_tool("get_server_metrics", {})
+        print_result("6️⃣  Server Metrics", result)
+        
+        # Test 7: Small calls keep low latency while a large save runs
+        large_spec = {
+            "openapi": "3.1.0",
+            "info": {"title": "Large API", "version": "1.0.0"},
+            "paths": {
+                f"/items{i}": {"get": {"summary": f"Item {i} " + "x" * 200, "responses": {"200": {"description": "OK"}}}}
+                for i in range(100_000)
+            }
+        }
+        handle = specmcp_core.spec_store_put(large_spec)
+        
+        async def small_call() -> float:
+            start = time.perf_counter()
+            await client.call_tool("parse_constitution", {"path": ".specify/constitution.md"})
+            return (time.perf_counter() - start) * 1000
+        
+        idle = [await small_call() for _ in range(5)]
+        start = time.perf_counter()
+        large = asyncio.create_task(client.call_tool(
+            "save_spec_to_file",
+            {"spec_handle": handle, "output_path": "specs/large.json"}
+        ))
+        busy = []
+        while not large.done():
+            busy.append(await small_call())
+        await large
+        large_ms = (time.perf_counter() - start) * 1000
+        Path("specs/large.json").unlink(missing_ok=True)
+        
+        print(f"\n{'='*70}")
+        print("  7️⃣  Concurrency: small calls during a large save")
+        print('='*70)
+        print(f"   Large save:                  {large_ms:.0f}ms")
+        print(f"   Small calls while idle:      max {max(idle):.1f}ms")
+        print(f"   Small calls during the save: {len(busy)} calls, max {max(busy, default=0):.1f}ms")
+        # A blocked loop holds a small call for about as long as the whole save
+        assert len(busy) >= 3, f"only {len(busy)} small call(s) finished during a {large_ms:.0f}ms save"
+        assert max(busy) < min(500, large_ms / 2), f"a small call during the {large_ms:.0f}ms save took {max(busy):.0f}ms"
+        
+        # Test 8: A call past its deadline is cancelled instead of running on
+        result = await client.call_tool(
+            "verify_spec_compliance",
+            {"spec_handle": handle, "deadline_seconds": 0.05}
+        )
+        print_result("8️⃣  Verify With a 50ms Deadline", result)
+        
+        # Test 8b: A batch past its deadline doesn't hold up the next call
+        # while its workers wind down
+        batch_dir = Path("specs/batch")
+        batch_dir.mkdir(parents=True, exist_ok=True)
+        for i in range(12):
+            (batch_dir / f"service-{i}.json").write_bytes(specmcp_json.dumpb(synthetic_spec(3000, seed=i)))
+        result = await client.call_tool(
+            "verify_specs_batch",
+            {"specs": [f"{batch_dir}/*.json"], "max_workers": 2, "deadline_seconds": 0.2},
+            raise_on_error=False
+        )
+        # The caller hears of the deadline at once; the batch itself stops at
+        # its next result, so keep calling for a while after
+        after = []
+        until = time.perf_counter() + 1.5
+        while time.perf_counter() < until:
+            after.append(await small_call())
+        print_result("8️⃣b Batch Verify With a 200ms Deadline", result)
+        print(f"   Small calls after the deadline: {len(after)} calls, max {max(after):.1f}ms")
+        assert result.data.get("success") is False, "batch should have hit its deadline"
+        assert max(after) < 500, f"a small call after the batch deadline took {max(after):.0f}ms"
+        while multiprocessing.active_children():
+            await asyncio.sleep(0.05)  # let the workers finish before timing imports
+        
+        # Test 9: The core starts fast and without the MCP framework or PyYAML
+        core_ms, loaded = min(cold_import("specmcp_core") for _ in range(3))
+        server_ms, _ = cold_import("specmcp_server")
+        heavy = sorted(loaded & {"fastmcp", "mcp", "pydantic", "yaml"})
+        print(f"\n{'='*70}")
+        print("  9️⃣  Cold Start (-X importtime)")
+        print('='*70)
+        print(f"   import specmcp_core:   {core_ms:.1f}ms (budget {IMPORT_BUDGET_MS:g}ms)")
+        print(f"   import specmcp_server: {server_ms:.1f}ms")
+        assert not heavy, f"specmcp_core imported {', '.join(heavy)}"
+        assert core_ms <= IMPORT_BUDGET_MS, f"specmcp_core took {core_ms:.1f}ms to import"
+        
+        # Test 10: Generate every service listed in a manifest
+        manifest = Path("specs/manifest/services.json")
+        manifest.parent.mkdir(parents=True, exist_ok=True)
+        manifest.write_text(specmcp_json.dumps({
+            "constitution": str(Path(".specify/constitution.md").absolute()),
+            "services": [
+                {"title": "Billing API", "requirements": "Invoices and payments", "output": "billing.json"},
+                {"title": "Catalog API", "requirements": "Product catalog with search", "output": "catalog.yaml", "format": "yaml"}
+            ]
+        }))
+        result = await client.call_tool(
+            "generate_from_manifest",
+            {"manifest_path": str(manifest), "max_workers": 2}
+        )
+        print_result("🔟 Generate From a Manifest", result)
+        assert result.data["generated"] == 2, result.data["summary"]
+        
+        # Test 11: A repo layer stacked on the constitution overrides it field by field
+        layer = Path("specs/manifest/repo-constitution.md")
+        layer.write_text("# Repo\n- The partner API of this service uses GraphQL\n")
+        result = await client.call_tool(
+            "parse_constitution",
+            {"path": [".specify/constitution.md", str(layer)]}
+        )
+        print_result("1️⃣1️⃣ Parse a Constitution Stack", result)
+        assert result.data["constitution"]["patterns"]["api_style"] == "GraphQL", result.data["summary"]
+        
         print(f"\n{'='*70}")
         print("✅ SpecMCP Server Tests Complete!")
         print('='*70)
@@ -92,5 +238,691 @@ async def test_specmcp():
             print(f"   cat specs/auth-api.json")
             print(f"   code specs/auth-api.json")
 
+# ============================================================================
+# UNIT CHECKS - plain functions, collected by pytest or run by this script
+# ============================================================================
+
+JWT_TEMPLATE = specmcp_core.spec_template({"patterns": {"auth": "JWT"}})
+
+def compile_operation(line: str, path: str, method: str) -> dict:
+    """Compile one endpoint line under a JWT constitution and return its operation"""
+    compiled = specmcp_core.compile_requirements(line, JWT_TEMPLATE)
+    return compiled["paths"][path][method]
+
+def test_endpoint_auth_hints():
+    """An incidental "public" or "anonymous" never drops authentication"""
+    cases = [
+        ("POST /keys - Upload a public key (requires authentication)", "/keys", "post", [{"bearerAuth": []}]),
+        ("GET /reports - Monthly reports, anonymous access denied", "/reports", "get", None),
+        ("GET /status - Service status (no auth required)", "/status", "get", []),
+        ("GET /catalog - Public catalog listing", "/catalog", "get", []),
+        ("GET /ping - Ping, no auth required", "/ping", "get", None),
+    ]
+    for line, path, method, security in cases:
+        operation = compile_operation(line, path, method)
+        assert operation.get("security") == security, f"{line!r}: {operation.get('security')!r}"
+
+def test_compile_requirements():
+    """Methods, path parameters, success codes and error refs compiled from endpoint lines"""
+    requirements = "\n".join([
+        "Orders service.",
+        "- get /orders - List orders (public)",
+        "1. POST /orders - Create an order",
+        "* PATCH /users/{userId}/orders/{orderId}. Update an order",
+        "+ DELETE /orders/{id} - Cancel an order (requires authentication)",
+        "- GET /orders - listed twice",
+        "- FETCH /nope - not an HTTP method",
+        "Customers can GET /inline - only lines that start with a method count",
+    ])
+    compiled = specmcp_core.compile_requirements(requirements, JWT_TEMPLATE)
+    paths = compiled["paths"]
+    assert compiled["endpoints"] == 4
+    assert set(paths) == {"/health", "/orders", "/users/{userId}/orders/{orderId}", "/orders/{id}"}
+    
+    listing = paths["/orders"]["get"]
+    assert listing["summary"] == "List orders" and listing["operationId"] == "get_orders"
+    assert list(listing["responses"]) == ["200", "500"]
+    assert listing["security"] == []
+    
+    create = paths["/orders"]["post"]
+    assert create["summary"] == "Create an order" and "security" not in create
+    assert create["responses"]["400"] == {"$ref": "#/components/responses/BadRequest"}
+    assert create["responses"]["401"] == {"$ref": "#/components/responses/Unauthorized"}
+    assert "201" in create["responses"]
+    
+    item = paths["/users/{userId}/orders/{orderId}"]
+    assert [(p["name"], p["in"], p["required"]) for p in item["parameters"]] == [
+        ("userId", "path", True), ("orderId", "path", True)
+    ]
+    assert item["patch"]["operationId"] == "patch_users_userId_orders_orderId"
+    assert list(item["patch"]["responses"]) == ["200", "400", "401", "404", "500"]
+    
+    cancel = paths["/orders/{id}"]["delete"]
+    assert cancel["summary"] == "Cancel an order" and cancel["security"] == [{"bearerAuth": []}]
+    assert list(cancel["responses"]) == ["204", "401", "404", "500"]
+    assert compiled["errors"] == ["BadRequest", "Unauthorized", "NotFound", "InternalError"]
+    assert compiled["unsecured"] == 0
+    
+    # Without an auth pattern nothing is secured, and asking for auth is counted
+    open_template = specmcp_core.spec_template(None)
+    compiled = specmcp_core.compile_requirements(requirements, open_template)
+    assert "security" not in compiled["paths"]["/orders"]["get"]
+    assert "401" not in compiled["paths"]["/orders"]["post"]["responses"]
+    assert compiled["unsecured"] == 1
+
+def test_example_auth_endpoints_are_public():
+    """generate_spec.py's sign-up, login and password reset need no token and no generic 401"""
+    from generate_spec import REQUIREMENTS
+    paths = specmcp_core.compile_requirements(REQUIREMENTS, JWT_TEMPLATE)["paths"]
+    for path in ("/auth/register", "/auth/login", "/auth/forgot-password", "/auth/reset-password"):
+        operation = paths[path]["post"]
+        assert operation["security"] == [], path
+        assert "401" not in operation["responses"], path
+    for path, method in (("/auth/logout", "post"), ("/auth/me", "get")):
+        assert paths[path][method]["security"] == [{"bearerAuth": []}], path
+
+def test_compiled_operations_share_nothing():
+    """Editing one compiled operation leaves the others alone, and YAML output has no aliases"""
+    requirements = "\n".join([
+        "- POST /orders - Create an order (requires authentication)",
+        "- PUT /orders/{id} - Update an order (requires authentication)",
+        "- DELETE /orders/{id} - Cancel an order (requires authentication)",
+        "- POST /carts - Create a cart (requires authentication)",
+    ])
+    compiled = specmcp_core.compile_requirements(requirements, JWT_TEMPLATE)
+    create, cart = compiled["paths"]["/orders"]["post"], compiled["paths"]["/carts"]["post"]
+    create["responses"]["201"]["description"] = "Order created"
+    create["responses"]["401"]["$ref"] = "#/components/responses/OrderAuth"
+    create["security"][0]["bearerAuth"].append("orders:write")
+    assert cart["responses"]["201"]["description"] == "Created"
+    assert cart["responses"]["401"]["$ref"] == "#/components/responses/Unauthorized"
+    assert cart["security"] == [{"bearerAuth": []}]
+    
+    generated = specmcp_core.generate_openapi_spec(requirements, ".specify/constitution.md", include_spec=False)
+    with tempfile.TemporaryDirectory() as tmp:
+        output = Path(tmp) / "orders.yaml"
+        saved = specmcp_core.save_spec_to_file(spec_handle=generated["spec_handle"], output_path=str(output), format="yaml")
+        assert saved["success"], saved
+        text = output.read_text()
+    assert "&id" not in text and "*id" not in text, "YAML output contains anchors/aliases"
+
+def test_generated_spec_is_copy_on_write():
+    """Editing a returned specification never reaches the memoized spec or its shared fragments"""
+    requirements = "\n".join([
+        "- POST /orders - Create an order (requires authentication)",
+        "- POST /carts - Create a cart (requires authentication)",
+    ])
+    first = specmcp_core.generate_openapi_spec(requirements, ".specify/constitution.md")
+    pristine = specmcp_json.loads(specmcp_json.dumpb(first["specification"]))
+    
+    spec = first["specification"]
+    spec["paths"]["/health"]["get"]["responses"].clear()
+    # Both operations were compiled from the same 201/401 response objects
+    spec["paths"]["/orders"]["post"]["responses"]["401"]["$ref"] = "#/components/responses/OrderAuth"
+    spec["paths"]["/orders"]["post"]["responses"]["201"]["description"] = "Order created"
+    spec["components"]["securitySchemes"].clear()
+    assert spec["paths"]["/carts"]["post"]["responses"] == pristine["paths"]["/carts"]["post"]["responses"]
+    
+    before = specmcp_core.generation_cache_info()
+    again = specmcp_core.generate_openapi_spec(requirements, ".specify/constitution.md")
+    assert specmcp_core.generation_cache_info()["hits"] == before["hits"] + 1
+    assert again["specification"] == pristine and again["spec_handle"] == first["spec_handle"]
+    assert specmcp_core.get_spec(first["spec_handle"])["specification"] == pristine
+    
+    # Other specs generated from the same fragments are untouched too
+    other = specmcp_core.generate_openapi_spec("- GET /users - List users (requires authentication)", ".specify/constitution.md")
+    assert other["specification"]["paths"]["/health"] == pristine["paths"]["/health"]
+    assert other["specification"]["components"]["securitySchemes"] == pristine["components"]["securitySchemes"]
+
+def test_keyword_forms():
+    """Version and plural suffixes still match; keywords inside other words don't"""
+    cases = [
+        ("Services are written in python3", "tech_stack", "language", "Python"),
+        ("Target Python3.12 everywhere", "tech_stack", "language", "Python"),
+        ("Clients send JWTs in the Authorization header", "patterns", "auth", "JWT"),
+        ("Every service is Dockerized", "tech_stack", "deployment", "Docker"),
+        ("Frontends use javascript", "tech_stack", "language", "TypeScript/JavaScript"),
+        ("We use Java 17", "tech_stack", "language", "Java"),
+        ("Written in golang", "tech_stack", "language", "Go"),
+        # Priority: the first matching choice of a field wins
+        ("Python services with a Java admin tool", "tech_stack", "language", "Python"),
+        ("Docker images deployed on Kubernetes", "tech_stack", "deployment", "Kubernetes"),
+        ("REST for partners, GraphQL internally", "patterns", "api_style", "REST"),
+        ("JWT access tokens issued through OAuth2", "patterns", "auth", "JWT"),
+    ]
+    for text, section, field, value in cases:
+        tokens = specmcp_core.scan_keywords(text)
+        found = specmcp_core.extract_tech_stack(text, tokens) if section == "tech_stack" else specmcp_core.extract_patterns(text, tokens)
+        assert found.get(field) == value, f"{text!r}: {field}={found.get(field)!r}"
+    
+    assert specmcp_core.extract_standards("Public APIs need type hinting")["type_hints"] == "Required"
+    
+    false_positives = [
+        ("Frontends use javascript", "java"),
+        ("Hosted on Google Cloud", "go"),
+        ("Access is restricted to admins", "rest"),
+        ("Use jwtoken-compatible clients", "jwt"),
+        ("Pythonic code is preferred", "python"),
+    ]
+    for text, token in false_positives:
+        assert token not in specmcp_core.scan_keywords(text), f"{text!r} matched {token}"
+
+def test_streamed_ref_index_memory():
+    """Streaming verification keeps $ref bookkeeping bounded, not one entry per ref site"""
+    constitution = specmcp_core._parse_constitution_internal(".specify/constitution.md")["constitution"]
+    specmcp_core.compile_rules(constitution)
+    import ijson  # noqa: F401 - imported before tracing starts
+    with tempfile.TemporaryDirectory() as tmp:
+        spec_path = Path(tmp) / "large.json"
+        spec_path.write_bytes(specmcp_json.dumpb(synthetic_spec(4000, refs=8)))
+        tracemalloc.start()
+        try:
+            result = specmcp_core.verify_spec_stream(str(spec_path), constitution)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        size = spec_path.stat().st_size
+    assert result["success"] and result["streamed"]
+    assert peak < size, f"peak {peak >> 10} KB while streaming a {size >> 10} KB spec"
+
+def test_streamed_ref_index_matches_full():
+    """Dangling refs, cycles through path items and unused components match in-memory verification"""
+    spec = synthetic_spec(50)
+    path_name = next(name for name in spec["paths"] if name != "/health")
+    spec["paths"][path_name]["x-broken"] = {"$ref": "#/components/schemas/Missing"}
+    spec["paths"][path_name]["x-model"] = {"$ref": "#/components/schemas/Model3"}
+    spec["components"]["schemas"]["Model3"]["properties"]["owner"] = {
+        "$ref": "#/paths/" + path_name.replace("~", "~0").replace("/", "~1")
+    }
+    spec["components"]["schemas"]["Orphan"] = {"type": "string"}
+    constitution = specmcp_core._parse_constitution_internal(".specify/constitution.md")["constitution"]
+    with tempfile.TemporaryDirectory() as tmp:
+        spec_path = Path(tmp) / "spec.json"
+        spec_path.write_bytes(specmcp_json.dumpb(spec))
+        streamed = specmcp_core.verify_spec_stream(str(spec_path), constitution)
+    full = specmcp_core._check_spec_compliance(spec, None, constitution)
+    
+    def ref_violations(result: dict) -> list:
+        return [
+            (v["rule"], v["message"], v.get("pointer")) for v in result["violations"]
+            if v["rule"] in ("Dangling References", "Reference Cycles", "Unused Components")
+        ]
+    
+    assert ref_violations(streamed) == ref_violations(full)
+    assert {rule for rule, _, _ in ref_violations(streamed)} == {"Dangling References", "Reference Cycles", "Unused Components"}
+
+def test_ref_index_reused_per_subtree():
+    """An unchanged spec reuses its $ref index; an edit rescans only the edited path item"""
+    spec = synthetic_spec(200, seed=7)
+    constitution = specmcp_core._parse_constitution_internal(".specify/constitution.md")["constitution"]
+    specmcp_core._check_spec_compliance(spec, None, constitution)
+    
+    before = specmcp_core.subtree_cache_info()
+    specmcp_core._check_spec_compliance(spec, None, constitution)
+    unchanged = specmcp_core.subtree_cache_info()
+    assert unchanged["index_hits"] == before["index_hits"] + 1
+    assert unchanged["index_misses"] == before["index_misses"]
+    assert unchanged["ref_misses"] == before["ref_misses"]
+    
+    path_name = next(name for name in spec["paths"] if name != "/health")
+    spec["paths"][path_name]["x-broken"] = {"$ref": "#/components/schemas/Missing"}
+    result = specmcp_core._check_spec_compliance(spec, None, constitution)
+    edited = specmcp_core.subtree_cache_info()
+    assert edited["index_misses"] == unchanged["index_misses"] + 1
+    assert edited["ref_misses"] == unchanged["ref_misses"] + 1
+    assert any(
+        v["rule"] == "Dangling References" and "Missing" in v["message"]
+        for v in result["violations"]
+    )
+    
+    assert specmcp_core.invalidate_subtree_caches() > 0
+    cold = specmcp_core._check_spec_compliance(spec, None, constitution)
+    after = specmcp_core.subtree_cache_info()
+    assert after["index_misses"] == edited["index_misses"] + 1
+    assert after["ref_misses"] > edited["ref_misses"] + len(spec["paths"]) - 1
+    assert cold["violations"] == result["violations"]
+
+def test_constitution_cache_revalidates():
+    """A repeat parse is a cache hit; a rewritten file misses; invalidation forces a reparse"""
+    with tempfile.TemporaryDirectory() as tmp:
+        constitution_path = Path(tmp) / "constitution.md"
+        constitution_path.write_text(Path(".specify/constitution.md").read_text() + "\n- Use REST for every API\n")
+        path = str(constitution_path)
+        
+        before = specmcp_core.constitution_cache_info()
+        first = specmcp_core._parse_constitution_internal(path)
+        assert specmcp_core._parse_constitution_internal(path) is first
+        info = specmcp_core.constitution_cache_info()
+        assert (info["misses"], info["hits"]) == (before["misses"] + 1, before["hits"] + 1)
+        
+        # Touched with the same bytes: the SHA-256 matches, so nothing is reparsed
+        stat = constitution_path.stat()
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+        assert specmcp_core._parse_constitution_internal(path) is first
+        assert specmcp_core.constitution_cache_info()["revalidations"] == info["revalidations"] + 1
+        
+        # Same size, new content and mtime: the hash differs, so it is reparsed
+        constitution_path.write_text(constitution_path.read_text().replace("Use REST", "Use gRPC"))
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 2_000_000_000))
+        assert constitution_path.stat().st_size == stat.st_size
+        edited = specmcp_core._parse_constitution_internal(path)
+        assert edited is not first and edited["metadata"]["sha256"] != first["metadata"]["sha256"]
+        assert specmcp_core.constitution_cache_info()["misses"] == info["misses"] + 1
+        
+        assert specmcp_core.invalidate_constitution_cache(path) == 1
+        assert specmcp_core._parse_constitution_internal(path) is not edited
+        assert specmcp_core.constitution_cache_info()["misses"] == info["misses"] + 2
+        assert specmcp_core._parse_constitution_internal(path) is specmcp_core._parse_constitution_internal(path)
+
+def test_constitution_stack_merges_and_reparses_one_layer():
+    """Stacked layers accumulate principles and record sources; editing one layer reparses only it"""
+    layers = {
+        "org": "# Org\n- **Language**: Python 3.11\n- **API Style**: REST\n- Security first in every service\n",
+        "domain": "# Domain\n- **Database**: PostgreSQL\n- Security first in every service\n- Events are immutable once published\n",
+        "repo": "# Repo\n- The partner API of this service uses GraphQL\n- Security first in every service\n",
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = {}
+        for name, text in layers.items():
+            paths[name] = Path(tmp) / f"{name}.md"
+            paths[name].write_text(text)
+        stack = [str(paths[name]) for name in layers]
+        
+        merged = specmcp_core._parse_constitution_internal(stack)
+        assert merged["success"], merged
+        constitution, metadata = merged["constitution"], merged["metadata"]
+        assert constitution["tech_stack"] == {"language": "Python", "database": "PostgreSQL"}
+        assert constitution["patterns"] == {"api_style": "GraphQL"}
+        assert constitution["principles"].count("Security first in every service") == 1
+        assert {"Events are immutable once published", "The partner API of this service uses GraphQL"} <= set(constitution["principles"])
+        assert metadata["sources"] == {
+            "tech_stack.language": str(paths["org"].absolute()),
+            "tech_stack.database": str(paths["domain"].absolute()),
+            "patterns.api_style": str(paths["repo"].absolute()),
+        }
+        assert [layer["file_path"] for layer in metadata["layers"]] == [str(paths[name].absolute()) for name in layers]
+        assert specmcp_core._parse_constitution_internal(stack) is merged
+        
+        layer_cache = specmcp_core.constitution_cache_info()
+        stack_cache = specmcp_core.constitution_stack_cache_info()
+        paths["repo"].write_text(layers["repo"] + "- Every mutation is idempotent\n")
+        edited = specmcp_core._parse_constitution_internal(stack)
+        # Only the edited layer is reparsed; the others are cache hits
+        assert specmcp_core.constitution_cache_info()["misses"] == layer_cache["misses"] + 1
+        assert specmcp_core.constitution_cache_info()["hits"] == layer_cache["hits"] + 2
+        assert specmcp_core.constitution_stack_cache_info()["misses"] == stack_cache["misses"] + 1
+        assert edited is not merged and edited["metadata"]["sha256"] != metadata["sha256"]
+        assert "Every mutation is idempotent" in edited["constitution"]["principles"]
+        assert "Every mutation is idempotent" not in merged["constitution"]["principles"]
+        assert specmcp_core._parse_constitution_internal(stack) is edited
+        
+        # Dropping one layer drops it and every stack built on it
+        assert specmcp_core.invalidate_constitution_cache(str(paths["domain"])) == 2
+        assert specmcp_core._parse_constitution_internal(stack) is not edited
+        assert specmcp_core.constitution_stack_cache_info()["misses"] == stack_cache["misses"] + 2
+
+def test_compiled_rules_keyed_by_constitution_hash():
+    """Parsed constitutions key compiled rules by content hash; an edited file recompiles"""
+    with tempfile.TemporaryDirectory() as tmp:
+        constitution_path = Path(tmp) / "constitution.md"
+        constitution_path.write_text(Path(".specify/constitution.md").read_text())
+        parsed = specmcp_core._parse_constitution_internal(str(constitution_path))
+        constitution = parsed["constitution"]
+        assert specmcp_core.constitution_fingerprint(constitution) == parsed["metadata"]["sha256"]
+        
+        first = specmcp_core.compile_rules(constitution)
+        before = specmcp_core.compiled_rules_info()
+        assert specmcp_core.compile_rules(specmcp_core._parse_constitution_internal(str(constitution_path))["constitution"]) is first
+        assert specmcp_core.compiled_rules_info()["hits"] == before["hits"] + 1
+        
+        constitution_path.write_text(constitution_path.read_text() + "\n- Use GraphQL for every API\n")
+        edited = specmcp_core._parse_constitution_internal(str(constitution_path))
+        assert specmcp_core.constitution_fingerprint(edited["constitution"]) == edited["metadata"]["sha256"]
+        assert specmcp_core.compile_rules(edited["constitution"]) is not first
+    
+    # Dicts the cache never produced are still keyed by their content
+    assert specmcp_core.constitution_fingerprint({**constitution}) == specmcp_json.dumps(constitution, sort_keys=True)
+
+def test_save_spec_is_atomic_and_skips_identical_writes():
+    """A byte-identical save leaves the file and its mtime alone; a failed save leaves the old file"""
+    spec = {"openapi": "3.1.0", "info": {"title": "Saved", "version": "1.0.0"}, "paths": {}}
+    with tempfile.TemporaryDirectory() as tmp:
+        for format in ("json", "yaml"):
+            output = Path(tmp) / f"api.{format}"
+            first = specmcp_core.save_spec_to_file(spec=spec, output_path=str(output), format=format)
+            assert first["success"] and not first["unchanged"], first
+            stat = output.stat()
+            os.utime(output, ns=(stat.st_atime_ns, stat.st_mtime_ns - 1_000_000_000))
+            mtime_ns = output.stat().st_mtime_ns
+            
+            again = specmcp_core.save_spec_to_file(spec=spec, output_path=str(output), format=format)
+            assert again["success"] and again["unchanged"] and again["sha256"] == first["sha256"], again
+            assert output.stat().st_mtime_ns == mtime_ns
+        
+        # The YAML dumper fails part-way through writing the temp file
+        output = Path(tmp) / "api.yaml"
+        saved = output.read_bytes()
+        broken = {**spec, "paths": {"/health": {}}, "x-unserializable": object()}
+        failed = specmcp_core.save_spec_to_file(spec=broken, output_path=str(output), format="yaml")
+        assert not failed["success"] and "error" in failed
+        
+        # The rename fails after the temp file is complete
+        output = Path(tmp) / "api.json"
+        saved_json = output.read_bytes()
+        replace = os.replace
+        def failing_replace(src, dst) -> None:
+            raise OSError("disk full")
+        os.replace = failing_replace
+        try:
+            failed = specmcp_core.save_spec_to_file(spec={**spec, "paths": {"/health": {}}}, output_path=str(output))
+        finally:
+            os.replace = replace
+        assert not failed["success"] and "disk full" in failed["error"]
+        
+        assert (Path(tmp) / "api.yaml").read_bytes() == saved and output.read_bytes() == saved_json
+        assert sorted(path.name for path in Path(tmp).iterdir()) == ["api.json", "api.yaml"]
+
+def test_spec_store_evicts_least_recently_used():
+    """Past SPEC_STORE_MAX_BYTES the least recently used handle goes, with a clear error"""
+    def spec(name: str) -> dict:
+        return {"openapi": "3.1.0", "info": {"title": name, "version": "1.0.0"}, "paths": {}, "x-padding": "x" * 1000}
+    
+    max_bytes = specmcp_core.SPEC_STORE_MAX_BYTES
+    specmcp_core.SPEC_STORE_MAX_BYTES = 2500  # room for two of the ~1 KB specs above
+    try:
+        first = spec("First")
+        handles = {name: specmcp_core.store_spec(spec=spec(name))["spec_handle"] for name in ("First", "Second")}
+        assert specmcp_core.store_spec(spec=first)["spec_handle"] == handles["First"]
+        
+        # Stored specs are the store's own copy, and fetching refreshes them
+        first["info"]["title"] = "Edited"
+        fetched = specmcp_core.get_spec(handles["First"])
+        assert fetched["success"] and fetched["specification"] == spec("First"), fetched
+        
+        evictions = specmcp_core.spec_store_info()["evictions"]
+        handles["Third"] = specmcp_core.store_spec(spec=spec("Third"))["spec_handle"]
+        info = specmcp_core.spec_store_info()
+        assert info["evictions"] == evictions + 1 and info["bytes"] <= 2500 and info["entries"] == 2
+        
+        evicted = specmcp_core.get_spec(handles["Second"])
+        assert not evicted["success"] and evicted["error"] == f"Unknown or evicted spec handle: {handles['Second']}"
+        assert "store_spec" in evicted["suggestion"]
+        for name in ("First", "Third"):
+            assert specmcp_core.get_spec(handles[name])["specification"] == spec(name)
+        
+        # A spec larger than the whole budget is still kept, alone
+        big = specmcp_core.store_spec(spec={**spec("Big"), "x-padding": "x" * 5000})["spec_handle"]
+        assert specmcp_core.spec_store_info()["entries"] == 1
+        assert specmcp_core.get_spec(big)["specification"]["info"]["title"] == "Big"
+        assert not specmcp_core.get_spec(handles["First"])["success"]
+    finally:
+        specmcp_core.SPEC_STORE_MAX_BYTES = max_bytes
+
+def test_file_root_confines_paths():
+    """With a file root, tools refuse paths that resolve outside it, symlinks and manifests included"""
+    with tempfile.TemporaryDirectory() as tmp, tempfile.TemporaryDirectory() as elsewhere:
+        root = Path(tmp)
+        (root / "escape").symlink_to(elsewhere)
+        (root / "manifest.json").write_text(specmcp_json.dumps({
+            "services": [{"title": "Users", "requirements": "GET /users - List users", "output": "../users.json"}]
+        }))
+        specmcp_core.set_file_root(tmp)
+        try:
+            inside = specmcp_server.save_spec_to_file(spec={"openapi": "3.1.0"}, output_path=str(root / "api.json"))
+            assert inside["success"], inside
+            for output_path in (str(Path(elsewhere) / "api.json"), str(root / ".." / "api.json"), str(root / "escape" / "api.json")):
+                refused = specmcp_server.save_spec_to_file(spec={"openapi": "3.1.0"}, output_path=output_path)
+                assert not refused["success"] and "file root" in refused["error"], output_path
+            assert not list(Path(elsewhere).iterdir())
+            
+            refused = specmcp_server.verify_spec_compliance(spec_path="/etc/passwd", constitution_path=str(root / "c.md"))
+            assert not refused["success"] and "/etc/passwd" in refused["error"]
+            refused = specmcp_server.get_profile(pstats_path=str(Path(elsewhere) / "out.pstats"))
+            assert not refused["success"] and "file root" in refused["error"]
+            
+            manifest = specmcp_server.generate_from_manifest(str(root / "manifest.json"))
+            assert not manifest["success"] and "users.json" in manifest["error"]
+            (Path(elsewhere) / "other.json").write_text("{}")
+            files, errors = specmcp_core._expand_spec_paths([str(root / "escape" / "*.json"), "/etc/passwd"])
+            assert files == [] and all("file root" in error["error"] for error in errors)
+        finally:
+            specmcp_core.set_file_root(None)
+
+def test_compressed_and_yaml_specs_verify_alike():
+    """YAML, .json.gz and .yaml.zst copies of a spec score as the JSON does; corrupt archives are errors"""
+    import gzip
+    import yaml
+    import zstandard
+    
+    generated = specmcp_core.generate_openapi_spec(
+        "- GET /users - List users (requires authentication)\n- POST /users - Create a user",
+        ".specify/constitution.md"
+    )
+    spec = generated["specification"]
+    constitution = specmcp_core._parse_constitution_internal(".specify/constitution.md")["constitution"]
+    data = specmcp_json.dumpb(spec, indent=2)
+    yaml_data = yaml.safe_dump(spec, sort_keys=False).encode()
+    gzipped = gzip.compress(data)
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        files = {
+            "api.json": data,
+            "api.yaml": yaml_data,
+            "api.json.gz": gzipped,
+            "api.yaml.zst": zstandard.ZstdCompressor().compress(yaml_data),
+        }
+        for name, content in files.items():
+            (Path(tmp) / name).write_bytes(content)
+        
+        expected = specmcp_core.verify_spec_compliance(spec_path=str(Path(tmp) / "api.json"))
+        assert expected["success"], expected
+        for name in files:
+            path = str(Path(tmp) / name)
+            for result in (specmcp_core.verify_spec_compliance(spec_path=path), specmcp_core._verify_spec_file(path, constitution)):
+                assert result["success"], (name, result)
+                assert result["compliance_score"] == expected["compliance_score"], name
+                assert result["violations"] == expected["violations"], name
+            assert specmcp_core.store_spec(spec_path=path)["spec_handle"] == generated["spec_handle"], name
+        
+        corrupt = {
+            "truncated.json.gz": gzipped[:len(gzipped) // 2],
+            "garbled.json.gz": gzipped[:12] + bytes(byte ^ 0x55 for byte in gzipped[12:-8]) + gzipped[-8:],
+            "header.json.gz": b"\x1f\x8b not really gzip",
+            "garbled.yaml.zst": files["api.yaml.zst"][:8] + bytes(byte ^ 0x55 for byte in files["api.yaml.zst"][8:]),
+        }
+        for name, content in corrupt.items():
+            path = Path(tmp) / name
+            path.write_bytes(content)
+            for result in (
+                specmcp_core.verify_spec_compliance(spec_path=str(path)),
+                specmcp_core._verify_spec_file(str(path), constitution),
+                specmcp_core.store_spec(spec_path=str(path)),
+            ):
+                assert not result["success"] and result["error"], (name, result)
+
+def test_json_keeps_integers_beyond_64_bits():
+    """Integers orjson would turn into floats parse and serialize exactly"""
+    text = '{"maximum": 18446744073709551616, "minimum": -9223372036854775809, "limit": 18446744073709551615, "ratio": 0.5}'
+    for data in (text, text.encode()):
+        parsed = specmcp_json.loads(data)
+        assert parsed == {"maximum": 2**64, "minimum": -2**63 - 1, "limit": 2**64 - 1, "ratio": 0.5}
+        assert all(type(parsed[key]) is int for key in ("maximum", "minimum", "limit"))
+    assert specmcp_json.dumps(parsed) == text.replace(", ", ",").replace(": ", ":")
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        spec_path = Path(tmp) / "spec.json"
+        spec_path.write_text('{"components": {"schemas": {"Id": {"type": "integer", "maximum": 99999999999999999999}}}}')
+        spec, _ = specmcp_core.read_spec_file(str(spec_path))
+    assert spec["components"]["schemas"]["Id"]["maximum"] == 99999999999999999999
+
+def test_cancelled_queued_call_releases_admission():
+    """A call cancelled while it waits for its tool slot doesn't stay counted in flight"""
+    async def held_tool(release: asyncio.Event) -> dict:
+        await release.wait()
+        return {"success": True}
+    
+    tool = specmcp_server.admitted(held_tool)
+    
+    async def scenario() -> None:
+        release = asyncio.Event()
+        running = asyncio.ensure_future(tool(release))
+        await asyncio.sleep(0)
+        queued = asyncio.ensure_future(tool(release))
+        await asyncio.sleep(0.01)
+        assert specmcp_server.admission_info()["in_flight"] == before + 2
+        queued.cancel()
+        await asyncio.gather(queued, return_exceptions=True)
+        assert specmcp_server.admission_info()["in_flight"] == before + 1
+        release.set()
+        assert (await running)["success"]
+        await asyncio.sleep(0)
+    
+    before = specmcp_server.admission_info()["in_flight"]
+    specmcp_server.TOOL_CONCURRENCY["held_tool"] = 1
+    try:
+        asyncio.run(scenario())
+    finally:
+        del specmcp_server.TOOL_CONCURRENCY["held_tool"]
+    assert specmcp_server.admission_info()["in_flight"] == before
+
+def test_cli_verify_exit_codes_and_cache():
+    """The CLI fails builds below --min-score or on unparsable specs, and caches verdicts per constitution and rule set"""
+    def verify(*argv: str) -> tuple:
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            status = specmcp_cli.main(["verify", *argv, "-c", str(constitution_path), "-j", "1", "--cache-dir", cache_dir, "--json"])
+        report = specmcp_json.loads(output.getvalue())
+        return status, report
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        constitution_path = Path(tmp) / "constitution.md"
+        constitution_path.write_text(Path(".specify/constitution.md").read_text())
+        cache_dir = str(Path(tmp) / ".specmcp_cache")
+        good = Path(tmp) / "good.json"
+        generated = specmcp_core.generate_openapi_spec("- GET /users - List users (requires authentication)", str(constitution_path))
+        good.write_text(specmcp_json.dumps(generated["specification"]))
+        broken = Path(tmp) / "broken.json"
+        broken.write_text('{"openapi": "3.1.0", "paths": ')
+        
+        status, report = verify(str(good), "--min-score", "0")
+        assert status == 0 and (report["passed"], report["failed"]) == (1, 0), report
+        score = report["results"][0]["compliance_score"]
+        assert report["results"][0]["cached"] is False
+        
+        status, report = verify(str(good), "--min-score", str(score))
+        assert status == 0 and report["results"][0]["cached"] is True
+        assert report["results"][0]["compliance_score"] == score
+        
+        status, report = verify(str(good), "--min-score", str(score + 1))
+        assert status == 1 and report["failed"] == 1 and report["min_score"] == score + 1
+        
+        status, report = verify(str(broken), "--min-score", "0")
+        assert status == 1 and not report["results"][0]["success"] and report["results"][0]["error"]
+        
+        # A rule set bump or an edited constitution invalidates every cached verdict
+        ruleset_version = specmcp_cli.RULESET_VERSION
+        specmcp_cli.RULESET_VERSION = ruleset_version + "-test"
+        try:
+            status, report = verify(str(good), "--min-score", "0")
+        finally:
+            specmcp_cli.RULESET_VERSION = ruleset_version
+        assert status == 0 and report["results"][0]["cached"] is False
+        
+        constitution_path.write_text(constitution_path.read_text() + "\n- Document every endpoint\n")
+        status, report = verify(str(good), "--min-score", "0")
+        assert status == 0 and report["results"][0]["cached"] is False
+        status, report = verify(str(good), "--min-score", "0")
+        assert report["results"][0]["cached"] is True
+
+def test_server_metrics_count_calls_and_cache_hits():
+    """Tool, rule and cache counters move with known calls, and the textfile is valid Prometheus text"""
+    def calls(snapshot: dict, kind: str, name: str, field: str = "calls") -> int:
+        return snapshot[kind].get(name, {}).get(field, 0)
+    
+    spec = {"openapi": "3.1.0", "info": {"title": "Metrics", "version": "1.0.0"}, "paths": {}}
+    requirements = "- GET /metrics-test - Read the metrics test"
+    specmcp_server.generate_openapi_spec(requirements, ".specify/constitution.md", include_spec=False)
+    before = specmcp_server.metrics_snapshot()
+    
+    verified = specmcp_server.verify_spec_compliance(spec=spec)
+    specmcp_server.verify_spec_compliance(spec=spec)
+    assert not specmcp_server.get_spec("spec:missing")["success"]
+    specmcp_server.generate_openapi_spec(requirements, ".specify/constitution.md", include_spec=False)
+    after = specmcp_server.metrics_snapshot()
+    
+    assert calls(after, "tools", "verify_spec_compliance") == calls(before, "tools", "verify_spec_compliance") + 2
+    assert calls(after, "tools", "get_spec", "errors") == calls(before, "tools", "get_spec", "errors") + 1
+    rules = [violation["rule"] for violation in verified["violations"]] + verified["passed_rules"]
+    for rule in rules:
+        assert calls(after, "rules", rule) == calls(before, "rules", rule) + 2, rule
+    assert calls(after, "rules", "Health Endpoint Required", "violations") == calls(before, "rules", "Health Endpoint Required", "violations") + 2
+    assert after["caches"]["generation"]["hits"] == before["caches"]["generation"]["hits"] + 1
+    assert after["caches"]["constitution"]["hits"] > before["caches"]["constitution"]["hits"]
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        textfile = Path(tmp) / "specmcp.prom"
+        result = specmcp_server.get_server_metrics(prometheus_path=str(textfile))
+        assert result["success"] and result["prometheus_path"] == str(textfile.absolute()), result
+        text = textfile.read_text()
+    
+    sample = re.compile(r'^(specmcp_[a-z_]+)(?:\{((?:[a-z]+="(?:[^"\\]|\\.)*",?)*)\})? (\S+)$')
+    declared = {}
+    histograms = {}
+    for line in text.splitlines():
+        if line.startswith("# HELP "):
+            continue
+        if line.startswith("# TYPE "):
+            _, _, metric, kind = line.split(" ")
+            assert metric not in declared and kind in ("counter", "gauge", "histogram"), line
+            declared[metric] = kind
+            continue
+        match = sample.match(line)
+        assert match, f"Not a Prometheus sample: {line!r}"
+        metric, labels, value = match.groups()
+        float(value)
+        family = re.sub(r"_(bucket|sum|count)$", "", metric) if metric not in declared else metric
+        assert family in declared, f"{metric} has no # TYPE line before it"
+        if metric.endswith("_bucket"):
+            series = histograms.setdefault((family, re.sub(r',le="[^"]*"', "", labels)), [])
+            series.append(int(value))
+        if metric.endswith("_count") and declared[family] == "histogram":
+            assert histograms[(family, labels)][-1] == int(value), line
+    
+    assert histograms and all(buckets == sorted(buckets) for buckets in histograms.values()), "Histogram buckets must be cumulative"
+    tool_calls = after["tools"]["verify_spec_compliance"]["calls"]
+    assert f'specmcp_tool_calls_total{{tool="verify_spec_compliance"}} {tool_calls}' in text.splitlines()
+    assert text.endswith("\n")
+
+def test_profiling_session_reports_profiled_tools():
+    """start_profiling(calls=N) profiles exactly N tool calls, then get_profile reports it complete"""
+    import pstats
+    
+    spec = {"openapi": "3.1.0", "info": {"title": "Profiled", "version": "1.0.0"}, "paths": {}}
+    assert specmcp_server.start_profiling(calls=2)["success"]
+    try:
+        running = specmcp_server.get_profile()
+        assert running["status"] == "running" and running["calls_remaining"] == 2 and running["tools"] == {}
+        
+        for _ in range(3):
+            specmcp_server.verify_spec_compliance(spec=spec)
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            pstats_path = Path(tmp) / "calls.pstats"
+            profile = specmcp_server.get_profile(top=10, pstats_path=str(pstats_path))
+            assert profile["success"] and profile["status"] == "complete", profile
+            assert profile["tools"] == {"verify_spec_compliance": 2} and profile["profiled_calls"] == 2
+            assert profile["calls_remaining"] == 0 and len(profile["functions"]) == 10
+            assert profile["total_seconds"] > 0
+            assert any(row["file"].endswith("specmcp_core.py") for row in profile["functions"])
+            stats = pstats.Stats(str(pstats_path))
+            assert stats.total_calls > 0
+    finally:
+        specmcp_server.get_profile(stop=True)
+    assert not specmcp_server.get_profile()["success"]
+
 if __name__ == "__main__":
-    asyncio.run(test_specmcp())
\ No newline at end of file
+    asyncio.run(test_specmcp())
+    for name, check in list(globals().items()):
+        if name.startswith("test_") and not asyncio.iscoroutinefunction(check):
+            check()
+            print(f"✅ {name}")
\ No newline at end of file
@@ -3,8 +3,157 @@
 Verify OpenAPI specification compliance with constitution
 """
 
-import json
 from pathlib import Path
+from typing import Optional
+
+import specmcp_json
+from specmcp_core import (
+    _parse_constitution_internal,
+    compile_rules,
+    register_rule,
+    run_rules,
+    spec_contains
+)
+
+# Rules specific to the authentication API; they run after the default
+# constitution rules in the same compiled pipeline as verify_spec_compliance
+RULE_SETS = ("default", "auth-complete")
+
+REQUIRED_ENDPOINTS = [
+    "/auth/register",
+    "/auth/login",
+    "/auth/logout",
+    "/auth/me",
+    "/auth/forgot-password",
+    "/auth/reset-password"
+]
+PROTECTED_ENDPOINTS = ["/auth/logout", "/auth/me"]
+REQUIRED_SCHEMAS = ["User", "RegisterRequest", "LoginRequest", "LoginResponse"]
+ERROR_CODES = {"400", "401", "403", "404", "500"}
+
+@register_rule("OpenAPI Version", severity="error", rule_sets=("auth-complete",))
+def _rule_openapi_version(constitution: dict):
+    def check(spec: dict, spec_text: Optional[str]) -> list:
+        if spec.get("openapi") == "3.1.0":
+            return []
+        return [{
+            "message": f"Expected OpenAPI 3.1.0, got {spec.get('openapi')}",
+            "suggestion": "Update openapi field to 3.1.0"
+        }]
+    return check
+
+@register_rule("JWT Configuration", severity="error", rule_sets=("auth-complete",))
+def _rule_jwt_configuration(constitution: dict):
+    if constitution.get("patterns", {}).get("auth") != "JWT":
+        return None
+    
+    def check(spec: dict, spec_text: Optional[str]) -> list:
+        security_schemes = spec.get("components", {}).get("securitySchemes")
+        if security_schemes is None:
+            return []  # Reported by "Authentication Required"
+        bearer = security_schemes.get("bearerAuth")
+        if bearer is None:
+            return [{
+                "message": "JWT authentication scheme not found",
+                "suggestion": "Add bearerAuth to components.securitySchemes"
+            }]
+        if bearer.get("scheme") != "bearer" or bearer.get("bearerFormat") != "JWT":
+            return [{
+                "message": "JWT Bearer authentication not properly configured",
+                "suggestion": "Ensure bearerAuth has scheme='bearer' and bearerFormat='JWT'"
+            }]
+        return []
+    return check
+
+@register_rule("Required Endpoints", severity="error", rule_sets=("auth-complete",))
+def _rule_required_endpoints(constitution: dict):
+    def check(spec: dict, spec_text: Optional[str]) -> list:
+        paths = spec.get("paths", {})
+        missing_endpoints = [ep for ep in REQUIRED_ENDPOINTS if ep not in paths]
+        if not missing_endpoints:
+            return []
+        return [{
+            "message": f"Missing endpoints: {', '.join(missing_endpoints)}",
+            "suggestion": f"Add missing endpoints: {', '.join(missing_endpoints)}"
+        }]
+    return check
+
+@register_rule("Authentication Enforcement", severity="warning", rule_sets=("auth-complete",), visits=("operation",))
+def _rule_authentication_enforcement(constitution: dict):
+    protected = set(PROTECTED_ENDPOINTS)
+    
+    def on_operation(operation: dict, pointer: str, context: dict) -> Optional[str]:
+        if context["path"] in protected and context["method"] in ["get", "post", "put", "delete"]:
+            if "security" not in operation:
+                return f"{context['path']} {context['method'].upper()}"
+        return None
+    
+    def finish(spec: dict, spec_text: Optional[str], unprotected: list) -> list:
+        if not unprotected:
+            return []
+        return [{
+            "message": f"Endpoints not requiring auth: {', '.join(unprotected)}",
+            "suggestion": "Add security requirement to protected endpoints"
+        }]
+    return {"operation": on_operation, "finish": finish}
+
+@register_rule("Error Handling", severity="warning", rule_sets=("auth-complete",), visits=("response",))
+def _rule_error_handling(constitution: dict):
+    violation = {
+        "message": "Incomplete error response definitions",
+        "suggestion": "Add error response schemas and include HTTP error codes"
+    }
+    
+    def on_response(response: dict, pointer: str, context: dict) -> Optional[str]:
+        return context["status"] if context["status"] in ERROR_CODES else None
+    
+    def finish(spec: dict, spec_text: Optional[str], error_codes_found: list) -> list:
+        has_error_schemas = "Error" in spec.get("components", {}).get("schemas", {})
+        return [] if has_error_schemas and error_codes_found else [violation]
+    return {"response": on_response, "finish": finish}
+
+@register_rule("Schema Documentation", severity="warning", rule_sets=("auth-complete",))
+def _rule_schema_documentation(constitution: dict):
+    def check(spec: dict, spec_text: Optional[str]) -> list:
+        schemas = spec.get("components", {}).get("schemas", {})
+        missing_schemas = [s for s in REQUIRED_SCHEMAS if s not in schemas]
+        if not missing_schemas:
+            return []
+        return [{
+            "message": f"Missing schemas: {', '.join(missing_schemas)}",
+            "suggestion": f"Add missing schemas: {', '.join(missing_schemas)}"
+        }]
+    return check
+
+@register_rule("API Versioning", severity="info", rule_sets=("auth-complete",))
+def _rule_api_versioning(constitution: dict):
+    # From constitution: API versioning required
+    def check(spec: dict, spec_text: Optional[str]) -> list:
+        title = spec.get("info", {}).get("title", "")
+        if "api" in title.lower() or spec_contains(spec, spec_text, "v1"):
+            return []
+        return [{
+            "message": "No API version found in title or spec",
+            "suggestion": "Include a version (e.g. v1) in the API title or paths"
+        }]
+    return check
+
+@register_rule("Schema Types", severity="info", rule_sets=("auth-complete",), visits=("schema",))
+def _rule_schema_types(constitution: dict):
+    def on_schema(schema: dict, pointer: str, context: dict) -> Optional[str]:
+        if context["location"] != "component":
+            return None
+        if not ("type" in schema or "$ref" in schema or "properties" in schema):
+            return pointer
+        return None
+    
+    def finish(spec: dict, spec_text: Optional[str], untyped: list) -> list:
+        return [{
+            "message": f"Schema without type definition: {pointer}",
+            "suggestion": "Add a type, properties or $ref to every schema",
+            "pointer": pointer
+        } for pointer in untyped]
+    return {"schema": on_schema, "finish": finish}
 
 def verify_compliance():
     """Verify the generated spec against constitution requirements"""
@@ -18,158 +167,24 @@ def verify_compliance():
         print(f"❌ Specification file not found: {spec_path}")
         return
     
-    spec = json.loads(spec_path.read_text())
+    spec_content = spec_path.read_text()
+    spec = specmcp_json.loads(spec_content)
     
     # Load the constitution
     const_path = Path(".specify/constitution.md")
-    if not const_path.exists():
-        print(f"❌ Constitution file not found: {const_path}")
+    constitution_result = _parse_constitution_internal(str(const_path))
+    if not constitution_result.get("success"):
+        print(f"❌ {constitution_result.get('error')}")
         return
     
-    constitution = const_path.read_text()
-    
-    violations = []
-    checks_passed = []
+    report = run_rules(spec, spec_content, compile_rules(constitution_result["constitution"], RULE_SETS))
+    violations = report["violations"]
+    checks_passed = [f"✅ {name}" for name in report["passed_rules"]]
+    score = report["compliance_score"]
     
-    # Check 1: OpenAPI 3.1.0 format
-    if spec.get("openapi") == "3.1.0":
-        checks_passed.append("✅ OpenAPI 3.1.0 format")
-    else:
-        violations.append({
-            "rule": "OpenAPI Version",
-            "severity": "error",
-            "message": f"Expected OpenAPI 3.1.0, got {spec.get('openapi')}",
-            "suggestion": "Update openapi field to 3.1.0"
-        })
-    
-    # Check 2: JWT authentication configured
-    security_schemes = spec.get("components", {}).get("securitySchemes", {})
-    if "bearerAuth" in security_schemes:
-        bearer = security_schemes["bearerAuth"]
-        if bearer.get("scheme") == "bearer" and bearer.get("bearerFormat") == "JWT":
-            checks_passed.append("✅ JWT Bearer authentication configured")
-        else:
-            violations.append({
-                "rule": "JWT Configuration",
-                "severity": "error",
-                "message": "JWT Bearer authentication not properly configured",
-                "suggestion": "Ensure bearerAuth has scheme='bearer' and bearerFormat='JWT'"
-            })
-    else:
-        violations.append({
-            "rule": "Authentication Required",
-            "severity": "error",
-            "message": "JWT authentication scheme not found",
-            "suggestion": "Add bearerAuth to components.securitySchemes"
-        })
-    
-    # Check 3: Health endpoint exists
     paths = spec.get("paths", {})
-    if "/health" in paths:
-        checks_passed.append("✅ Health endpoint present")
-    else:
-        violations.append({
-            "rule": "Health Endpoint Required",
-            "severity": "warning",
-            "message": "Health endpoint not found",
-            "suggestion": "Add GET /health endpoint"
-        })
-    
-    # Check 4: All required authentication endpoints
-    required_endpoints = [
-        "/auth/register",
-        "/auth/login",
-        "/auth/logout",
-        "/auth/me",
-        "/auth/forgot-password",
-        "/auth/reset-password"
-    ]
-    
-    missing_endpoints = [ep for ep in required_endpoints if ep not in paths]
-    if not missing_endpoints:
-        checks_passed.append(f"✅ All {len(required_endpoints)} authentication endpoints present")
-    else:
-        violations.append({
-            "rule": "Required Endpoints",
-            "severity": "error",
-            "message": f"Missing endpoints: {', '.join(missing_endpoints)}",
-            "suggestion": f"Add missing endpoints: {', '.join(missing_endpoints)}"
-        })
-    
-    # Check 5: Protected endpoints have security
-    protected_endpoints = ["/auth/logout", "/auth/me"]
-    unprotected = []
-    for endpoint in protected_endpoints:
-        if endpoint in paths:
-            for method in paths[endpoint]:
-                if method in ["get", "post", "put", "delete"]:
-                    if "security" not in paths[endpoint][method]:
-                        unprotected.append(f"{endpoint} {method.upper()}")
-    
-    if not unprotected:
-        checks_passed.append("✅ Protected endpoints require authentication")
-    else:
-        violations.append({
-            "rule": "Authentication Enforcement",
-            "severity": "warning",
-            "message": f"Endpoints not requiring auth: {', '.join(unprotected)}",
-            "suggestion": "Add security requirement to protected endpoints"
-        })
-    
-    # Check 6: Error responses defined
-    has_error_schemas = "Error" in spec.get("components", {}).get("schemas", {})
-    error_codes_found = set()
-    for path_item in paths.values():
-        for operation in path_item.values():
-            if isinstance(operation, dict) and "responses" in operation:
-                error_codes_found.update([
-                    code for code in operation["responses"].keys()
-                    if code in ["400", "401", "403", "404", "500"]
-                ])
-    
-    if has_error_schemas and error_codes_found:
-        checks_passed.append(f"✅ Error responses defined ({len(error_codes_found)} error types)")
-    else:
-        violations.append({
-            "rule": "Error Handling",
-            "severity": "warning",
-            "message": "Incomplete error response definitions",
-            "suggestion": "Add error response schemas and include HTTP error codes"
-        })
-    
-    # Check 7: Request/Response schemas
     schemas = spec.get("components", {}).get("schemas", {})
-    required_schemas = ["User", "RegisterRequest", "LoginRequest", "LoginResponse"]
-    missing_schemas = [s for s in required_schemas if s not in schemas]
-    
-    if not missing_schemas:
-        checks_passed.append(f"✅ Request/Response schemas defined ({len(schemas)} schemas total)")
-    else:
-        violations.append({
-            "rule": "Schema Documentation",
-            "severity": "warning",
-            "message": f"Missing schemas: {', '.join(missing_schemas)}",
-            "suggestion": f"Add missing schemas: {', '.join(missing_schemas)}"
-        })
-    
-    # Check 8: API versioning (from constitution: API versioning required)
-    title = spec.get("info", {}).get("title", "")
-    if "api" in title.lower() or "v1" in str(spec):
-        checks_passed.append("✅ API versioning considered")
-    
-    # Check 9: Type definitions in schemas
-    if schemas:
-        all_have_types = all(
-            "type" in schema or "$ref" in schema or "properties" in schema
-            for schema in schemas.values()
-        )
-        if all_have_types:
-            checks_passed.append("✅ All schemas have type definitions")
-    
-    # Calculate compliance score
-    max_score = 100
-    deductions = sum(20 if v["severity"] == "error" else 10 for v in violations)
-    score = max(0, max_score - deductions)
+    security_schemes = spec.get("components", {}).get("securitySchemes", {})
     
     # Print results
     print("\n📊 COMPLIANCE CHECK RESULTS")